@@ -1,9 +1,11 @@
 from datetime import datetime
 
 from positions import Position
-from market_data import get_price, get_currency, get_fx_rate
+from market_data import get_quotes, get_fx_rate, get_split_data, get_provider, set_provider, MarketDataError
+from market_cache import CachingProvider
 
 from file_import import ingest_trading212_csv, _main as import_main
+from ledger import update_ledger
 
 def d(s: str):
     return datetime.strptime(s, "%d/%m/%Y")
@@ -51,6 +53,33 @@ def dev_build_pos():
     return positions
 
 
+def dev_build_from_csv(path: str, checkpoint: str = "ledger.ckpt"):
+    """
+    Positions from a Trading212 export, on top of the last checkpoint.
+    """
+    ledger, stats = update_ledger(checkpoint, [path], split_source=get_split_data)
+    print(
+        f"Imported {path}: {stats.applied} new trades, {stats.duplicates} already seen, "
+        f"{stats.splits} splits, {len(ledger.positions)} tickers"
+    )
+    return ledger.positions
+
+
+def dev_cgt_report(path: str, checkpoint: str = "ledger.ckpt", out: str = "cgt_report.csv"):
+    """
+    CGT totals per tax year / payment period for a Trading212 export.
+    """
+    ledger, _ = update_ledger(checkpoint, [path], split_source=get_split_data)
+    report = ledger.cgt_report()
+    report.to_csv(out)
+    for s in report.summaries():
+        print(
+            f"{s.year}: net {s.totals.net_eur:,.2f} EUR, chargeable {s.chargeable_eur:,.2f}, "
+            f"tax {s.tax_eur:,.2f} (15 Dec {s.tax_initial_eur:,.2f} / 31 Jan {s.tax_later_eur:,.2f})"
+        )
+    return report
+
+
 def print_sale_details(position: Position):
     """
     Print all sales for a given Position in the column layout you like.
@@ -86,10 +115,18 @@ def dev_test():
 
     
   # after your sell
-    current_price = get_price("NVDA")
+    # price and currency in one lookup rather than two
+    quotes = get_quotes(["NVDA"])
+    if "NVDA" in quotes.errors:
+        raise quotes.errors["NVDA"]
+    quote = quotes.quotes["NVDA"]
+    if quote.currency is None:
+        raise MarketDataError("No currency info for NVDA")
+
+    current_price = quote.price
     print(f"\nCurrent NVDA price: ${current_price:.2f}")
 
-    currency = get_currency("NVDA")
+    currency = quote.currency
     print(f"NVDA trades in: {currency}")
 
     get_fx = get_fx_rate(currency, "EUR")
@@ -115,6 +152,7 @@ def dev_test():
 
 def main():
     
+    set_provider(CachingProvider(get_provider()))
 
     dev_test()
 
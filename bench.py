@@ -0,0 +1,751 @@
+# dev benchmarks, run by hand: python bench.py <name> [n]
+
+import csv
+from array import array
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import tracemalloc
+
+from database_main import TradeStore
+from file_import import (
+    _FIELDS, _FLOAT, HEADERS, TimeParser, _build_row, _iter_rows, _open_reader, _parse_time,
+    _to_float, _to_str, ingest_trading212_csv, iter_trading212_csv, iter_trading212_files,
+)
+from import_cache import ImportCache
+from ledger import Ledger
+from portfolio import Portfolio
+from positions import Position
+from snapshot import Snapshot, load_snapshot, save_snapshot
+from trade_table import TradeTable
+
+
+_ACTIONS = ["Market buy", "Limit buy", "Market sell", "Limit sell", "Deposit", "Dividend (Dividend)"]
+_TICKERS = ["NVDA", "AAPL", "MSFT", "AMD", "TSLA", "VUSA", "META", "GOOGL"]
+
+
+def _write_synthetic_csv(path: str, n: int, time_format: str = "%Y-%m-%d %H:%M:%S", seed: int = 1):
+    """
+    Write an n-row file shaped like a Trading212 export.
+    """
+    rnd = random.Random(seed)
+    base = 1_577_836_800  # 2020-01-01
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(HEADERS)
+        for i in range(n):
+            t = time.gmtime(base + rnd.randrange(6 * 365 * 86400))
+            ticker = rnd.choice(_TICKERS)
+            w.writerow([
+                rnd.choice(_ACTIONS),
+                time.strftime(time_format, t),
+                f"US000{ticker}",
+                ticker,
+                f"{ticker} Inc",
+                "",
+                f"EOF{i}",
+                f"{rnd.uniform(0.001, 5):.7f}",
+                f"{rnd.uniform(10, 900):.2f}",
+                "USD",
+                f"{rnd.uniform(1.0, 1.2):.5f}",
+                "",
+                "EUR",
+                f"{rnd.uniform(1, 2500):,.2f}",
+                "EUR",
+                "",
+                "",
+            ])
+
+
+def _rate(n: int, seconds: float) -> str:
+    return f"{n / seconds:,.0f} rows/s ({seconds:.2f}s)"
+
+
+def bench_parse_time(n: int = 1_000_000):
+    """
+    Time column of a synthetic n-row export: strptime loop vs TimeParser.
+    """
+    for fmt in ("%d/%m/%Y %H:%M", "%Y-%m-%d %H:%M:%S"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "synthetic.csv")
+            _write_synthetic_csv(path, n, time_format=fmt)
+            with open(path, encoding="utf-8", newline="") as f:
+                times = [r["Time"] for r in csv.DictReader(f)]
+
+        t0 = time.perf_counter()
+        slow = [_parse_time(s) for s in times]
+        t_slow = time.perf_counter() - t0
+
+        parser = TimeParser()
+        t0 = time.perf_counter()
+        fast = [parser(s) for s in times]
+        t_fast = time.perf_counter() - t0
+
+        assert slow == fast
+        print(f"\n=== _parse_time {fmt!r}, {n:,} rows ===")
+        print(f"strptime loop: {_rate(n, t_slow)}")
+        print(f"TimeParser:    {_rate(n, t_fast)}  fast={parser.fast_hits:,} fallback={parser.fallbacks:,}")
+        print(f"speedup:       {t_slow / t_fast:.1f}x")
+
+
+def _traced(fn):
+    """
+    Run fn, return (result, bytes still allocated by it).
+    """
+    tracemalloc.start()
+    try:
+        result = fn()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+def bench_columns(n: int = 200_000):
+    """
+    List of dict rows vs TradeTable: memory held and a ticker+type filter sum.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.csv")
+        _write_synthetic_csv(path, n)
+        rows, mem_rows = _traced(lambda: list(iter_trading212_csv(path)))
+        table, mem_table = _traced(lambda: TradeTable.from_rows(rows))
+
+    t0 = time.perf_counter()
+    a = sum(r["total"] for r in rows if r["ticker"] == "NVDA" and r["action_type"] == "BUY")
+    t_rows = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    b = table.sum("total", table.where("action_type", "BUY", table.where("ticker", "NVDA")))
+    t_table = time.perf_counter() - t0
+
+    assert abs(a - b) < 1e-6 * max(1.0, abs(a))
+    print(f"\n=== columnar ingest, {len(rows):,} trade rows ===")
+    print(f"dict rows:  {mem_rows / 1e6:8.1f} MB  filter+sum {t_rows * 1000:.1f} ms")
+    print(f"TradeTable: {mem_table / 1e6:8.1f} MB  filter+sum {t_table * 1000:.1f} ms")
+
+
+def _fill_position(pos: Position, n: int, seed: int = 1):
+    rnd = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    for i in range(n):
+        qty = rnd.uniform(0.0001, 0.05)
+        pos.add_buy(f"B{i}", start + timedelta(minutes=i), qty, 100.0, 1.1, qty * 90.0)
+
+
+def bench_lots(n: int = 100_000):
+    """
+    Memory held by n lots: list of LotRow vs LotTable.
+    """
+    print(f"\n=== lot storage, {n:,} lots ===")
+    for compact in (False, True):
+        def build():
+            pos = Position("BENCH", compact=compact)
+            _fill_position(pos, n)
+            return pos
+
+        pos, mem = _traced(build)
+        label = "LotTable" if compact else "list[LotRow]"
+        print(f"{label:13s} {mem / 1e6:7.1f} MB  ({mem / n:.0f} B/lot, {mem * 100_000 / n / 1e6:.1f} MB per 100k)")
+
+
+class _ScanFromStart(Position):
+    """
+    Old behaviour: every sale walks the lots from index 0.
+    """
+
+    def sell(self, date, qty, proceeds_eur):
+        self._head = 0
+        return super().sell(date, qty, proceeds_eur)
+
+
+def _replay_fifo(cls, buys: int, sells: int) -> float:
+    pos = cls("BENCH")
+    start = datetime(2020, 1, 1)
+    for i in range(buys):
+        pos.add_buy(f"B{i}", start + timedelta(minutes=i), 0.01, 100.0, 1.1, 0.9)
+
+    # together the sales use ~95% of the shares, a couple of lots each
+    qty = 0.01 * buys * 0.95 / sells
+    t0 = time.perf_counter()
+    for i in range(sells):
+        pos.sell(start + timedelta(days=365, minutes=i), qty, qty * 120.0)
+    return time.perf_counter() - t0
+
+
+def bench_fifo(n: int = 100_000, legacy_cap: int = 25_000):
+    """
+    Replay n buys and n/2 sells on one symbol with the FIFO head vs a scan
+    from lot 0 per sale. The scan is quadratic, so it's capped at legacy_cap buys.
+    """
+    print(f"\n=== FIFO sells, buys:sells = 2:1 ===")
+    size = max(1, n // 8)
+    while size <= n:
+        t_new = _replay_fifo(Position, size, size // 2)
+        line = f"{size:>8,} buys  head: {t_new:7.3f}s"
+        if size <= legacy_cap:
+            t_old = _replay_fifo(_ScanFromStart, size, size // 2)
+            line += f"  scan: {t_old:7.3f}s  ({t_old / t_new:.0f}x)"
+        print(line)
+        size *= 2
+
+
+def bench_revalue(n: int = 10_000, ticks: int = 20):
+    """
+    Revalue n positions per tick: unrealised_* per position vs Portfolio.revalue.
+    """
+    rnd = random.Random(1)
+    positions = []
+    currencies = {}
+    for i in range(n):
+        pos = Position(f"S{i}")
+        _fill_position(pos, 3, seed=i)
+        positions.append(pos)
+        currencies[pos.symbol] = rnd.choice(["USD", "EUR", "GBp"])
+    book = Portfolio.from_positions(positions, currencies)
+    fx = {"USD": 0.86, "GBP": 1.17}
+    price_ticks = [[rnd.uniform(10, 500) for _ in range(n)] for _ in range(ticks)]
+
+    t0 = time.perf_counter()
+    for prices in price_ticks:
+        total = 0.0
+        for pos, px in zip(positions, prices):
+            ccy = currencies[pos.symbol]
+            rate = 1.0 if ccy == "EUR" else fx["GBP"] / 100 if ccy == "GBp" else fx[ccy]
+            total += pos.unrealised_value(px, rate)
+            pos.unrealised_profit(px, rate)
+            pos.unrealised_roi_pct(px, rate)
+    t_loop = (time.perf_counter() - t0) / ticks
+
+    t0 = time.perf_counter()
+    for prices in price_ticks:
+        val = book.revalue(prices, fx)
+    t_book = (time.perf_counter() - t0) / ticks
+
+    assert abs(val.total_value_eur - total) < 1e-6 * total
+    print(f"\n=== revalue {n:,} positions, per tick ===")
+    print(f"per position: {t_loop * 1000:7.2f} ms")
+    print(f"Portfolio:    {t_book * 1000:7.2f} ms  ({t_loop / t_book:.1f}x)")
+
+
+def _synthetic_trades(n: int, tickers: int = 64, seed: int = 1) -> list[dict]:
+    """
+    n time-ordered typed BUY/SELL rows that never sell more than is held.
+    """
+    rnd = random.Random(seed)
+    held = [0.0] * tickers
+    t = datetime(2015, 1, 1)
+    rows = []
+    for i in range(n):
+        t += timedelta(seconds=rnd.randint(1, 3600))
+        k = rnd.randrange(tickers)
+        price = rnd.uniform(10, 500)
+        if held[k] > 0.05 and rnd.random() < 0.35:
+            action, qty = "SELL", rnd.uniform(0.001, held[k] * 0.5)
+            held[k] -= qty
+        else:
+            action, qty = "BUY", rnd.uniform(0.01, 2)
+            held[k] += qty
+        rows.append({
+            "action_type": action, "id": f"EOF{i}", "time": t, "ticker": f"T{k}",
+            "shares": qty, "price_per_share": price, "exchange_rate": 1.1, "total": qty * price / 1.1,
+        })
+    return rows
+
+
+def bench_replay(n: int = 400_000, tickers: int = 64):
+    """
+    Serial Ledger replay vs per-ticker process pool, 2..cpu_count workers.
+    """
+    rows = _synthetic_trades(n, tickers)
+
+    t0 = time.perf_counter()
+    serial = Ledger()
+    serial.import_rows(rows)
+    t_serial = time.perf_counter() - t0
+    expected = {t: pickle.dumps(p.to_state()) for t, p in serial.positions.items()}
+
+    print(f"\n=== ledger replay, {n:,} trades over {tickers} tickers ===")
+    print(f"serial:     {t_serial:6.2f}s")
+    workers = 2
+    while workers <= max(2, os.cpu_count() or 1):
+        t0 = time.perf_counter()
+        par = Ledger()
+        par.import_rows(rows, workers=workers)
+        t_par = time.perf_counter() - t0
+        same = list(par.positions) == list(serial.positions) and all(
+            pickle.dumps(p.to_state()) == expected[t] for t, p in par.positions.items()
+        )
+        print(f"{workers:2d} workers: {t_par:6.2f}s  ({t_serial / t_par:.1f}x)  identical={same}")
+        assert same, f"{workers}-worker replay differs from the serial one"
+        workers *= 2
+
+
+def bench_db(n: int = 100_000, tickers: int = 64):
+    """
+    TradeStore on the SQLite stand-in: bulk trade insert, read back,
+    save/load of the replayed positions.
+    """
+    rows = _synthetic_trades(n, tickers)
+    ledger = Ledger()
+    ledger.import_rows(rows)
+
+    print(f"\n=== trade store (sqlite), {n:,} trades over {tickers} tickers ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TradeStore.sqlite(os.path.join(tmp, "bench.db"))
+
+        t0 = time.perf_counter()
+        store.insert_trades(rows)
+        print(f"insert trades:   {_rate(n, time.perf_counter() - t0)}")
+
+        t0 = time.perf_counter()
+        back = sum(1 for _ in store.load_trades())
+        print(f"load trades:     {_rate(back, time.perf_counter() - t0)}")
+
+        t0 = time.perf_counter()
+        store.save_positions(ledger.positions.values())
+        print(f"save positions:  {time.perf_counter() - t0:.2f}s  ({store.count('sale_lots'):,} per-lot rows)")
+
+        t0 = time.perf_counter()
+        loaded = store.load_positions()
+        print(f"load positions:  {time.perf_counter() - t0:.2f}s  ({len(loaded)} positions)")
+        store.close()
+
+
+def _same_state(a: dict, b: dict) -> bool:
+    """
+    Position.to_state() equality; arrays by their bytes so NaNs compare equal.
+    """
+    if a.keys() != b.keys():
+        return False
+    for k, v in a.items():
+        if isinstance(v, array):
+            if v.typecode != b[k].typecode or v.tobytes() != b[k].tobytes():
+                return False
+        elif v != b[k]:
+            return False
+    return True
+
+
+def bench_snapshot(n: int = 400_000, tickers: int = 64):
+    """
+    Snapshot round trip (checked against the replayed positions) and load
+    time vs unpickling the same positions.
+    """
+    rows = _synthetic_trades(n, tickers)
+    print(f"\n=== snapshot, {n:,} trades over {tickers} tickers ===")
+    for compact in (False, True):
+        ledger = Ledger(compact=compact)
+        ledger.import_rows(rows)
+        positions = dict(ledger.positions)
+
+        # splits and a lot with no price / FX, which are stored as NaN
+        odd = positions["SPLIT"] = Position("SPLIT", compact=compact)
+        odd.add_buy("L1", datetime(2020, 1, 2), 10.0, None, None, 900.0)
+        odd.add_buy("L2", datetime(2020, 3, 2), 4.0, 120.0, 1.1, 440.0)
+        odd.apply_split(4.0, datetime(2020, 2, 1))
+        odd.sell(datetime(2020, 4, 1), 30.0, 1500.0)
+        odd.apply_split(0.5, datetime(2021, 1, 1))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "book.snap")
+            t0 = time.perf_counter()
+            size = save_snapshot(path, positions.values())
+            t_save = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            snap = Snapshot(path, compact=compact)
+            t_open = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            loaded = {symbol: snap[symbol] for symbol in snap}
+            t_build = time.perf_counter() - t0
+
+            same = loaded.keys() == positions.keys() and all(
+                _same_state(loaded[s].to_state(), p.to_state()) for s, p in positions.items()
+            )
+            del loaded
+            snap.close()
+            assert same, "snapshot positions differ from the saved ones"
+
+            owned = load_snapshot(path, compact=compact)
+            assert owned.keys() == positions.keys()
+            for s, p in positions.items():
+                assert _same_state(owned[s].to_state(), p.to_state()), f"load_snapshot: {s} differs"
+            del owned
+
+        blob = pickle.dumps(positions, protocol=pickle.HIGHEST_PROTOCOL)
+        t0 = time.perf_counter()
+        pickle.loads(blob)
+        t_pickle = time.perf_counter() - t0
+
+        print(f"{'compact' if compact else 'list'}:")
+        print(f"  save:            {t_save:6.2f}s  {size / 1e6:.1f} MB (pickle {len(blob) / 1e6:.1f} MB)")
+        print(f"  open:            {t_open * 1000:6.2f}ms")
+        print(f"  build all:       {t_build:6.2f}s  (unpickle {t_pickle:.2f}s)  identical={same}")
+
+
+def bench_bnb(n: int = 400_000, tickers: int = 64):
+    """
+    Ledger replay with plain FIFO vs deferred bed-and-breakfast matching.
+    """
+    rows = _synthetic_trades(n, tickers)
+    print(f"\n=== bed-and-breakfast matching, {n:,} trades over {tickers} tickers ===")
+    for bnb in (False, True):
+        t0 = time.perf_counter()
+        ledger = Ledger(bed_and_breakfast=bnb)
+        ledger.import_rows(rows)
+        ledger.settle(final=True)
+        t = time.perf_counter() - t0
+        gains = sum(s.gain_eur for p in ledger.positions.values() for s in p.sales)
+        print(f"{'4-week rule' if bnb else 'FIFO':12} {_rate(n, t)}  realised {gains:,.2f}")
+
+    # an oversold sale stays pending and leaves the lots as they were
+    for compact in (False, True):
+        ledger = Ledger(compact=compact, bed_and_breakfast=True)
+        buy = {"action_type": "BUY", "ticker": "NVDA", "price_per_share": 100.0, "exchange_rate": 1.1}
+        ledger.apply_row({**buy, "id": "b1", "time": datetime(2024, 1, 2), "shares": 10.0, "total": 1000.0})
+        ledger.apply_row({**buy, "id": "b2", "time": datetime(2024, 1, 3), "shares": 2.0, "total": 210.0})
+        ledger.apply_row({"action_type": "SELL", "ticker": "NVDA", "id": "s1",
+                          "time": datetime(2024, 3, 1), "shares": 15.0, "total": 1800.0})
+        pos = ledger.positions["NVDA"]
+        before = pos.to_state(), pos.total_qty_left(), pos.total_cost_left(), list(ledger.pending["NVDA"])
+        try:
+            ledger.settle(final=True)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("oversold sale settled")
+        after = pos.to_state(), pos.total_qty_left(), pos.total_cost_left(), list(ledger.pending["NVDA"])
+        assert repr(after) == repr(before), "failed settle() changed the position"
+        pos.check_totals()
+
+
+def bench_exact(n: int = 400_000, tickers: int = 64):
+    """
+    Float vs exact (fixed-point) ledger replay on broker-shaped figures,
+    and how far each is from the broker's own buy totals.
+    """
+    rows = _synthetic_trades(n, tickers)
+    for r in rows:
+        r["shares"] = round(r["shares"], 7)
+        r["total"] = round(r["total"], 2)
+    bought_cents = sum(round(r["total"] * 100) for r in rows if r["action_type"] == "BUY")
+
+    print(f"\n=== exact mode, {n:,} trades over {tickers} tickers ===")
+    for exact in (False, True):
+        ledger = Ledger(exact=exact)
+        t0 = time.perf_counter()
+        ledger.import_rows(rows)
+        t = time.perf_counter() - t0
+
+        positions = ledger.positions.values()
+        if exact:
+            recs = ledger.reconcile().values()
+            accounted = sum(r.cost_used + r.cost_left for r in recs) / 1000
+            note = f"reconciled={all(r.ok for r in recs)}"
+            assert all(r.ok for r in recs)
+
+            # a cent lost from one lot shows up against the broker's totals
+            pos = next(iter(positions))
+            pos.cost_left[len(pos) - 1] -= 1000
+            assert not ledger.reconcile()[pos.symbol].ok
+            pos.cost_left[len(pos) - 1] += 1000
+
+            with tempfile.TemporaryDirectory() as tmp:
+                try:
+                    save_snapshot(os.path.join(tmp, "exact.snap"), positions)
+                except TypeError:
+                    pass
+                else:
+                    raise AssertionError("snapshot took exact positions")
+        else:
+            accounted = sum(p.total_cost_left() + sum(s.total_cost_eur for s in p.sales) for p in positions) * 100
+            note = ""
+        print(f"{'exact' if exact else 'float':6} {_rate(n, t)}  off broker buys by {accounted - bought_cents:+.6f} cents  {note}")
+
+
+def _rows_per_cell(path: str) -> list[dict]:
+    """
+    The per-row path as it is now: DictReader and _build_row on every row.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        parse_time = TimeParser()
+        rows = (_build_row(raw, False, parse_time) for raw in _open_reader(f))
+        return [r for r in rows if r is not None]
+
+
+def _classify_baseline(action):
+    """
+    _classify_action as it was before the lookup table, minus its debug print.
+    """
+    if not action:
+        return None, None
+    a = action.strip().lower()
+    if a in {"market buy", "limit buy"}:
+        return "BUY", "MARKET" if "market" in a else "LIMIT"
+    if a in {"market sell", "limit sell"}:
+        return "SELL", "MARKET" if "market" in a else "LIMIT"
+    if a in {"dividend (dividend)", "dividend (dividend manufactured payment)"}:
+        return "Dividend", None if "manufactured" not in a else "Manufactured"
+    if a in {"deposit"}:
+        return "Deposit", None
+    if a in {"withdrawal"}:
+        return "Withdrawal", None
+    if a in {"interest on cash"}:
+        return "Interest", None
+    return None, None
+
+
+def _rows_baseline(path: str) -> list[dict]:
+    """
+    The import loop before any of the parsing work: DictReader, _to_float /
+    _to_str on every cell, the strptime loop for every time, and the raw
+    dict kept on each row. Rows stay in file order.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = []
+        for raw in _open_reader(f):
+            action_raw = _to_str(raw.get("Action"))
+            action_type, order_type = _classify_baseline(action_raw)
+            if action_type is None:
+                continue
+            row = {
+                "action": action_raw,
+                "action_type": action_type,
+                "order_type": order_type,
+                "time": _parse_time(raw["Time"]) if raw.get("Time") else None,
+            }
+            for key, header, kind in _FIELDS:
+                row[key] = _to_float(raw.get(header)) if kind == _FLOAT else _to_str(raw.get(header))
+            row["raw"] = raw
+            if row["time"] is not None:
+                rows.append(row)
+        return rows
+
+
+def _without_raw(rows: list[dict]) -> list[dict]:
+    return [{k: v for k, v in r.items() if k != "raw"} for r in rows]
+
+
+def bench_coerce(n: int = 500_000):
+    """
+    CSV import: the baseline per-cell loop (strptime, per-cell _to_float /
+    _to_str, raw dicts), today's per-row _build_row, and column-at-a-time
+    batches. All three must give the same rows, on a clean file and on one
+    with blanks, stray spaces, thousands separators and short rows.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.csv")
+        _write_synthetic_csv(path, n)
+
+        # newest path first, so it isn't the one paying for GC over the others' rows
+        t0 = time.perf_counter()
+        new = list(iter_trading212_csv(path))
+        t_new = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        per_row = _rows_per_cell(path)
+        t_row = time.perf_counter() - t0
+        assert per_row == new
+        del per_row
+
+        t0 = time.perf_counter()
+        base = _rows_baseline(path)
+        t_base = time.perf_counter() - t0
+        assert _without_raw(base) == new
+        del base
+
+        print(f"\n=== CSV coercion, {n:,} raw rows, {len(new):,} kept ===")
+        print(f"baseline:    {_rate(n, t_base)}")
+        print(f"_build_row:  {_rate(n, t_row)}")
+        print(f"batched:     {_rate(n, t_new)}")
+        print(f"speedup:     {t_base / t_new:.1f}x over the baseline, {t_row / t_new:.1f}x over _build_row")
+
+        messy = os.path.join(tmp, "messy.csv")
+        with open(path, encoding="utf-8", newline="") as f, open(messy, "w", encoding="utf-8", newline="") as out:
+            w = csv.writer(out)
+            for i, row in enumerate(csv.reader(f)):
+                if i and i % 7 == 0:
+                    row[7] = f" {row[7]} "
+                if i and i % 11 == 0:
+                    row[8] = ""
+                if i and i % 13 == 0:
+                    row[0] = f"  {row[0].upper()} "
+                if i and i % 17 == 0:
+                    row[10] = "n/a"
+                if i and i % 19 == 0:
+                    row = row[:12]
+                w.writerow(row)
+        rows = list(iter_trading212_csv(messy))
+        assert _rows_per_cell(messy) == rows == _without_raw(_rows_baseline(messy))
+        print("messy file: same rows")
+
+
+def bench_files(n: int = 600_000, files: int = 24, workers: int = 0):
+    """
+    n rows split over `files` exports whose windows overlap by 10%:
+    serial ingest + merge vs iter_trading212_files on a process pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        whole = os.path.join(tmp, "whole.csv")
+        _write_synthetic_csv(whole, n)
+        expected = ingest_trading212_csv(whole)
+
+        # consecutive time windows, each also repeating the start of the next
+        step = len(expected) // files
+        paths = []
+        for k in range(files):
+            part = expected[k * step:(k + 1) * step + step // 10] if k < files - 1 else expected[k * step:]
+            ids = {r["id"] for r in part}
+            path = os.path.join(tmp, f"part{k:02}.csv")
+            with open(whole, encoding="utf-8", newline="") as f, open(path, "w", encoding="utf-8", newline="") as out:
+                reader = csv.reader(f)
+                w = csv.writer(out)
+                w.writerow(next(reader))
+                w.writerows(r for r in reader if r[6] in ids)
+            paths.append(path)
+        paths.reverse()  # order of the paths mustn't matter
+
+        t0 = time.perf_counter()
+        serial = list(iter_trading212_files(paths, workers=1))
+        t_serial = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        pooled = list(iter_trading212_files(paths, workers=workers))
+        t_pooled = time.perf_counter() - t0
+
+    key = lambda r: (r["time"], r["id"])
+    assert sorted(serial, key=key) == sorted(pooled, key=key) == sorted(expected, key=key)
+    assert all(a["time"] <= b["time"] for a, b in zip(pooled, pooled[1:]))
+    print(f"\n=== {files} overlapping exports, {len(expected):,} distinct rows ===")
+    print(f"serial:              {_rate(len(expected), t_serial)}")
+    print(f"{workers} worker processes: {_rate(len(expected), t_pooled)}")
+
+
+def bench_cache(n: int = 500_000):
+    """
+    ImportCache: cold parse + sidecar write vs warm load, then a touched
+    (same bytes, new mtime) and an edited export.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.csv")
+        _write_synthetic_csv(path, n)
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            # a blank float and a NaN must come back as None and NaN
+            f.write("Market buy,2024-01-01 10:00:00,US0X,X,X Inc,,EOFX,1,,USD,nan,,EUR,5,EUR,,\n")
+        expected = list(_iter_rows(path))
+        cache = ImportCache(os.path.join(tmp, "cache"))
+
+        def timed(label, extra=0):
+            t0 = time.perf_counter()
+            rows = cache.rows(path)
+            t = time.perf_counter() - t0
+            assert len(rows) == len(expected) + extra
+            print(f"{label:8} {_rate(len(rows), t)}  {cache.stats}")
+            return rows, t
+
+        print(f"\n=== import cache, {len(expected):,} rows ===")
+        cold, _ = timed("cold")
+        warm, t_warm = timed("warm")
+        last = warm[-1]
+        assert last["price_per_share"] is None and last["exchange_rate"] != last["exchange_rate"]
+        # NaN != NaN, so compare the rest of the rows
+        assert cold[:-1] == warm[:-1] == expected[:-1]
+        print(f"warm load is {cache.stats.parse_seconds / t_warm:.1f}x faster than parsing, sidecar {os.path.getsize(cache.sidecar(path)) / 1e6:.1f} MB")
+
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        timed("touched")
+        assert cache.stats.rehashed == 1
+
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            f.write("Market sell,2024-01-02 10:00:00,US0X,X,X Inc,,EOFY,1,5,USD,1.1,,EUR,5,EUR,,\n")
+        edited, _ = timed("edited", extra=1)
+        assert edited[-1]["id"] == "EOFY" and cache.stats.misses == 2
+
+
+def bench_prices(n: int = 200, days: int = 2_000):
+    """
+    PriceStore filled through the default provider with the caching layer
+    installed, the way Main sets it up: closes for n symbols, then the same
+    ranges again from a second store (served by the cache).
+    """
+    # market_data needs yfinance, so only this bench pulls it in
+    from market_cache import CachingProvider
+    from market_data import StaticProvider, get_provider, set_provider
+    from price_store import PriceStore
+
+    start = datetime(2020, 1, 1).date()
+    end = start + timedelta(days=days - 1)
+    rnd = random.Random(1)
+    histories = {
+        f"S{i}": {start + timedelta(days=d): rnd.uniform(10, 500) for d in range(days)}
+        for i in range(n)
+    }
+    inner = StaticProvider(histories=histories)
+    previous = get_provider()
+    set_provider(CachingProvider(inner))
+    try:
+        cache = get_provider()
+        with tempfile.TemporaryDirectory() as tmp:
+            times = []
+            for k in range(2):
+                store = PriceStore(os.path.join(tmp, f"store{k}"))
+                t0 = time.perf_counter()
+                for sym in histories:
+                    store.update_prices(sym, start, end)
+                times.append(time.perf_counter() - t0)
+                for sym, closes in list(histories.items())[:10]:
+                    assert store.price_on(sym, end) == closes[end]
+                store.close()
+
+            # a range up to today stays open for closes that weren't posted yet
+            today = datetime.now().date()
+            late = StaticProvider(histories={"X": {today - timedelta(days=2): 1.0}})
+            store = PriceStore(os.path.join(tmp, "late"), provider=late)
+            store.update_prices("X", today - timedelta(days=9), today)
+            late.histories["X"][today - timedelta(days=1)] = 2.0
+            store.update_prices("X", today - timedelta(days=9), today)
+            assert store.price_on("X", today - timedelta(days=1)) == 2.0
+            store.close()
+    finally:
+        set_provider(previous)
+
+    print(f"\n=== PriceStore via the caching provider, {n} symbols x {days} days ===")
+    print(f"first fill:  {times[0] * 1000:8.1f} ms  provider calls {inner.calls}")
+    print(f"second fill: {times[1] * 1000:8.1f} ms  {cache.stats}")
+
+
+BENCHES = {
+    "parse_time": bench_parse_time,
+    "columns": bench_columns,
+    "lots": bench_lots,
+    "fifo": bench_fifo,
+    "revalue": bench_revalue,
+    "replay": bench_replay,
+    "db": bench_db,
+    "snapshot": bench_snapshot,
+    "bnb": bench_bnb,
+    "exact": bench_exact,
+    "coerce": bench_coerce,
+    "files": bench_files,
+    "cache": bench_cache,
+    "prices": bench_prices,
+}
+
+
+def main():
+    names = sys.argv[1:2] or list(BENCHES)
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    for name in names:
+        fn = BENCHES[name]
+        fn(n) if n else fn()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# Irish CGT: realised gains by tax year and payment period
+
+import csv
+import json
+from dataclasses import asdict, dataclass, fields
+from datetime import date
+from typing import Iterable, Optional
+
+from positions import Position, SaleSummary
+
+
+CGT_RATE = 0.33
+ANNUAL_EXEMPTION = 1270.0
+
+# disposals Jan-Nov are paid by 15 December, December ones by 31 January
+INITIAL = "Jan-Nov"
+LATER = "Dec"
+PERIODS = (INITIAL, LATER)
+
+
+def period_of(d) -> str:
+    return LATER if d.month == 12 else INITIAL
+
+
+def payment_due(year: int, period: str) -> date:
+    return date(year, 12, 15) if period == INITIAL else date(year + 1, 1, 31)
+
+
+@dataclass
+class CGTTotals:
+    disposals: int = 0
+    proceeds_eur: float = 0.0
+    cost_eur: float = 0.0
+    gains_eur: float = 0.0     # sum of the disposals that made a gain
+    losses_eur: float = 0.0    # sum of the losses, as a positive number
+
+    @property
+    def net_eur(self) -> float:
+        return self.gains_eur - self.losses_eur
+
+    def add(self, sale: SaleSummary, sign: int = 1):
+        self.disposals += sign
+        self.proceeds_eur += sign * sale.proceeds_eur
+        self.cost_eur += sign * sale.total_cost_eur
+        if sale.gain_eur >= 0:
+            self.gains_eur += sign * sale.gain_eur
+        else:
+            self.losses_eur -= sign * sale.gain_eur
+
+
+@dataclass
+class YearSummary:
+    """
+    One tax year after losses and the exemption. An estimate for checking
+    against, not a return.
+    """
+    year: int
+    totals: CGTTotals
+    periods: dict
+    losses_brought_forward: float = 0.0
+    losses_used: float = 0.0
+    losses_carried_forward: float = 0.0
+    exemption_eur: float = 0.0
+    chargeable_eur: float = 0.0
+    tax_eur: float = 0.0
+    tax_initial_eur: float = 0.0   # due 15 Dec
+    tax_later_eur: float = 0.0     # due 31 Jan
+
+
+def _tax(net: float, carried: float) -> tuple[float, float, float, float]:
+    """
+    net gain/loss for some part of a year -> (losses used, exemption used,
+    chargeable, tax).
+    """
+    if net <= 0:
+        return 0.0, 0.0, 0.0, 0.0
+    used = min(carried, net)
+    net -= used
+    exempt = min(ANNUAL_EXEMPTION, net)
+    chargeable = net - exempt
+    return used, exempt, chargeable, chargeable * CGT_RATE
+
+
+class CGTReport:
+    """
+    Realised gains and losses kept as running totals per (year, period) and
+    per (year, symbol). update() only looks at sales recorded since the
+    last call (it remembers how many of each position's sales it has seen),
+    so keeping the report current costs nothing per old disposal and never
+    touches the per-lot rows.
+
+        report = CGTReport()
+        report.update(ledger.positions.values())
+        report.to_csv("cgt.csv")
+    """
+
+    def __init__(self):
+        self.periods: dict[tuple[int, str], CGTTotals] = {}
+        self.symbols: dict[tuple[int, str], CGTTotals] = {}
+        self._seen: dict[str, int] = {}
+
+    def record(self, symbol: str, sale: SaleSummary, sign: int = 1):
+        """
+        Add one disposal to the totals (sign=-1 takes it back out).
+        """
+        year = sale.date.year
+        key = (year, period_of(sale.date))
+        totals = self.periods.get(key)
+        if totals is None:
+            totals = self.periods[key] = CGTTotals()
+        totals.add(sale, sign)
+
+        key = (year, symbol)
+        totals = self.symbols.get(key)
+        if totals is None:
+            totals = self.symbols[key] = CGTTotals()
+        totals.add(sale, sign)
+
+    def update(self, positions: Iterable[Position]) -> int:
+        """
+        Record sales added to these positions since the last update.
+        Returns how many were new.
+        """
+        added = 0
+        for pos in positions:
+            sales = pos.sales
+            seen = self._seen.get(pos.symbol, 0)
+            for sale in sales[seen:]:
+                self.record(pos.symbol, sale)
+            added += len(sales) - seen
+            self._seen[pos.symbol] = len(sales)
+        return added
+
+    @classmethod
+    def from_positions(cls, positions: Iterable[Position]) -> "CGTReport":
+        report = cls()
+        report.update(positions)
+        return report
+
+    # ---- summaries ----
+
+    def years(self) -> list[int]:
+        return sorted({year for year, _ in self.periods})
+
+    def year_totals(self, year: int) -> CGTTotals:
+        out = CGTTotals()
+        for period in PERIODS:
+            t = self.periods.get((year, period))
+            if t is not None:
+                for f in fields(CGTTotals):
+                    setattr(out, f.name, getattr(out, f.name) + getattr(t, f.name))
+        return out
+
+    def summaries(self, losses_brought_forward: float = 0.0) -> list[YearSummary]:
+        """
+        Every year in order, net losses carried into the next one.
+        """
+        out = []
+        carried = losses_brought_forward
+        for year in self.years():
+            periods = {p: self.periods.get((year, p), CGTTotals()) for p in PERIODS}
+            totals = self.year_totals(year)
+            s = YearSummary(year, totals, periods, losses_brought_forward=carried)
+
+            used, exempt, chargeable, tax = _tax(totals.net_eur, carried)
+            s.losses_used, s.exemption_eur, s.chargeable_eur, s.tax_eur = used, exempt, chargeable, tax
+
+            # what's due by 15 Dec is worked out on the Jan-Nov disposals alone
+            s.tax_initial_eur = min(tax, _tax(periods[INITIAL].net_eur, carried)[3])
+            s.tax_later_eur = tax - s.tax_initial_eur
+
+            carried -= used
+            if totals.net_eur < 0:
+                carried -= totals.net_eur
+            s.losses_carried_forward = carried
+            out.append(s)
+        return out
+
+    def summary(self, year: int, losses_brought_forward: float = 0.0) -> Optional[YearSummary]:
+        for s in self.summaries(losses_brought_forward):
+            if s.year == year:
+                return s
+        return None
+
+    # ---- export ----
+
+    COLUMNS = (
+        "year", "period", "payment_due", "disposals", "proceeds_eur", "cost_eur",
+        "gains_eur", "losses_eur", "net_eur", "losses_brought_forward", "losses_used",
+        "exemption_eur", "chargeable_eur", "tax_eur",
+    )
+
+    def rows(self, losses_brought_forward: float = 0.0) -> list[dict]:
+        """
+        One row per payment period and one "Year" row per tax year.
+        """
+        out = []
+        for s in self.summaries(losses_brought_forward):
+            for period in PERIODS:
+                t = s.periods[period]
+                out.append({
+                    "year": s.year,
+                    "period": period,
+                    "payment_due": payment_due(s.year, period).isoformat(),
+                    **asdict(t),
+                    "net_eur": t.net_eur,
+                    "tax_eur": s.tax_initial_eur if period == INITIAL else s.tax_later_eur,
+                })
+            out.append({
+                "year": s.year,
+                "period": "Year",
+                **asdict(s.totals),
+                "net_eur": s.totals.net_eur,
+                "losses_brought_forward": s.losses_brought_forward,
+                "losses_used": s.losses_used,
+                "exemption_eur": s.exemption_eur,
+                "chargeable_eur": s.chargeable_eur,
+                "tax_eur": s.tax_eur,
+            })
+        return out
+
+    def symbol_rows(self) -> list[dict]:
+        return [
+            {"year": year, "symbol": symbol, **asdict(t), "net_eur": t.net_eur}
+            for (year, symbol), t in sorted(self.symbols.items())
+        ]
+
+    def to_csv(self, path: str, losses_brought_forward: float = 0.0):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=self.COLUMNS, restval="")
+            w.writeheader()
+            w.writerows(self.rows(losses_brought_forward))
+
+    def to_json(self, path: str, losses_brought_forward: float = 0.0):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"years": self.rows(losses_brought_forward), "by_symbol": self.symbol_rows()},
+                f, indent=2,
+            )
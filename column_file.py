@@ -0,0 +1,130 @@
+# binary column files: a header, a column table, then each column's values
+
+import os
+import struct
+import threading
+from array import array
+from typing import Iterable, Optional, Sequence
+
+
+# after the caller's own header, little endian:
+#   table    per column: typecode(1) pad(7) offset(u64) count(u64)
+#   data     each column's values, 8-byte aligned, in table order
+#
+# Used by snapshot.py, import_cache.py and price_store.py; each puts its
+# own magic / version / metadata in the header and knows its column list.
+_ENTRY = struct.Struct("<c7xQQ")
+
+
+def write_columns(path: str, header: bytes, columns: Sequence[tuple[str, array]]):
+    """
+    Write header, the column table and the columns to path. Goes through a
+    temp file of the writer's own, so readers (and other writers of the
+    same path) only ever see a whole file.
+    """
+    offset = len(header) + _ENTRY.size * len(columns)
+    table = bytearray()
+    for _, col in columns:
+        offset += -offset % 8
+        table += _ENTRY.pack(col.typecode.encode(), offset, len(col))
+        offset += col.itemsize * len(col)
+
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        f.write(table)
+        for _, col in columns:
+            f.write(bytes(-f.tell() % 8))
+            col.tofile(f)
+    os.replace(tmp, path)
+
+
+def read_columns(buf, header_size: int, layout: Sequence[tuple[str, str]]) -> dict[str, memoryview]:
+    """
+    Zero-copy views on the columns of a write_columns() file held in buf
+    (bytes, mmap, ...), keyed by name. layout is the (name, typecode) list
+    the file was written with; a column of another type or running past
+    the end raises ValueError.
+
+    The views pin buf: release() them before closing an mmap.
+    """
+    cols = {}
+    view = memoryview(buf)
+    try:
+        for i, (name, code) in enumerate(layout):
+            typecode, offset, n = _ENTRY.unpack_from(buf, header_size + i * _ENTRY.size)
+            end = offset + array(code).itemsize * n
+            if typecode != code.encode():
+                raise ValueError(f"column {name} has type {typecode!r}, expected {code!r}")
+            if end > len(view):
+                raise ValueError(f"column {name} runs past the end of the file")
+            cols[name] = view[offset:end].cast(code)
+    except BaseException:
+        for col in cols.values():
+            col.release()
+        raise
+    finally:
+        view.release()
+    return cols
+
+
+class StringTable:
+    """
+    Deduplicated strings for a string column: each string gets an int code
+    (None is always -1), and the table is stored as two columns, the utf-8
+    bytes of every string and where each one ends.
+    """
+
+    def __init__(self):
+        self._codes: dict = {None: -1}
+        self.strings: list[str] = []
+
+    def code(self, s: Optional[str]) -> int:
+        c = self._codes.get(s)
+        if c is None:
+            c = self._codes[s] = len(self.strings)
+            self.strings.append(s)
+        return c
+
+    def codes(self, values: Iterable[Optional[str]]) -> list[int]:
+        """
+        Codes for a whole column: the new distinct strings are numbered
+        first, then the column is mapped in one go.
+        """
+        values = list(values)
+        for s in set(values).difference(self._codes):
+            self._codes[s] = len(self.strings)
+            self.strings.append(s)
+        return list(map(self._codes.__getitem__, values))
+
+    def columns(self) -> tuple[array, array]:
+        """
+        (bytes, end offsets) to store as the "strings" / "string_ends" columns.
+        """
+        data, ends = array("B"), array("q")
+        end = 0
+        for s in self.strings:
+            raw = s.encode("utf-8")
+            data.frombytes(raw)
+            end += len(raw)
+            ends.append(end)
+        return data, ends
+
+
+def string_at(data, ends, code: int) -> str:
+    """
+    String `code` of a stored StringTable, for reading one at a time.
+    """
+    start = ends[code - 1] if code else 0
+    return bytes(data[start:ends[code]]).decode("utf-8")
+
+
+def decode_strings(data, ends) -> list:
+    """
+    Every string of a stored StringTable, indexable by code (-1 is None).
+    """
+    raw = bytes(data)
+    starts = [0, *ends]
+    table = [raw[a:b].decode("utf-8") for a, b in zip(starts, starts[1:])]
+    table.append(None)
+    return table
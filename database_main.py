@@ -1 +1,356 @@
-# Main area to control operations for database interactions
\ No newline at end of file
+# Main area to control operations for database interactions
+
+# Trades, positions, lots, sales and per-lot sale rows in a SQL database.
+# The SQL is plain enough to run on both PostgreSQL (connectcls_postgres)
+# and SQLite (connectcls_sqlite), so the same store works against either.
+
+from array import array
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+from db_con import ConnectionPool, connectcls_sqlite
+from file_import import iter_trading212_csv
+from ledger import row_key
+from models import LotTable, from_us, to_us
+from positions import PER_LOT_FLOATS, Position
+
+
+_NAN = float("nan")
+
+# trade row fields stored as-is, in column order (time is stored as epoch us)
+TRADE_FIELDS = (
+    "id", "action", "action_type", "order_type", "isin", "ticker", "name", "notes",
+    "shares", "price_per_share", "price_currency", "exchange_rate",
+    "result", "result_currency", "total", "total_currency",
+    "withholding_tax", "withholding_tax_currency",
+)
+_TRADE_FLOATS = {"shares", "price_per_share", "exchange_rate", "result", "total", "withholding_tax"}
+
+# per_lot dict keys -> column names, same order as PER_LOT_FLOATS
+PER_LOT_COLUMNS = (
+    "original_qty", "split", "adjusted_qty", "price_usd", "fx",
+    "total_cost_eur", "adjusted_eur_per_share", "qty_sold", "qty_left",
+    "cost_used_eur", "cost_left_eur", "proceeds_eur", "gain_eur",
+)
+
+# columns where NaN in memory means "not known", stored as NULL
+_NULLABLE = ("price_usd", "fx")
+
+# dates / times are epoch microseconds (BIGINT), like the in-memory arrays;
+# per-lot dates are date ordinals
+SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS trades (
+        trade_key TEXT PRIMARY KEY,
+        time_us BIGINT NOT NULL,
+        {", ".join(f"{f} {'DOUBLE PRECISION' if f in _TRADE_FLOATS else 'TEXT'}" for f in TRADE_FIELDS)}
+    )""",
+    "CREATE INDEX IF NOT EXISTS trades_ticker_time ON trades (ticker, time_us)",
+    """CREATE TABLE IF NOT EXISTS positions (
+        symbol TEXT PRIMARY KEY,
+        head INTEGER NOT NULL,
+        qty_left DOUBLE PRECISION NOT NULL,
+        qty_stale INTEGER NOT NULL,
+        cost_left DOUBLE PRECISION NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS splits (
+        symbol TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        date_us BIGINT NOT NULL,
+        factor DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (symbol, seq)
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS lots (
+        symbol TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        lot_id TEXT NOT NULL,
+        date_us BIGINT NOT NULL,
+        {", ".join(f"{f} DOUBLE PRECISION" for f in LotTable.FLOAT_FIELDS)},
+        PRIMARY KEY (symbol, seq)
+    )""",
+    """CREATE TABLE IF NOT EXISTS sales (
+        symbol TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        date_us BIGINT NOT NULL,
+        quantity DOUBLE PRECISION NOT NULL,
+        proceeds_eur DOUBLE PRECISION NOT NULL,
+        total_cost_eur DOUBLE PRECISION NOT NULL,
+        gain_eur DOUBLE PRECISION NOT NULL,
+        lot_rows INTEGER NOT NULL,
+        PRIMARY KEY (symbol, seq)
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS sale_lots (
+        symbol TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        lot_id TEXT NOT NULL,
+        lot_date INTEGER NOT NULL,
+        {", ".join(f"{c} DOUBLE PRECISION" for c in PER_LOT_COLUMNS)},
+        PRIMARY KEY (symbol, seq)
+    )""",
+]
+
+POSITION_TABLES = ("sale_lots", "sales", "lots", "splits", "positions")
+
+
+def _insert_sql(table: str, columns, on_conflict: Optional[str] = None) -> str:
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    if on_conflict:
+        sql += f" ON CONFLICT ({on_conflict}) DO NOTHING"
+    return sql
+
+
+def _batches(rows: Iterable, size: int) -> Iterator[list]:
+    it = iter(rows)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def _null(v):
+    return None if v != v else v
+
+
+def _nan(v):
+    return _NAN if v is None else v
+
+
+def _trade_params(row: dict) -> tuple:
+    return (row_key(row), to_us(row["time"]), *[row.get(f) for f in TRADE_FIELDS])
+
+
+def _position_rows(symbol: str, state: dict):
+    """
+    Position.to_state() columns -> parameter tuples for each table.
+    """
+    position = [(symbol, state["head"], state["qty_left"], int(state["qty_stale"]), state["cost_left"])]
+
+    splits = [
+        (symbol, i, d, f)
+        for i, (d, f) in enumerate(zip(state["split_date_us"], state["split_factor"]))
+    ]
+
+    lot_cols = [state["lot_" + name] for name in LotTable.FLOAT_FIELDS]
+    lot_cols = [
+        map(_null, col) if name in _NULLABLE else col
+        for name, col in zip(LotTable.FLOAT_FIELDS, lot_cols)
+    ]
+    lots = [
+        (symbol, i, *row)
+        for i, row in enumerate(zip(state["lot_id"], state["lot_date_us"], *lot_cols))
+    ]
+
+    sales = [
+        (symbol, i, *row)
+        for i, row in enumerate(zip(
+            state["sale_date_us"], state["sale_qty"], state["sale_proceeds"],
+            state["sale_cost"], state["sale_gain"], state["sale_rows"],
+        ))
+    ]
+
+    row_cols = [
+        map(_null, state["row " + key]) if col in _NULLABLE else state["row " + key]
+        for key, col in zip(PER_LOT_FLOATS, PER_LOT_COLUMNS)
+    ]
+    sale_lots = [
+        (symbol, i, *row)
+        for i, row in enumerate(zip(state["row_lot"], state["row_date"], *row_cols))
+    ]
+
+    return {
+        "positions": position,
+        "splits": splits,
+        "lots": lots,
+        "sales": sales,
+        "sale_lots": sale_lots,
+    }
+
+
+_TABLE_COLUMNS = {
+    "positions": ("symbol", "head", "qty_left", "qty_stale", "cost_left"),
+    "splits": ("symbol", "seq", "date_us", "factor"),
+    "lots": ("symbol", "seq", "lot_id", "date_us", *LotTable.FLOAT_FIELDS),
+    "sales": ("symbol", "seq", "date_us", "quantity", "proceeds_eur", "total_cost_eur", "gain_eur", "lot_rows"),
+    "sale_lots": ("symbol", "seq", "lot_id", "lot_date", *PER_LOT_COLUMNS),
+}
+
+
+def _empty_state(symbol: str) -> dict:
+    state = {
+        "symbol": symbol,
+        "head": 0, "qty_left": 0.0, "qty_stale": False, "cost_left": 0.0,
+        "split_date_us": array("q"), "split_factor": array("d"),
+        "lot_id": [], "lot_date_us": array("q"),
+        "sale_date_us": array("q"), "sale_qty": array("d"), "sale_proceeds": array("d"),
+        "sale_cost": array("d"), "sale_gain": array("d"), "sale_rows": array("q"),
+        "row_lot": [], "row_date": array("q"),
+    }
+    for name in LotTable.FLOAT_FIELDS:
+        state["lot_" + name] = array("d")
+    for key in PER_LOT_FLOATS:
+        state["row " + key] = array("d")
+    return state
+
+
+class TradeStore:
+    """
+    Persistence for ingested trades and replayed positions.
+
+    Trades are bulk-inserted with executemany in batches of batch_size, one
+    transaction per batch, and re-inserting a trade already stored is a
+    no-op. Positions are written from Position.to_state() columns and read
+    back into the same state, so a stored position is exactly the one saved.
+
+        store = TradeStore(ConnectionPool(lambda: connectcls_postgres(...)))
+        store = TradeStore.sqlite("stocks.db")   # local stand-in
+    """
+
+    def __init__(self, pool: ConnectionPool, batch_size: int = 10_000, fetch_size: int = 5_000):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.fetch_size = fetch_size
+
+    @classmethod
+    def sqlite(cls, path: str, pool_size: int = 4, **kwargs) -> "TradeStore":
+        store = cls(ConnectionPool(lambda: connectcls_sqlite(path), size=pool_size), **kwargs)
+        store.create_schema()
+        return store
+
+    def create_schema(self):
+        with self.pool.connection() as con:
+            for stmt in SCHEMA:
+                con.execute(stmt)
+
+    def close(self):
+        self.pool.close()
+
+    # ---- trades ----
+
+    def insert_trades(self, rows: Iterable[dict]) -> int:
+        """
+        Store typed rows from file_import. Returns how many rows were sent;
+        ones already stored (same trade key) are skipped by the database.
+        """
+        sql = _insert_sql("trades", ("trade_key", "time_us", *TRADE_FIELDS), on_conflict="trade_key")
+        sent = 0
+        for batch in _batches(map(_trade_params, rows), self.batch_size):
+            with self.pool.connection() as con:
+                con.executemany(sql, batch)
+            sent += len(batch)
+        return sent
+
+    def import_csv(self, path: str) -> int:
+        return self.insert_trades(iter_trading212_csv(path))
+
+    @staticmethod
+    def _trades_sql(ticker: Optional[str]) -> tuple[str, tuple]:
+        sql = f"SELECT time_us, {', '.join(TRADE_FIELDS)} FROM trades"
+        params = ()
+        if ticker is not None:
+            sql += " WHERE ticker = ?"
+            params = (ticker,)
+        return sql + " ORDER BY time_us, trade_key", params
+
+    def load_trades(self, ticker: Optional[str] = None) -> Iterator[dict]:
+        """
+        Stored trades in time order as file_import rows, ready for
+        Ledger.import_rows.
+        """
+        sql, params = self._trades_sql(ticker)
+        with self.pool.connection() as con:
+            for time_us, *values in con.stream(sql, params, self.fetch_size):
+                row = dict(zip(TRADE_FIELDS, values))
+                row["time"] = from_us(time_us)
+                yield row
+
+    def trade_columns(self, ticker: Optional[str] = None) -> dict:
+        """
+        Stored trades in time order as {column: array or list}, numeric
+        columns as array("d") / array("q") where no value is missing.
+        """
+        sql, params = self._trades_sql(ticker)
+        with self.pool.connection() as con:
+            return con.columns(sql, params, self.fetch_size)
+
+    def count(self, table: str = "trades") -> int:
+        with self.pool.connection() as con:
+            return con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    # ---- positions ----
+
+    def save_positions(self, positions: Iterable[Position]):
+        """
+        Replace the stored state of each position, all in one transaction.
+        Exact-mode positions aren't supported.
+        """
+        positions = list(positions)
+        for pos in positions:
+            if not isinstance(pos, Position):
+                raise TypeError(f"{pos.symbol}: only Positions can be stored, not {type(pos).__name__}")
+        with self.pool.connection() as con:
+            symbols = [(p.symbol,) for p in positions]
+            for table in POSITION_TABLES:
+                con.executemany(f"DELETE FROM {table} WHERE symbol = ?", symbols)
+
+            pending = {table: [] for table in _TABLE_COLUMNS}
+            for pos in positions:
+                for table, rows in _position_rows(pos.symbol, pos.to_state()).items():
+                    out = pending[table]
+                    out.extend(rows)
+                    if len(out) >= self.batch_size:
+                        con.executemany(_insert_sql(table, _TABLE_COLUMNS[table]), out)
+                        out.clear()
+            for table, out in pending.items():
+                if out:
+                    con.executemany(_insert_sql(table, _TABLE_COLUMNS[table]), out)
+
+    def load_positions(self, symbols: Optional[Iterable[str]] = None, compact: bool = False) -> dict[str, Position]:
+        states: dict[str, dict] = {}
+        wanted = set(symbols) if symbols is not None else None
+
+        def state(sym):
+            s = states.get(sym)
+            if s is None:
+                s = states[sym] = _empty_state(sym)
+            return s
+
+        with self.pool.connection() as con:
+            sql = "SELECT symbol, head, qty_left, qty_stale, cost_left FROM positions"
+            for sym, head, qty_left, qty_stale, cost_left in con.stream(sql, batch_size=self.fetch_size):
+                if wanted is None or sym in wanted:
+                    s = state(sym)
+                    s["head"], s["qty_left"], s["qty_stale"], s["cost_left"] = head, qty_left, bool(qty_stale), cost_left
+
+            sql = "SELECT symbol, date_us, factor FROM splits ORDER BY symbol, seq"
+            for sym, d, f in con.stream(sql, batch_size=self.fetch_size):
+                if sym in states:
+                    s = states[sym]
+                    s["split_date_us"].append(d)
+                    s["split_factor"].append(f)
+
+            cols = ["lot_" + name for name in LotTable.FLOAT_FIELDS]
+            sql = f"SELECT symbol, lot_id, date_us, {', '.join(LotTable.FLOAT_FIELDS)} FROM lots ORDER BY symbol, seq"
+            for sym, lot_id, d, *values in con.stream(sql, batch_size=self.fetch_size):
+                if sym in states:
+                    s = states[sym]
+                    s["lot_id"].append(lot_id)
+                    s["lot_date_us"].append(d)
+                    for col, v in zip(cols, values):
+                        s[col].append(_nan(v))
+
+            sql = ("SELECT symbol, date_us, quantity, proceeds_eur, total_cost_eur, gain_eur, lot_rows "
+                   "FROM sales ORDER BY symbol, seq")
+            for sym, *values in con.stream(sql, batch_size=self.fetch_size):
+                if sym in states:
+                    s = states[sym]
+                    for col, v in zip(("sale_date_us", "sale_qty", "sale_proceeds", "sale_cost", "sale_gain", "sale_rows"), values):
+                        s[col].append(v)
+
+            cols = ["row " + key for key in PER_LOT_FLOATS]
+            sql = f"SELECT symbol, lot_id, lot_date, {', '.join(PER_LOT_COLUMNS)} FROM sale_lots ORDER BY symbol, seq"
+            for sym, lot_id, d, *values in con.stream(sql, batch_size=self.fetch_size):
+                if sym in states:
+                    s = states[sym]
+                    s["row_lot"].append(lot_id)
+                    s["row_date"].append(d)
+                    for col, v in zip(cols, values):
+                        s[col].append(_nan(v))
+
+        return {sym: Position.from_state(s, compact) for sym, s in states.items()}
@@ -3,20 +3,57 @@
 # This is taken from my FYP 2025 code and will be adapted for this project as needed
 
 
-import pyodbc
+import queue
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+try:
+    import pyodbc
+except ImportError:  # only the real server needs it, the sqlite stand-in doesn't
+    pyodbc = None
 
 # class for the connections to postgresql
 
+ROW_SHAPES = ("tuple", "namedtuple", "dict", "columns")
+
+
+def _column(values):
+    """
+    One batch of a column: a typed array when every value is a float (or
+    every value an int), otherwise a list.
+    """
+    kinds = set(map(type, values))
+    if kinds == {float}:
+        return array("d", values)
+    if kinds == {int}:
+        return array("q", values)
+    return list(values)
+
+
 class connectcls_postgres:
 
-    def __init__(self, driver_name, server_name, db_name, connection_username, connection_password, port=5432):
+    # DB-API module the connection and its exceptions come from
+    driver = pyodbc
+    label = "PostgreSQL"
+    MAX_STATEMENTS = 32
+
+    def __init__(self, driver_name, server_name, db_name, connection_username, connection_password, port=5432,
+                 fetch_size=None):
         self.driver_name = driver_name
         self.server_name = server_name
         self.db_name = db_name
         self.connection_username = connection_username
         self.connection_password = connection_password
         self.port = port
+        # psqlODBC buffers a whole result set client-side unless it's told
+        # to fetch through a server-side cursor, fetch_size rows at a time
+        self.fetch_size = fetch_size
 
+        # one cursor per statement text, so the driver keeps it prepared
+        self._statements = OrderedDict()
 
         self.conn, self.cursor, self.con_err = self.make_connection()
 
@@ -25,45 +62,235 @@ class connectcls_postgres:
 
     def connect_str(self):
         # connection string 
-        return  f"DRIVER={{{self.driver_name}}};SERVER={self.server_name};DATABASE={self.db_name};PORT={self.port};UID={self.connection_username};PWD={self.connection_password};"
+        conn_str = f"DRIVER={{{self.driver_name}}};SERVER={self.server_name};DATABASE={self.db_name};PORT={self.port};UID={self.connection_username};PWD={self.connection_password};"
+        if self.fetch_size:
+            conn_str += f"UseDeclareFetch=1;Fetch={self.fetch_size};"
+        return conn_str
     
+    def _connect(self):
+        return self.driver.connect(self.connect_str())
+
     def make_connection(self):
-        
+        db = self.driver
+        if db is None:
+            return None, None, [{"error": "pyodbc is not installed"}]
+
         try:
-            conn = pyodbc.connect(self.connect_str())
-            print("Connection to PostgreSQL is successful")
+            conn = self._connect()
+            print(f"Connection to {self.label} is successful")
             cursor = conn.cursor()
             return conn, cursor, None
-        except pyodbc.OperationalError as e:
+        except db.OperationalError as e:
             return None, None, [{"error": "Operational error - Check database connection and server status"}]
-        except pyodbc.IntegrityError as e:
+        except db.IntegrityError as e:
             return None, None, [{"error": "Integrity error - Check data integrity constraints"}]
-        except pyodbc.ProgrammingError as e:
+        except db.ProgrammingError as e:
             return None, None, [{"error": "Programming error - Check SQL syntax and table/column names"}]
-        except pyodbc.DatabaseError as e:
+        except db.DatabaseError as e:
             return None, None, [{"error": "Database error - General database error occurred"}]
-        except pyodbc.Error as e:
+        except db.Error as e:
             return None, None, [{"error": f"General error - {str(e)}"}]
 
 
-    def query(self, query):
+    def query(self, query, params=()):
         try: 
             
-            self.cursor.execute(query)
+            self.cursor.execute(query, params)
             rows = self.cursor.fetchall()
-            return [dict(zip([column[0] for column in self.cursor.description], row)) for row in rows]
-        except pyodbc.ProgrammingError as e:
+            names = [column[0] for column in self.cursor.description]
+            return [dict(zip(names, row)) for row in rows]
+        except self.driver.ProgrammingError as e:
             print(f"Query failed: {e}")
             return [{"error": "Query failure - Check SQL syntax"}]
-        except pyodbc.DatabaseError as e:
+        except self.driver.DatabaseError as e:
             print(f"Database failure: {e}")
             return [{"error": "Database failure - Check database connection and query"}]
-        except pyodbc.Error as e:
+        except self.driver.Error as e:
             print(f"Query failed: {e}")
             return [{"error": f"General error - {str(e)}"}]
 
 
-    
+    # bulk statements, these raise instead of returning error dicts so a
+    # failed batch can be rolled back by the caller
+
+    def execute(self, sql, params=()):
+        self.cursor.execute(sql, params)
+        return self.cursor
+
+    def executemany(self, sql, rows):
+        # pyodbc sends the whole parameter array in one round trip with this on
+        if hasattr(self.cursor, "fast_executemany"):
+            self.cursor.fast_executemany = True
+        self.cursor.executemany(sql, rows)
+
+    # streaming reads, these raise like the bulk statements
+
+    def _statement(self, sql):
+        """
+        Cursor that last ran `sql`, taken out of the cache while in use so a
+        nested stream of the same query gets its own.
+        """
+        cur = self._statements.pop(sql, None)
+        return cur if cur is not None else self.conn.cursor()
+
+    def _release(self, sql, cur):
+        if sql in self._statements:
+            # a nested run of the same query got cached first
+            cur.close()
+            return
+        self._statements[sql] = cur
+        while len(self._statements) > self.MAX_STATEMENTS:
+            self._statements.popitem(last=False)[1].close()
+
+    def stream(self, sql, params=(), batch_size=5000, shape="tuple"):
+        """
+        Run a parameterized query and yield its rows fetchmany(batch_size)
+        at a time, so only one batch is in memory.
+
+        shape: "tuple", "namedtuple", "dict", or "columns" which yields one
+        {column: values} dict per batch, with all-float / all-int columns as
+        array("d") / array("q").
+        """
+        if shape not in ROW_SHAPES:
+            raise ValueError(f"shape must be one of {ROW_SHAPES}")
+
+        cur = self._statement(sql)
+        try:
+            cur.execute(sql, params)
+            names = [column[0] for column in cur.description]
+            if shape == "namedtuple":
+                make = namedtuple("Row", names, rename=True)._make
+            elif shape == "dict":
+                make = lambda row: dict(zip(names, row))
+
+            while batch := cur.fetchmany(batch_size):
+                if shape == "tuple":
+                    yield from map(tuple, batch)
+                elif shape == "columns":
+                    yield {name: _column(values) for name, values in zip(names, zip(*batch))}
+                else:
+                    yield from map(make, batch)
+        finally:
+            self._release(sql, cur)
+
+    def columns(self, sql, params=(), batch_size=5000):
+        """
+        Whole result as {column: array or list}, built batch by batch.
+        """
+        out = None
+        for chunk in self.stream(sql, params, batch_size, shape="columns"):
+            if out is None:
+                out = chunk
+                continue
+            for name, values in chunk.items():
+                col = out[name]
+                if type(col) is not type(values) or getattr(col, "typecode", None) != getattr(values, "typecode", None):
+                    col = out[name] = list(col)
+                col.extend(values)
+        return out if out is not None else {}
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
     def close_connection(self):
+        for cur in self._statements.values():
+            cur.close()
+        self._statements.clear()
         self.conn.close()
-        print("Connection closed")
\ No newline at end of file
+        print("Connection closed")
+
+
+# local stand-in with the same interface, for dev and testing without a server
+
+class connectcls_sqlite(connectcls_postgres):
+
+    driver = sqlite3
+    label = "SQLite"
+
+    def __init__(self, path=":memory:"):
+        # every ":memory:" connection is its own database, use a file when pooling
+        super().__init__("sqlite3", "localhost", path, None, None, port=None)
+
+    def __str__(self):
+        return f'SQLite database: {self.db_name}'
+
+    def _connect(self):
+        # pooled connections move between threads, the pool only lends each to one at a time
+        return sqlite3.connect(self.db_name, check_same_thread=False)
+
+
+class ConnectionPool:
+    """
+    Up to `size` open connections shared between threads. factory() makes a
+    new connectcls_* object, e.g.
+
+        pool = ConnectionPool(lambda: connectcls_postgres(driver, server, db, user, pwd))
+
+    connection() lends one out for a with-block: committed if the block
+    finishes, rolled back if it raises, then handed back to the pool.
+    """
+
+    def __init__(self, factory, size=4, timeout=30.0):
+        if size <= 0:
+            raise ValueError("size must be > 0")
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        try:
+            con = self.factory()
+            if con.con_err:
+                raise ConnectionError(con.con_err[0]["error"])
+        except BaseException:
+            with self._lock:
+                self._opened -= 1
+            raise
+        return con
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            return self._open()
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection free after {self.timeout}s") from None
+
+    @contextmanager
+    def connection(self):
+        con = self._acquire()
+        try:
+            yield con
+        except BaseException:
+            con.rollback()
+            raise
+        else:
+            con.commit()
+        finally:
+            self._idle.put(con)
+
+    def close(self):
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            con.close_connection()
+            with self._lock:
+                self._opened -= 1
\ No newline at end of file
@@ -0,0 +1,319 @@
+# exact fixed-point FIFO: integer share / money units instead of floats
+
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime
+from fractions import Fraction
+from typing import Dict, List, Optional
+
+from models import SplitIndex
+
+
+# Trading212 exports shares with up to 8 decimals and money with 2, so
+# 1e-8 share units and cent-millis (1e-5 EUR) hold them exactly, with room
+# for the cost-basis split of partial sells. Both fit int64 comfortably.
+QTY_SCALE = 10**8
+MONEY_SCALE = 10**5
+
+
+def to_fixed(value, scale: int) -> int:
+    """
+    str / int / float -> integer units. Strings are parsed exactly; a float
+    is rounded to the nearest unit, which recovers the decimal it was read
+    from as long as that had no more digits than the scale.
+    """
+    if isinstance(value, int):
+        return value * scale
+    if isinstance(value, str):
+        value = value.strip().replace(",", "")
+        neg = value.startswith("-")
+        whole, _, frac = value.lstrip("+-").partition(".")
+        digits = len(str(scale)) - 1
+        units = int(whole or "0") * scale + int((frac + "0" * digits)[:digits] or "0")
+        if len(frac) > digits and frac[digits] >= "5":
+            units += 1
+        return -units if neg else units
+    return round(value * scale)
+
+
+def from_fixed(units: int, scale: int) -> float:
+    return units / scale
+
+
+def _ratio(factor: float) -> tuple[int, int]:
+    """
+    Split factor as a small exact ratio, e.g. 1.5 -> (3, 2), 0.1 -> (1, 10).
+    """
+    f = Fraction(factor).limit_denominator(10_000)
+    return f.numerator, f.denominator
+
+
+def _div_round(a: int, b: int) -> int:
+    """
+    a / b rounded half up, for non-negative a and positive b.
+    """
+    return (2 * a + b) // (2 * b)
+
+
+@dataclass(slots=True)
+class ExactSale:
+    """
+    One sell. Money in MONEY_SCALE units, shares in QTY_SCALE units.
+    lots_used holds (lot index, shares on the sale date, cost used,
+    proceeds, lot shares left, lot cost left) per lot; the float views
+    below match SaleSummary's fields.
+    """
+    date: datetime
+    qty: int
+    proceeds: int
+    cost: int
+    lots_used: List[tuple] = field(default_factory=list)
+    position: Optional["ExactPosition"] = field(default=None, repr=False, compare=False)
+
+    @property
+    def gain(self) -> int:
+        return self.proceeds - self.cost
+
+    @property
+    def quantity(self) -> float:
+        return self.qty / QTY_SCALE
+
+    @property
+    def proceeds_eur(self) -> float:
+        return self.proceeds / MONEY_SCALE
+
+    @property
+    def total_cost_eur(self) -> float:
+        return self.cost / MONEY_SCALE
+
+    @property
+    def gain_eur(self) -> float:
+        return self.gain / MONEY_SCALE
+
+    @property
+    def per_lot(self) -> List[Dict]:
+        """
+        Per-lot rows with the same keys as Position.sell's, built on read.
+        """
+        pos = self.position
+        rows = []
+        for i, used, cost, proceeds, left, cost_left in self.lots_used:
+            factor = pos.splits.factor(pos.dates[i], self.date) if len(pos.splits) else 1.0
+            adjusted_qty = pos.qty[i] * factor / QTY_SCALE
+            total_cost = pos.cost[i] / MONEY_SCALE
+            rows.append({
+                "Lot": pos.lot_ids[i],
+                "Date": pos.dates[i].date(),
+                "Original qty": pos.qty[i] / QTY_SCALE,
+                "Split": factor,
+                "Adjusted qty (new)": adjusted_qty,
+                "Price USD": pos.price_usd[i],
+                "FX": pos.fx[i],
+                "Total Cost €": total_cost,
+                "Adjusted € / share": total_cost / adjusted_qty if adjusted_qty else 0.0,
+                "Qty SOLD": used / QTY_SCALE,
+                "Qty LEFT": left * factor / QTY_SCALE,
+                "Cost USED €": cost / MONEY_SCALE,
+                "Cost LEFT €": cost_left / MONEY_SCALE,
+                "Proceeds €": proceeds / MONEY_SCALE,
+                "Gain €": (proceeds - cost) / MONEY_SCALE,
+            })
+        return rows
+
+
+@dataclass
+class Reconciliation:
+    """
+    Broker totals (the export's Total column, summed per ticker as rows
+    are replayed) vs what the lots and sales account for, all in
+    MONEY_SCALE units. Every difference is exactly 0 when ok.
+    """
+    bought: int
+    sold: int
+    cost_used: int
+    cost_left: int
+    proceeds: int
+    per_lot_proceeds: int
+
+    @property
+    def ok(self) -> bool:
+        return (
+            self.cost_used + self.cost_left == self.bought
+            and self.proceeds == self.sold
+            and self.per_lot_proceeds == self.sold
+        )
+
+    @property
+    def realised(self) -> int:
+        return self.proceeds - self.cost_used
+
+
+class ExactPosition:
+    """
+    Position with integer arithmetic: lot shares in QTY_SCALE units and
+    EUR in MONEY_SCALE units, kept in int64 arrays. Same add_buy / sell /
+    apply_split calls as Position, so Ledger(exact=True) can drive it.
+
+    A lot used up by a sale gives up exactly its remaining cost, and a
+    partial take gets its cost share rounded to the nearest unit, so cost
+    used + cost left always adds back to the broker's buy totals, and each
+    sale's per-lot proceeds add up to its broker total (reconcile()).
+
+    There's no to_state(), so snapshot.py and TradeStore can't store one;
+    keep exact ledgers in Ledger.save() checkpoints.
+    """
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.splits = SplitIndex()
+        self.sales: List[ExactSale] = []
+
+        self.lot_ids: List[str] = []
+        self.dates: List[datetime] = []
+        self.qty = array("q")        # shares bought, lot's own units
+        self.qty_left = array("q")
+        self.cost = array("q")       # broker total
+        self.cost_left = array("q")
+        self.price_usd = array("d")  # reference only
+        self.fx = array("d")
+
+        self._head = 0
+        self._cost_left = 0
+        self._qty_left = 0           # today's units, only kept while there are no splits
+
+    def __len__(self):
+        return len(self.lot_ids)
+
+    def add_buy(self, lot_id: str, date: datetime, qty, price_usd: Optional[float],
+                fx: Optional[float], total_cost_eur):
+        if total_cost_eur is None:
+            if price_usd is None or fx is None:
+                raise ValueError(f"Lot {lot_id}: either provide total_cost_eur OR price_usd + fx")
+            total_cost_eur = price_usd * qty / fx
+
+        units = to_fixed(qty, QTY_SCALE)
+        cost = to_fixed(total_cost_eur, MONEY_SCALE)
+        self.lot_ids.append(lot_id)
+        self.dates.append(date)
+        self.qty.append(units)
+        self.qty_left.append(units)
+        self.cost.append(cost)
+        self.cost_left.append(cost)
+        self.price_usd.append(float("nan") if price_usd is None else price_usd)
+        self.fx.append(float("nan") if fx is None else fx)
+
+        self._qty_left += units
+        self._cost_left += cost
+
+    def apply_split(self, factor: float, split_date: datetime):
+        if factor <= 0:
+            raise ValueError("Split factor must be > 0")
+        self.splits.add(split_date, factor)
+
+    def sell(self, date: datetime, qty, proceeds_eur) -> ExactSale:
+        to_sell = to_fixed(qty, QTY_SCALE)
+        proceeds = to_fixed(proceeds_eur, MONEY_SCALE)
+        if to_sell <= 0:
+            raise ValueError("Sale quantity must be > 0")
+
+        qty_left, cost_left = self.qty_left, self.cost_left
+        split = len(self.splits) > 0
+        remaining = to_sell
+        proceeds_left = proceeds
+        cost_total = 0
+        used: List[tuple] = []
+        undo = []
+
+        i = self._head
+        n = len(qty_left)
+        while remaining and i < n:
+            left = qty_left[i]
+            if not left:
+                i += 1
+                continue
+
+            if split:
+                num, den = _ratio(self.splits.factor(self.dates[i], date))
+                left_now = left * num // den
+            else:
+                num = den = 1
+                left_now = left
+
+            if remaining >= left_now:
+                # the whole lot: its exact remaining cost, nothing left behind
+                take_now, take, cost = left_now, left, cost_left[i]
+            else:
+                take_now = remaining
+                take = remaining if num == den else min(left, _div_round(remaining * den, num))
+                cost = _div_round(cost_left[i] * take, left)
+
+            undo.append((i, left, cost_left[i]))
+            qty_left[i] = left - take
+            cost_left[i] -= cost
+            remaining -= take_now
+            cost_total += cost
+
+            # proceeds by share of the sale; the last lot gets what's left
+            part = proceeds_left if not remaining else proceeds * take_now // to_sell
+            proceeds_left -= part
+            used.append((i, take_now, cost, part, left - take, cost_left[i]))
+            if not qty_left[i]:
+                i += 1
+
+        if remaining:
+            # put the lots back as they were, a failed sale changes nothing
+            for j, left, cost in undo:
+                qty_left[j] = left
+                cost_left[j] = cost
+            raise ValueError(
+                f"Not enough {self.symbol} shares to cover sale, short {remaining / QTY_SCALE:.8f}"
+            )
+
+        while self._head < n and not qty_left[self._head]:
+            self._head += 1
+        self._cost_left -= cost_total
+        self._qty_left -= to_sell
+
+        sale = ExactSale(date, to_sell, proceeds, cost_total, used, self)
+        self.sales.append(sale)
+        return sale
+
+    # ---- totals ----
+
+    def qty_left_units(self) -> int:
+        """
+        Open shares in today's units (after every split), QTY_SCALE units.
+        """
+        if not len(self.splits):
+            return self._qty_left
+        total = 0
+        factor = self.splits.factor
+        for i in range(self._head, len(self.qty_left)):
+            left = self.qty_left[i]
+            if left:
+                num, den = _ratio(factor(self.dates[i]))
+                total += left * num // den
+        return total
+
+    def cost_left_units(self) -> int:
+        return self._cost_left
+
+    def total_qty_left(self) -> float:
+        return self.qty_left_units() / QTY_SCALE
+
+    def total_cost_left(self) -> float:
+        return self._cost_left / MONEY_SCALE
+
+    def reconcile(self, bought: int, sold: int) -> Reconciliation:
+        """
+        Lots and sales against the broker's buy and sell totals for this
+        symbol, taken from the rows rather than from the position itself.
+        """
+        return Reconciliation(
+            bought=bought,
+            sold=sold,
+            cost_used=sum(used[2] for s in self.sales for used in s.lots_used),
+            cost_left=sum(self.cost_left),
+            proceeds=sum(s.proceeds for s in self.sales),
+            per_lot_proceeds=sum(used[3] for s in self.sales for used in s.lots_used),
+        )
@@ -3,7 +3,16 @@
 
 
 import csv
+import heapq
+import os
+from itertools import islice
+import pickle
+import tempfile
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
+
+from trade_table import TradeTable
 
 
 HEADERS = [
@@ -54,114 +63,545 @@ def _to_str(x):
     return s if s != "" else None
 
 
-def _parse_time(s: str) -> datetime:
+def _match_time(s: str):
+    """
+    Slow path: try every known format. Returns (datetime, fmt).
+    """
     s = s.strip()
     for fmt in _TIME_FORMATS:
         try:
-            return datetime.strptime(s, fmt)
+            return datetime.strptime(s, fmt), fmt
         except ValueError:
             pass
     raise ValueError(f"Unrecognised time format: {s}")
 
 
-def ingest_trading212_csv(path: str) -> list[dict]:
+def _parse_time(s: str) -> datetime:
+    return _match_time(s)[0]
+
+
+# fast parsers, one per entry in _TIME_FORMATS. Each checks the fixed
+# separator positions, reorders into ISO if needed and lets the C
+# fromisoformat do the digit parsing. None means "not this shape".
+
+def _fast_dmy_hm(s: str):
+    if len(s) == 16 and s[2] == "/" and s[5] == "/" and s[10] == " " and s[13] == ":":
+        return datetime.fromisoformat(f"{s[6:10]}-{s[3:5]}-{s[0:2]} {s[11:16]}")
+    return None
+
+
+def _fast_iso_hms(s: str):
+    if len(s) == 19 and s[4] == "-" and s[7] == "-" and s[10] == " " and s[13] == ":" and s[16] == ":":
+        return datetime.fromisoformat(s)
+    return None
+
+
+def _fast_ymd_slash_hms(s: str):
+    if len(s) == 19 and s[4] == "/" and s[7] == "/" and s[10] == " " and s[13] == ":" and s[16] == ":":
+        return datetime.fromisoformat(f"{s[0:4]}-{s[5:7]}-{s[8:19]}")
+    return None
+
+
+def _fast_iso_hm(s: str):
+    if len(s) == 16 and s[4] == "-" and s[7] == "-" and s[10] == " " and s[13] == ":":
+        return datetime.fromisoformat(s)
+    return None
+
+
+_FAST_TIME_PARSERS = {
+    "%d/%m/%Y %H:%M": _fast_dmy_hm,
+    "%Y-%m-%d %H:%M:%S": _fast_iso_hms,
+    "%Y/%m/%d %H:%M:%S": _fast_ymd_slash_hms,
+    "%Y-%m-%d %H:%M": _fast_iso_hm,
+}
+
+
+class TimeParser:
     """
-    Reads a Trading212 CSV and returns a list of dict rows with cleaned types,
-    filtered to only Market/Limit buys and sells.
+    Per-file timestamp parser.
+
+    The first `sample_size` rows go through the slow strptime loop. Once they
+    all agree on one format that format's fast parser is locked in, and the
+    slow loop is only used again for rows the fast parser can't handle.
     """
-    with open(path, "r", encoding="utf-8-sig", newline="") as f:
-        sample = f.read(4096)
-        f.seek(0)
-        dialect = csv.Sniffer().sniff(sample, delimiters=[",", ";", "\t"])
 
-        reader = csv.DictReader(f, dialect=dialect)
+    def __init__(self, sample_size: int = 5):
+        self.sample_size = sample_size
+        self.fmt = None
+        self.fast_hits = 0
+        self.fallbacks = 0
+
+        self._fast = None
+        self._seen_fmt = None
+        self._seen = 0
+
+    def __call__(self, s: str) -> datetime:
+        fast = self._fast
+        if fast is not None:
+            try:
+                dt = fast(s.strip())
+            except ValueError:
+                dt = None
+            if dt is not None:
+                self.fast_hits += 1
+                return dt
+            self.fallbacks += 1
+            return _parse_time(s)
+
+        dt, fmt = _match_time(s)
+        self._detect(fmt)
+        return dt
+
+    def column(self, cells) -> list:
+        """
+        Parse a whole column. Once a format is locked in, its fast parser is
+        mapped over the column in one go and only the cells it returns None
+        for go back through __call__.
+        """
+        fast = self._fast
+        if fast is None:
+            return [self(s) for s in cells]
+        try:
+            out = list(map(fast, cells))
+        except ValueError:
+            return [self(s) for s in cells]
+        misses = out.count(None)
+        self.fast_hits += len(out) - misses
+        if misses:
+            out = [dt if dt is not None else self(s) for dt, s in zip(out, cells)]
+        return out
+
+    def _detect(self, fmt: str):
+        if fmt != self._seen_fmt:
+            self._seen_fmt = fmt
+            self._seen = 0
+        self._seen += 1
+        if self._seen >= self.sample_size:
+            self.fmt = fmt
+            self._fast = _FAST_TIME_PARSERS[fmt]
+
+
+def _open_reader(f) -> csv.DictReader:
+    sample = f.read(4096)
+    f.seek(0)
+    dialect = csv.Sniffer().sniff(sample, delimiters=[",", ";", "\t"])
+
+    reader = csv.DictReader(f, dialect=dialect)
+
+    missing = [h for h in HEADERS if h not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Missing headers in CSV: {missing}")
+    return reader
+
+
+# the typed fields after action/action_type/order_type/time, in row key
+# order: row key -> (CSV header, coercion). Both _build_row (per cell) and
+# _build_batch (per column) are driven from this table.
+_FLOAT, _STR = "float", "str"
+_FIELDS = [
+    ("isin", "ISIN", _STR),
+    ("ticker", "Ticker", _STR),
+    ("name", "Name", _STR),
+    ("notes", "Notes", _STR),
+    ("id", "ID", _STR),
+    ("shares", "No. of shares", _FLOAT),
+    ("price_per_share", "Price / share", _FLOAT),
+    ("price_currency", "Currency (Price / share)", _STR),
+    ("exchange_rate", "Exchange rate", _FLOAT),
+    ("result", "Result", _FLOAT),
+    ("result_currency", "Currency (Result)", _STR),
+    ("total", "Total", _FLOAT),
+    ("total_currency", "Currency (Total)", _STR),
+    ("withholding_tax", "Withholding tax", _FLOAT),
+    ("withholding_tax_currency", "Currency (Withholding tax)", _STR),
+]
+
+_TO_CELL = {_FLOAT: _to_float, _STR: _to_str}
+
+# bump whenever a change to the parsing (_to_float, _to_str, the time
+# parsers, which rows are kept) changes the rows it produces for the same
+# file: import_cache sidecars written under another version are re-parsed
+PARSER_VERSION = 1
 
-        missing = [h for h in HEADERS if h not in (reader.fieldnames or [])]
-        if missing:
-            raise ValueError(f"Missing headers in CSV: {missing}")
 
-        rows = []
+def _build_row(raw: dict, keep_raw: bool = False, parse_time=_parse_time):
+    """
+    Turn one raw CSV dict into a typed row, or None if it's not a row we keep.
+    """
+    action_raw = _to_str(raw.get("Action"))
+    action_type, order_type = _classify_action(action_raw)
+
+    if action_type is None:
+        return None
+
+    if not raw.get("Time"):
+        return None
+
+    row = {
+        "action": action_raw,
+        "action_type": action_type,
+        "order_type": order_type,
+
+        "time": parse_time(raw["Time"]),
+    }
+    for key, header, kind in _FIELDS:
+        row[key] = _TO_CELL[kind](raw.get(header))
+
+    # the untouched csv dict roughly doubles the size of a row, so only on request
+    if keep_raw:
+        row["raw"] = raw
+
+    return row
+
+
+def _float_column(cells: list) -> list:
+    """
+    _to_float over a whole column. A column of clean numbers is one C-level
+    map(float); blanks and thousands separators take a second, still
+    branch-light pass, and only a column with something odd in it (stray
+    spaces, text) goes cell by cell.
+    """
+    try:
+        return list(map(float, cells))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return [float(c.replace(",", "")) if c else None for c in cells]
+    except ValueError:
+        return [_to_float(c) for c in cells]
+
+
+def _str_column(cells: list) -> list:
+    """
+    _to_str over a whole column (the csv module only yields str or None).
+    """
+    return [(c.strip() or None) if c else None for c in cells]
+
+
+_COERCE = {_FLOAT: _float_column, _STR: _str_column}
+
+
+def _classify_column(cells: list) -> list:
+    """
+    (action_type, order_type) per cell. Exports only use a handful of
+    distinct action strings, so each is classified once per batch.
+    """
+    seen: dict = {}
+    out = []
+    for c in cells:
+        kind = seen.get(c)
+        if kind is None:
+            kind = seen[c] = _classify_action(c)
+        out.append(kind)
+    return out
+
+
+def _build_batch(block: list[list], index: dict, width: int, parse_time) -> list[dict]:
+    """
+    A block of csv.reader rows -> the typed rows _build_row would give
+    (keep_raw aside), converting column by column instead of cell by cell.
+    """
+    block = [r if len(r) == width else (r + [None] * width)[:width] for r in block]
+    columns = list(zip(*block))
+
+    actions = columns[index["Action"]]
+    kinds = _classify_column(actions)
+    times = columns[index["Time"]]
+    keep = [i for i, (kind, t) in enumerate(zip(kinds, times)) if kind[0] is not None and t]
+    if not keep:
+        return []
+    if len(keep) < len(block):
+        pick = lambda col: [col[i] for i in keep]
+        kinds = pick(kinds)
+    else:
+        pick = list
+
+    names = ["action", "action_type", "order_type", "time"]
+    values = [
+        _str_column(pick(actions)),
+        [k[0] for k in kinds],
+        [k[1] for k in kinds],
+        parse_time.column(pick(times)),
+    ]
+    for key, header, kind in _FIELDS:
+        names.append(key)
+        values.append(_COERCE[kind](pick(columns[index[header]])))
+
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def _iter_batches(f, parse_time, batch_size: int):
+    """
+    Typed rows of an open export, converted batch_size raw rows at a time.
+    """
+    sample = f.read(4096)
+    f.seek(0)
+    dialect = csv.Sniffer().sniff(sample, delimiters=[",", ";", "\t"])
+    reader = csv.reader(f, dialect=dialect)
+
+    header = []
+    for header in reader:
+        if header:
+            break  # DictReader skips blank lines before the header too
+    missing = [h for h in HEADERS if h not in header]
+    if missing:
+        raise ValueError(f"Missing headers in CSV: {missing}")
+    # like DictReader, a repeated header name reads its last column
+    index = {h: i for i, h in enumerate(header)}
+    width = len(header)
+
+    # blank lines come through as empty rows; padded out they have no
+    # action, so they're dropped like DictReader drops them
+    while True:
+        block = list(islice(reader, batch_size))
+        if not block:
+            return
+        yield from _build_batch(block, index, width, parse_time)
+
+
+def _iter_rows(path: str, keep_raw: bool = False, batch_size: int = 4096):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        parse_time = TimeParser()
+        if not keep_raw:
+            yield from _iter_batches(f, parse_time, batch_size)
+            return
+
+        # the raw dicts have to be built per row anyway
+        reader = _open_reader(f)
         for raw in reader:
-            action_raw = _to_str(raw.get("Action"))
-            action_type, order_type = _classify_action(action_raw)
+            row = _build_row(raw, keep_raw, parse_time)
+            if row is not None:
+                yield row
 
-   
-            if action_type is None:
-                continue
 
-            row = {
-                "action": action_raw,         
-                "action_type": action_type,   
-                "order_type": order_type,     
+def _time_key(row: dict):
+    return row["time"]
 
-                "time": _parse_time(raw["Time"]) if raw.get("Time") else None,
 
-                "isin": _to_str(raw.get("ISIN")),
-                "ticker": _to_str(raw.get("Ticker")),
-                "name": _to_str(raw.get("Name")),
-                "notes": _to_str(raw.get("Notes")),
-                "id": _to_str(raw.get("ID")),
+def _spill_run(rows: list[dict]):
+    """
+    Sort a run of rows by time and write it to an anonymous temp file.
+    """
+    rows.sort(key=_time_key)
+    f = tempfile.TemporaryFile(mode="w+b")
+    for r in rows:
+        pickle.dump(r, f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
 
-                "shares": _to_float(raw.get("No. of shares")),
-                "price_per_share": _to_float(raw.get("Price / share")),
-                "price_currency": _to_str(raw.get("Currency (Price / share)")),
+def _read_run(f):
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
 
-                "exchange_rate": _to_float(raw.get("Exchange rate")),
-                "result": _to_float(raw.get("Result")),
-                "result_currency": _to_str(raw.get("Currency (Result)")),
 
-                "total": _to_float(raw.get("Total")),
-                "total_currency": _to_str(raw.get("Currency (Total)")),
+def _iter_sorted(rows, sort_buffer: int):
+    """
+    Yield rows ordered by time, holding at most sort_buffer rows in memory.
 
-                "withholding_tax": _to_float(raw.get("Withholding tax")),
-                "withholding_tax_currency": _to_str(raw.get("Currency (Withholding tax)")),
+    Small inputs are sorted in place; anything bigger is split into sorted runs
+    on disk and k-way merged back. heapq.merge is stable, so ties keep file
+    order exactly like list.sort does.
+    """
+    runs = []
+    buf: list[dict] = []
+    try:
+        for r in rows:
+            buf.append(r)
+            if len(buf) >= sort_buffer:
+                runs.append(_spill_run(buf))
+                buf = []
+
+        if not runs:
+            buf.sort(key=_time_key)
+            yield from buf
+            return
+
+        if buf:
+            runs.append(_spill_run(buf))
+            buf = []
+
+        yield from heapq.merge(*(_read_run(f) for f in runs), key=_time_key)
+    finally:
+        for f in runs:
+            f.close()
+
+
+def _chunked(rows, chunk_size: int):
+    chunk = []
+    for r in rows:
+        chunk.append(r)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_trading212_csv(
+    path: str,
+    chunk_size: Optional[int] = None,
+    sort: bool = False,
+    keep_raw: bool = False,
+    sort_buffer: int = 100_000,
+    cache=None,
+):
+    """
+    Streams a Trading212 CSV as cleaned dict rows instead of loading it all.
+
+    chunk_size: yield lists of up to chunk_size rows rather than single rows.
+    sort: yield in time order. Files over sort_buffer rows are sorted with an
+          external merge sort through temp files so memory stays bounded.
+    keep_raw: also keep the original csv dict under "raw".
+    cache: an import_cache.ImportCache to read the rows through (hit or
+           miss, it streams; not used with keep_raw).
+    """
+    if chunk_size is not None and chunk_size <= 0:
+        raise ValueError("chunk_size must be > 0")
+    if sort_buffer <= 0:
+        raise ValueError("sort_buffer must be > 0")
 
-                "raw": raw,
-            }
+    if cache is not None and not keep_raw:
+        rows = cache.iter_rows(path)
+    else:
+        rows = _iter_rows(path, keep_raw)
+    if sort:
+        rows = _iter_sorted(rows, sort_buffer)
 
-          
-            if row["time"] is None:
-                continue
+    if chunk_size is None:
+        yield from rows
+    else:
+        yield from _chunked(rows, chunk_size)
 
-            rows.append(row)
 
-    rows.sort(key=lambda r: r["time"])
+def ingest_trading212_csv(path: str, keep_raw: bool = False, cache=None) -> list[dict]:
+    """
+    Reads a Trading212 CSV and returns a list of dict rows with cleaned types,
+    filtered to only Market/Limit buys and sells. cache: see iter_trading212_csv.
+    """
+    if cache is not None and not keep_raw:
+        rows = cache.rows(path)
+    else:
+        rows = list(_iter_rows(path, keep_raw))
+    rows.sort(key=_time_key)
     return rows
 
 
-def _classify_action(action: str):
+def _parse_sorted(path: str) -> tuple[list, list]:
     """
-    Return (action_type, order_type) or (None, None) if not a trade we care about.
+    Pool worker: one export's rows, time-sorted, as (keys, value tuples).
+    Sending tuples back instead of dicts keeps the keys out of the pickle.
     """
-    if not action:
-        return None, None
+    rows = ingest_trading212_csv(path)
+    keys = list(rows[0]) if rows else []
+    return keys, [tuple(r.values()) for r in rows]
 
-    a = action.strip().lower()
-    print (a)
-    # only accept buy/sell rows
-    if a in {"market buy", "limit buy"}:
-        return "BUY", "MARKET" if "market" in a else "LIMIT"
-    if a in {"market sell", "limit sell"}:
-        return "SELL", "MARKET" if "market" in a else "LIMIT"
-    if a in {"dividend (dividend)", "dividend (dividend manufactured payment)"}:
-        return "Dividend", None if "manufactured" not in a else "Manufactured"
-    if a in {"deposit"}:
-        return "Deposit", None
-    if a in {"withdrawal"}:
-        return "Withdrawal", None
-    if a in {"interest on cash"}:
-        return "Interest", None
 
-    return None, None
+def _unpack(result) -> Iterable[dict]:
+    keys, values = result if isinstance(result, tuple) else result.result()
+    for v in values:
+        yield dict(zip(keys, v))
 
 
+def _dedupe(rows: Iterable[dict]):
+    """
+    Drop rows whose ID was already yielded, for exports with overlapping
+    date windows. Rows without an ID are kept.
+    """
+    seen = set()
+    for r in rows:
+        key = r["id"]
+        if key is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        yield r
+
+
+def iter_trading212_files(
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    dedupe: bool = True,
+):
+    """
+    Streams several Trading212 CSVs as one time-sorted run of cleaned rows.
+
+    Each file is parsed and sorted in its own process (workers, default one
+    per core), then the sorted files are k-way merged by time. Equal times
+    keep the order of `paths`, and with dedupe a row whose ID was already
+    seen in an earlier one (overlapping export windows) is dropped.
+    """
+    paths = list(paths)
+    if chunk_size is not None and chunk_size <= 0:
+        raise ValueError("chunk_size must be > 0")
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+
+    ex = None
+    try:
+        if workers > 1:
+            ex = ProcessPoolExecutor(max_workers=workers)
+            results = [ex.submit(_parse_sorted, p) for p in paths]
+        else:
+            results = [_parse_sorted(p) for p in paths]
+
+        rows = heapq.merge(*map(_unpack, results), key=_time_key)
+        if dedupe:
+            rows = _dedupe(rows)
+
+        if chunk_size is None:
+            yield from rows
+        else:
+            yield from _chunked(rows, chunk_size)
+    finally:
+        if ex is not None:
+            ex.shutdown(cancel_futures=True)
+
+
+def ingest_trading212_columns(path: str) -> TradeTable:
+    """
+    Same rows as ingest_trading212_csv, time-sorted, but returned as a
+    columnar TradeTable instead of a list of dicts.
+    """
+    return TradeTable.from_rows(iter_trading212_csv(path, sort=True))
+
+
+# lower-cased action -> (action_type, order_type); anything else isn't kept
+_ACTIONS = {
+    "market buy": ("BUY", "MARKET"),
+    "limit buy": ("BUY", "LIMIT"),
+    "market sell": ("SELL", "MARKET"),
+    "limit sell": ("SELL", "LIMIT"),
+    "dividend (dividend)": ("Dividend", None),
+    "dividend (dividend manufactured payment)": ("Dividend", "Manufactured"),
+    "deposit": ("Deposit", None),
+    "withdrawal": ("Withdrawal", None),
+    "interest on cash": ("Interest", None),
+}
+_NOT_KEPT = (None, None)
+
+
+def _classify_action(action: str):
+    """
+    Return (action_type, order_type) or (None, None) if not a trade we care about.
+    """
+    if not action:
+        return _NOT_KEPT
+    return _ACTIONS.get(action.strip().lower(), _NOT_KEPT)
+
 
 
 def _main():
+    from import_cache import ImportCache
+
     path = "T212_2501-2512.csv"  # change if needed
-    rows = ingest_trading212_csv(path)
+    cache = ImportCache()
+    rows = ingest_trading212_csv(path, cache=cache)
 
-    print(f"Loaded rows: {len(rows)}")
+    print(f"Loaded rows: {len(rows)}  cache: {cache.stats}")
     print("First row:", rows[0])
     print("Last row:", rows[-1])
 
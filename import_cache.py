@@ -0,0 +1,319 @@
+# parsed-export cache: typed rows of a CSV kept in a binary sidecar file
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from itertools import islice
+from typing import Optional
+
+from column_file import StringTable, decode_strings, read_columns, write_columns
+from file_import import _ACTIONS, _FIELDS, _FLOAT, PARSER_VERSION, _iter_rows
+from models import from_us, to_us
+
+
+# file layout, little endian: a column_file with the header
+#   magic(4) version(u16) pad(u16) size(u64) mtime_ns(i64)
+#   columns(u32) pad(u32) sha256(32) schema(8)
+#
+# One column per row field. Strings are codes into a deduplicated string
+# table (-1 = None); float columns have a "<key> null" mask next to them
+# since None and a parsed NaN are different things.
+_MAGIC = b"T212"
+_VERSION = 2
+_HEADER = struct.Struct("<4sHHQqI4x32s8s")
+
+_STRING_KEYS = ("action", "action_type", "order_type")
+_ROW_KEYS = (*_STRING_KEYS, "time", *(key for key, _, _ in _FIELDS))
+_FLOAT_KEYS = tuple(key for key, _, kind in _FIELDS if kind == _FLOAT)
+_CODE_KEYS = tuple(key for key in _ROW_KEYS if key != "time" and key not in _FLOAT_KEYS)
+
+_COLUMNS = (
+    ("source", "B"),       # utf-8 absolute path of the CSV, to catch name clashes
+    ("strings", "B"),      # utf-8 bytes of every string
+    ("string_ends", "q"),  # end offset of string i in "strings"
+    ("time", "q"),         # models.to_us
+    *((key, "d") for key in _FLOAT_KEYS),
+    *((key + " null", "B") for key in _FLOAT_KEYS),
+    *((key, "i") for key in _CODE_KEYS),
+)
+
+# what the parser produces; a sidecar written under any other is stale.
+# Changes to _FIELDS or _ACTIONS show up here by themselves, changes to
+# how a cell is coerced go through file_import.PARSER_VERSION.
+_SCHEMA = hashlib.sha256(
+    repr((PARSER_VERSION, _ROW_KEYS, _FIELDS, sorted(_ACTIONS.items()))).encode()
+).digest()[:8]
+
+
+@dataclass
+class ImportCacheStats:
+    hits: int = 0
+    misses: int = 0
+    rehashed: int = 0       # hits where size/mtime changed but the content didn't
+    parse_seconds: float = 0.0
+    write_seconds: float = 0.0
+    load_seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def _digest(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.digest()
+
+
+class _Columns:
+    """
+    Rows of one CSV gathered into sidecar columns as they're parsed, so a
+    miss holds compact arrays rather than the row dicts until it's written.
+    """
+
+    def __init__(self, source: str):
+        self.cols = {name: array(code) for name, code in _COLUMNS}
+        self.strings = StringTable()
+        self.cols["source"].frombytes(source.encode("utf-8"))
+
+    def add(self, rows: list[dict]):
+        cols = self.cols
+        cols["time"].extend([to_us(r["time"]) for r in rows])
+        for key in _FLOAT_KEYS:
+            values = [r[key] for r in rows]
+            cols[key].extend([0.0 if v is None else v for v in values])
+            cols[key + " null"].extend([v is None for v in values])
+        for key in _CODE_KEYS:
+            cols[key].extend(self.strings.codes(r[key] for r in rows))
+
+    def write(self, path: str, size: int, mtime_ns: int, digest: bytes):
+        cols = self.cols
+        cols["strings"], cols["string_ends"] = self.strings.columns()
+        header = _HEADER.pack(_MAGIC, _VERSION, 0, size, mtime_ns, len(_COLUMNS), digest, _SCHEMA)
+        write_columns(path, header, [(name, cols[name]) for name, _ in _COLUMNS])
+
+
+def _read_header(path: str):
+    """
+    (size, mtime_ns, digest) of a sidecar, or None if it's missing or
+    not one this version of the format and parser wrote.
+    """
+    try:
+        with open(path, "rb") as f:
+            raw = f.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(raw) < _HEADER.size:
+        return None
+    magic, version, _, size, mtime_ns, count, digest, schema = _HEADER.unpack(raw)
+    if magic != _MAGIC or version != _VERSION or count != len(_COLUMNS) or schema != _SCHEMA:
+        return None
+    return size, mtime_ns, digest
+
+
+class _Sidecar:
+    """
+    A sidecar's columns, memory-mapped, read back as row dicts a slice at
+    a time. open() checks the whole file up front, so reading rows can't
+    fail halfway.
+    """
+
+    def __init__(self, mm: mmap.mmap, cols: dict, table: list):
+        self.mm = mm
+        self.cols = cols
+        self.table = table
+
+    @classmethod
+    def open(cls, path: str, source: str) -> Optional["_Sidecar"]:
+        """
+        None if the sidecar belongs to another CSV; a damaged file raises
+        (ValueError, struct.error, ...).
+        """
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        sidecar = cls(mm, {}, [])
+        try:
+            sidecar.cols = cols = read_columns(mm, _HEADER.size, _COLUMNS)
+            n = len(cols["time"])
+            if (bytes(cols["source"]).decode("utf-8") != source
+                    or any(len(cols[name]) != n for name, _ in _COLUMNS[3:])):
+                sidecar.close()
+                return None
+            sidecar.table = decode_strings(cols["strings"], cols["string_ends"])
+            top = len(sidecar.table) - 1  # the last entry is code -1
+            for name in _CODE_KEYS:
+                if n and not (-1 <= min(cols[name]) and max(cols[name]) < top):
+                    raise ValueError(f"{path}: {name} has codes outside the string table")
+        except BaseException:
+            sidecar.close()
+            raise
+        return sidecar
+
+    def __len__(self):
+        return len(self.cols["time"])
+
+    def rows(self, lo: int, hi: int) -> list[dict]:
+        cols, table = self.cols, self.table
+        values = []
+        for key in _ROW_KEYS:
+            if key == "time":
+                values.append(list(map(from_us, cols["time"][lo:hi])))
+            elif key in _FLOAT_KEYS:
+                col, null = cols[key][lo:hi].tolist(), cols[key + " null"][lo:hi]
+                if any(null):
+                    col = [None if m else v for v, m in zip(col, null)]
+                values.append(col)
+            else:
+                values.append(list(map(table.__getitem__, cols[key][lo:hi])))
+        return [dict(zip(_ROW_KEYS, r)) for r in zip(*values)]
+
+    def close(self):
+        for col in self.cols.values():
+            col.release()
+        self.cols = {}
+        self.mm.close()
+
+
+class ImportCache:
+    """
+    Typed rows of Trading212 exports, parsed once and kept in a binary
+    sidecar (columnar arrays plus a string table). A sidecar is used while
+    the CSV's size and mtime match; if only the mtime moved, the content
+    hash decides, so a touched-but-unchanged file still hits and an edited
+    one is re-parsed. verify=True hashes on every read.
+
+        cache = ImportCache()
+        rows = cache.rows("T212_2501-2512.csv")   # same as list(_iter_rows(path))
+        print(cache.stats)
+
+    Sidecars go next to the CSV as <name>.t212cache, or into `directory`.
+    One cache can serve loads on several threads at once.
+    """
+
+    SUFFIX = ".t212cache"
+
+    def __init__(self, directory: Optional[str] = None, verify: bool = False):
+        self.directory = directory
+        self.verify = verify
+        self.stats = ImportCacheStats()
+        self._lock = threading.Lock()  # stats are shared by loads on other threads
+
+    def sidecar(self, path: str) -> str:
+        if self.directory is None:
+            return path + self.SUFFIX
+        source = os.path.abspath(path)
+        tag = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{os.path.basename(path)}.{tag}{self.SUFFIX}")
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self.stats, name, getattr(self.stats, name) + delta)
+
+    def _cached(self, path: str, side: str, st) -> tuple[Optional[_Sidecar], Optional[bytes]]:
+        """
+        (sidecar, None) if it's current, else (None, digest if it was
+        already worked out).
+        """
+        header = _read_header(side)
+        if header is None or header[0] != st.st_size:
+            return None, None
+
+        digest = None
+        fresh = header[1] == st.st_mtime_ns and not self.verify
+        if not fresh:
+            digest = _digest(path)
+            fresh = digest == header[2]
+            if fresh and header[1] != st.st_mtime_ns:
+                self._count(rehashed=1)
+                self._touch(side, st.st_mtime_ns)
+        if not fresh:
+            return None, digest
+
+        try:
+            sidecar = _Sidecar.open(side, os.path.abspath(path))
+        except (OSError, ValueError, TypeError, struct.error):
+            sidecar = None  # cut short or damaged: parse it again
+        if sidecar is not None:
+            self._count(hits=1)
+        return sidecar, digest
+
+    def iter_rows(self, path: str, batch_size: int = 4096):
+        """
+        The file's rows in file order, batch_size at a time either way:
+        read off the memory-mapped sidecar when it's current, otherwise
+        parsed, with the sidecar written once the last row has been read
+        (a caller that stops early leaves no sidecar behind). A parse keeps
+        what it read as sidecar columns until then, far smaller than the
+        rows themselves but still the whole file.
+        """
+        side = self.sidecar(path)
+        st = os.stat(path)
+        sidecar, digest = self._cached(path, side, st)
+        if sidecar is not None:
+            try:
+                for lo in range(0, len(sidecar), batch_size):
+                    t0 = time.perf_counter()
+                    batch = sidecar.rows(lo, lo + batch_size)
+                    self._count(load_seconds=time.perf_counter() - t0)
+                    yield from batch
+            finally:
+                sidecar.close()
+            return
+
+        self._count(misses=1)
+        t0 = time.perf_counter()
+        if digest is None:
+            digest = _digest(path)
+        parse = _iter_rows(path)
+        columns = _Columns(os.path.abspath(path))
+        while True:
+            batch = list(islice(parse, batch_size))
+            self._count(parse_seconds=time.perf_counter() - t0)
+            if not batch:
+                break
+            t0 = time.perf_counter()
+            columns.add(batch)
+            self._count(write_seconds=time.perf_counter() - t0)
+            yield from batch
+            t0 = time.perf_counter()
+
+        # only trust what was parsed if the file didn't move underneath us
+        after = os.stat(path)
+        if (after.st_size, after.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+            t0 = time.perf_counter()
+            try:
+                if self.directory is not None:
+                    os.makedirs(self.directory, exist_ok=True)
+                columns.write(side, st.st_size, st.st_mtime_ns, digest)
+            except OSError:
+                pass  # read-only export folder etc.: just don't cache
+            self._count(write_seconds=time.perf_counter() - t0)
+
+    def rows(self, path: str) -> list[dict]:
+        return list(self.iter_rows(path))
+
+    def _touch(self, side: str, mtime_ns: int):
+        """
+        Record the CSV's new mtime so the next read skips the hash.
+        """
+        try:
+            with open(side, "r+b") as f:
+                f.seek(struct.calcsize("<4sHHQ"))
+                f.write(struct.pack("<q", mtime_ns))
+        except OSError:
+            pass
+
+    def clear(self, path: str):
+        try:
+            os.remove(self.sidecar(path))
+        except FileNotFoundError:
+            pass
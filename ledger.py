@@ -0,0 +1,390 @@
+# replays ingested Trading212 rows into Positions, with checkpoints between imports
+
+import os
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable, Optional
+
+from cgt import CGTReport
+from exact import MONEY_SCALE, ExactPosition, to_fixed
+from file_import import iter_trading212_csv, iter_trading212_files
+from positions import Position
+
+
+CHECKPOINT_VERSION = 1
+
+# Irish CGT: a disposal is matched first with shares bought in the 4 weeks after it
+BNB_WINDOW = timedelta(weeks=4)
+
+
+@dataclass
+class ImportStats:
+    applied: int = 0
+    duplicates: int = 0
+    skipped: int = 0       # not a BUY/SELL, or no ticker
+    splits: int = 0
+
+
+def row_key(row: dict) -> str:
+    """
+    Dedupe key: the Trading212 ID, or the trade's fields if it has none.
+    """
+    if row.get("id"):
+        return row["id"]
+    return "|".join(str(row.get(k)) for k in ("time", "action_type", "ticker", "shares", "total"))
+
+
+def _naive(d) -> datetime:
+    """
+    Split dates from yfinance are tz-aware pandas Timestamps; lots are naive.
+    """
+    if isinstance(d, datetime):
+        return d.replace(tzinfo=None)
+    if isinstance(d, date):
+        return datetime(d.year, d.month, d.day)
+    return datetime.fromisoformat(str(d)).replace(tzinfo=None)
+
+
+def _replay_partition(task) -> dict:
+    """
+    Worker side of the parallel replay: one ticker's rows on top of its
+    compact state, returned as compact state again.
+    """
+    state, compact, rows = task
+    pos = Position.from_state(state, compact)
+    for is_buy, key, time, shares, price, fx, total in rows:
+        if is_buy:
+            pos.add_buy(key, time, shares, price, fx, total)
+        else:
+            pos.sell(time, shares, total)
+    return pos.to_state()
+
+
+class Ledger:
+    """
+    Per-ticker Positions built from BUY/SELL rows.
+
+    Every row is remembered by its ID, so re-importing an overlapping export
+    is a no-op for rows already seen. save()/load() checkpoint the whole
+    state so a new monthly export only replays its own rows.
+
+    split_source is called with a ticker (mapped through symbol_map) and
+    returns {date: factor}, e.g. market_data.get_split_data.
+
+    bed_and_breakfast=True matches sells with the 4-week rule. A sell can't
+    be matched until every buy in the 4 weeks after it is known, so sells
+    wait in `pending` and are settled in date order once the ledger has
+    trades past their window (or by settle(final=True), e.g. for a report
+    on the current year). Positions don't reflect a sell until it settles.
+
+    exact=True keeps ExactPositions (integer shares and cents) instead, for
+    figures that reconcile to the broker's totals to the cent. It's plain
+    FIFO, replayed serially. ExactPositions have no to_state(), so they
+    can't go into a snapshot.py file or TradeStore; save()/load() them.
+    """
+
+    def __init__(self, compact: bool = False, symbol_map: Optional[dict[str, str]] = None,
+                 bed_and_breakfast: bool = False, exact: bool = False):
+        if exact and bed_and_breakfast:
+            raise ValueError("exact mode only does plain FIFO matching")
+        self.compact = compact
+        self.exact = exact
+        self.bed_and_breakfast = bed_and_breakfast
+        self.symbol_map = dict(symbol_map or {})
+        self.positions: dict[str, Position] = {}
+        self.seen_ids: set[str] = set()
+        self.last_time: Optional[datetime] = None
+        self.splits_applied: dict[str, set[tuple[datetime, float]]] = {}
+        self.cgt = CGTReport()
+
+        # bed_and_breakfast: per ticker, sells waiting for their window to close
+        self.pending: dict[str, deque] = {}
+
+        # exact: per ticker, [bought, sold] from the rows' Total, MONEY_SCALE units
+        self.broker_totals: dict[str, list[int]] = {}
+
+    def position(self, ticker: str) -> Position:
+        pos = self.positions.get(ticker)
+        if pos is None:
+            if self.exact:
+                pos = self.positions[ticker] = ExactPosition(ticker)
+            else:
+                pos = self.positions[ticker] = Position(ticker, compact=self.compact)
+        return pos
+
+    # ---- splits ----
+
+    def apply_splits(self, ticker: str, splits) -> int:
+        """
+        Apply {date: factor} splits to a ticker, skipping ones already in.
+        """
+        done = self.splits_applied.setdefault(ticker, set())
+        items = splits.items() if hasattr(splits, "items") else splits
+        added = 0
+        for d, factor in items:
+            key = (_naive(d), float(factor))
+            if key in done or key[1] == 1.0:
+                continue
+            self.position(ticker).apply_split(key[1], key[0])
+            done.add(key)
+            added += 1
+        return added
+
+    def load_splits(self, tickers: Iterable[str], split_source: Callable) -> int:
+        added = 0
+        for ticker in tickers:
+            added += self.apply_splits(ticker, split_source(self.symbol_map.get(ticker, ticker)))
+        return added
+
+    # ---- replay ----
+
+    def apply_row(self, row: dict) -> bool:
+        """
+        Replay one typed row. Returns False for duplicates and non-trades.
+        """
+        if row.get("action_type") not in ("BUY", "SELL") or not row.get("ticker"):
+            return False
+        key = row_key(row)
+        if key in self.seen_ids:
+            return False
+
+        pos = self.position(row["ticker"])
+        if self.bed_and_breakfast and row["action_type"] == "SELL":
+            self.pending.setdefault(row["ticker"], deque()).append((row["time"], row["shares"], row["total"]))
+        elif row["action_type"] == "BUY":
+            pos.add_buy(
+                key,
+                row["time"],
+                row["shares"],
+                row["price_per_share"],
+                row["exchange_rate"],
+                row["total"],
+            )
+        else:
+            pos.sell(row["time"], row["shares"], row["total"])
+
+        if self.exact and row["total"] is not None:
+            totals = self.broker_totals.setdefault(row["ticker"], [0, 0])
+            totals[row["action_type"] == "SELL"] += to_fixed(row["total"], MONEY_SCALE)
+
+        self.seen_ids.add(key)
+        if self.last_time is None or row["time"] > self.last_time:
+            self.last_time = row["time"]
+        return True
+
+    def settle(self, final: bool = False) -> int:
+        """
+        bed_and_breakfast: match the pending sells whose 4-week window has
+        passed (all of them with final=True). Returns how many settled.
+        """
+        settled = 0
+        for ticker, queue in self.pending.items():
+            pos = self.positions[ticker]
+            while queue and (final or queue[0][0] + BNB_WINDOW <= self.last_time):
+                # only dropped once it's sold: a sale that raises stays pending
+                time, shares, total = queue[0]
+                pos.sell(time, shares, total, bnb_window=BNB_WINDOW)
+                queue.popleft()
+                settled += 1
+        return settled
+
+    def pending_sales(self) -> int:
+        return sum(len(q) for q in self.pending.values())
+
+    def _replay_parallel(self, rows: list[dict], workers: int, stats: ImportStats):
+        """
+        FIFO matching only ever looks at one ticker, so each ticker's rows
+        are replayed in their own process. Positions travel as to_state()
+        arrays both ways, and results are put back in first-seen ticker order,
+        so the outcome is the same as the serial replay.
+        """
+        parts: dict[str, list] = {}
+        keys = []
+        batch = set()
+        last = None
+        for row in rows:
+            key = row_key(row)
+            if key in batch:
+                stats.duplicates += 1
+                continue
+            batch.add(key)
+            keys.append(key)
+            last = row["time"]
+            parts.setdefault(row["ticker"], []).append((
+                row["action_type"] == "BUY", key, row["time"], row["shares"],
+                row["price_per_share"], row["exchange_rate"], row["total"],
+            ))
+
+        for ticker in parts:
+            self.position(ticker)
+
+        # biggest partitions first so one long ticker doesn't start last
+        order = sorted(parts, key=lambda t: -len(parts[t]))
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futures = {
+                t: ex.submit(_replay_partition, (self.positions[t].to_state(), self.compact, parts[t]))
+                for t in order
+            }
+            states = {t: f.result() for t, f in futures.items()}
+
+        for ticker in parts:
+            self.positions[ticker] = Position.from_state(states[ticker], self.compact)
+
+        self.seen_ids.update(keys)
+        if last is not None and (self.last_time is None or last > self.last_time):
+            self.last_time = last
+        stats.applied += len(keys)
+
+    def import_rows(self, rows: Iterable[dict], split_source: Optional[Callable] = None,
+                    workers: Optional[int] = None) -> ImportStats:
+        """
+        Replay time-sorted rows. New rows older than the last replayed trade
+        would change FIFO history that's already settled, so that raises;
+        rebuild from an empty Ledger instead.
+
+        workers > 1 replays tickers in parallel processes. If a sale fails
+        there, no position from this import is updated. bed_and_breakfast
+        and exact ledgers always replay serially.
+        """
+        stats = ImportStats()
+        new = []
+        for row in rows:
+            if row.get("action_type") not in ("BUY", "SELL") or not row.get("ticker"):
+                stats.skipped += 1
+            elif row_key(row) in self.seen_ids:
+                stats.duplicates += 1
+            else:
+                new.append(row)
+
+        new.sort(key=lambda r: r["time"])
+        if new and self.last_time is not None and new[0]["time"] < self.last_time:
+            raise ValueError(
+                f"Row {row_key(new[0])} at {new[0]['time']} is older than the checkpoint "
+                f"({self.last_time}); rebuild the ledger from all exports"
+            )
+
+        # splits first, so sells after a split see it
+        if split_source is not None:
+            tickers = {r["ticker"] for r in new} | set(self.positions)
+            stats.splits = self.load_splits(sorted(tickers), split_source)
+
+        if workers is not None and workers > 1 and not (self.bed_and_breakfast or self.exact):
+            self._replay_parallel(new, workers, stats)
+            return stats
+
+        for row in new:
+            # rows repeated inside one export still only count once
+            if self.apply_row(row):
+                stats.applied += 1
+            else:
+                stats.duplicates += 1
+
+        if self.bed_and_breakfast and self.last_time is not None:
+            self.settle()
+        return stats
+
+    def import_csv(self, path: str, split_source: Optional[Callable] = None,
+                   workers: Optional[int] = None) -> ImportStats:
+        return self.import_rows(iter_trading212_csv(path, sort=True), split_source, workers)
+
+    def reconcile(self) -> dict:
+        """
+        exact: per-ticker check that lots and sales add back to the buy and
+        sell totals in the replayed rows (exact.Reconciliation).
+        """
+        if not self.exact:
+            raise ValueError("reconcile() needs an exact ledger")
+        return {
+            ticker: pos.reconcile(*self.broker_totals.get(ticker, (0, 0)))
+            for ticker, pos in self.positions.items()
+        }
+
+    def cgt_report(self) -> CGTReport:
+        """
+        The CGT report, brought up to date with sales replayed since the
+        last call.
+        """
+        self.cgt.update(self.positions.values())
+        return self.cgt
+
+    # ---- checkpoints ----
+
+    def save(self, path: str):
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "compact": self.compact,
+            "exact": self.exact,
+            "symbol_map": self.symbol_map,
+            "positions": self.positions,
+            "seen_ids": self.seen_ids,
+            "last_time": self.last_time,
+            "splits_applied": self.splits_applied,
+            "cgt": self.cgt,
+            "bed_and_breakfast": self.bed_and_breakfast,
+            "pending": self.pending,
+            "broker_totals": self.broker_totals,
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Ledger":
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"{path}: unsupported checkpoint version {state.get('version')}")
+
+        ledger = cls(compact=state["compact"], symbol_map=state["symbol_map"], exact=state.get("exact", False))
+        ledger.positions = state["positions"]
+        ledger.seen_ids = state["seen_ids"]
+        ledger.last_time = state["last_time"]
+        ledger.splits_applied = state["splits_applied"]
+        # older checkpoints have no report, it's rebuilt on first use
+        ledger.cgt = state.get("cgt") or CGTReport()
+        ledger.bed_and_breakfast = state.get("bed_and_breakfast", False)
+        ledger.pending = state.get("pending", {})
+        ledger.broker_totals = state.get("broker_totals", {})
+        return ledger
+
+
+def update_ledger(checkpoint_path: str, csv_paths: Iterable[str],
+                  split_source: Optional[Callable] = None, import_workers: Optional[int] = None,
+                  **kwargs) -> tuple[Ledger, ImportStats]:
+    """
+    Load the checkpoint (or start fresh), import the exports, save it back.
+
+    The exports are parsed in parallel (import_workers processes, default
+    one per core) and merged by time, so they can be given in any order.
+    Rows repeated across overlapping exports count as duplicates.
+
+    kwargs are Ledger settings for a fresh ledger. An existing checkpoint
+    keeps the settings it was built with, so asking for different ones
+    raises rather than being ignored; rebuild from the exports instead.
+    """
+    if os.path.exists(checkpoint_path):
+        ledger = Ledger.load(checkpoint_path)
+        conflicts = {}
+        for name, value in kwargs.items():
+            if name not in ("compact", "symbol_map", "bed_and_breakfast", "exact"):
+                raise TypeError(f"update_ledger() got an unexpected keyword argument {name!r}")
+            if name == "symbol_map":
+                value = dict(value or {})
+            if getattr(ledger, name) != value:
+                conflicts[name] = (value, getattr(ledger, name))
+        if conflicts:
+            wanted = ", ".join(f"{k}={v!r} (checkpoint has {c!r})" for k, (v, c) in conflicts.items())
+            raise ValueError(f"{checkpoint_path} was built with other settings: {wanted}")
+    else:
+        ledger = Ledger(**kwargs)
+
+    rows = iter_trading212_files(csv_paths, workers=import_workers, dedupe=False)
+    total = ledger.import_rows(rows, split_source)
+
+    ledger.cgt_report()
+    ledger.save(checkpoint_path)
+    return ledger, total
@@ -0,0 +1,193 @@
+# caching layer in front of a market_data provider
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from market_data import Quote
+
+
+# seconds each kind of answer stays fresh
+DEFAULT_TTLS = {
+    "price": 15.0,
+    "fx": 60.0,
+    "currency": 7 * 86400.0,
+    "etf": 7 * 86400.0,
+    "splits": 86400.0,
+    "history": 3600.0,   # a range ending today can still gain a close
+}
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0   # callers that waited on someone else's fetch
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses + self.coalesced
+        return (self.hits + self.coalesced) / total if total else 0.0
+
+
+class _InFlight:
+    """
+    A fetch in progress that other threads can wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class CachingProvider:
+    """
+    Wraps another provider (YahooProvider, StaticProvider, ...) with a TTL +
+    LRU cache. Entries expire per kind (see DEFAULT_TTLS), the cache holds
+    at most max_entries, and concurrent misses on the same key share one
+    fetch. Errors are never cached.
+
+        set_provider(CachingProvider(YahooProvider()))
+    """
+
+    def __init__(self, inner, ttls=None, max_entries: int = 10_000, clock=time.monotonic):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be > 0")
+        self.inner = inner
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.clock = clock
+        self.stats = CacheStats()
+
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._inflight: dict = {}
+        self._lock = threading.Lock()
+
+    # ---- cache core ----
+
+    def _lookup(self, key):
+        """
+        Fresh cached value or None. Caller holds the lock.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value):
+        """
+        Caller holds the lock.
+        """
+        self._entries[key] = (self.clock() + self.ttls[key[0]], value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _get(self, kind: str, arg, fetch):
+        key = (kind, arg)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.stats.hits += 1
+                return entry[1]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _InFlight()
+                self.stats.misses += 1
+            else:
+                self.stats.coalesced += 1
+
+        if not leader:
+            return flight.result()
+
+        try:
+            value = fetch()
+        except Exception as e:
+            flight.error = e
+            raise
+        else:
+            flight.value = value
+            with self._lock:
+                self._store(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---- provider interface ----
+
+    def price(self, symbol: str) -> float:
+        return self._get("price", symbol, lambda: self.inner.price(symbol))
+
+    def currency(self, symbol: str) -> str:
+        return self._get("currency", symbol, lambda: self.inner.currency(symbol))
+
+    def fx_rate(self, from_currency: str, to_currency: str) -> float:
+        pair = (from_currency.upper(), to_currency.upper())
+        return self._get("fx", pair, lambda: self.inner.fx_rate(*pair))
+
+    def is_etf(self, symbol: str) -> bool:
+        return self._get("etf", symbol, lambda: self.inner.is_etf(symbol))
+
+    def split_data(self, symbol: str):
+        return self._get("splits", symbol, lambda: self.inner.split_data(symbol))
+
+    def history(self, symbol: str, start, end):
+        return self._get("history", (symbol, start, end), lambda: self.inner.history(symbol, start, end))
+
+    def fetch_quotes(self, symbols: list[str]) -> dict[str, Quote]:
+        """
+        Serves what it can from the price/currency entries and sends one
+        batch for the rest, passing along the currencies it already has so
+        the inner provider only looks up the others. Results are cached for
+        later single lookups too.
+        """
+        out = {}
+        missing = []
+        known = {}
+        with self._lock:
+            for sym in symbols:
+                price = self._lookup(("price", sym))
+                currency = self._lookup(("currency", sym))
+                if price is None:
+                    missing.append(sym)
+                    self.stats.misses += 1
+                    if currency is not None:
+                        known[sym] = currency[1]
+                    continue
+                self.stats.hits += 1
+                out[sym] = Quote(sym, price[1], currency[1] if currency else None)
+
+        if missing:
+            got = self.inner.fetch_quotes(missing, currencies=known)
+            with self._lock:
+                for sym, quote in got.items():
+                    self._store(("price", sym), quote.price)
+                    if quote.currency is not None:
+                        self._store(("currency", sym), quote.currency)
+            out.update(got)
+        return out
@@ -1,3 +1,13 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
 import yfinance as yf
 
 
@@ -5,40 +15,274 @@ class MarketDataError(Exception):
     pass
 
 
-def get_price(symbol: str) -> float:
-    try:
+@dataclass
+class Quote:
+    symbol: str
+    price: float
+    currency: Optional[str] = None
+
+
+@dataclass
+class QuoteResult:
+    """
+    Outcome of a bulk lookup: what came back, and why the rest didn't.
+    """
+    quotes: dict[str, Quote] = field(default_factory=dict)
+    errors: dict[str, MarketDataError] = field(default_factory=dict)
+
+
+def fx_symbol(from_currency: str, to_currency: str) -> str:
+    return f"{from_currency.upper()}{to_currency.upper()}=X"
+
+
+# ---- providers ----
+#
+# Everything that talks to a data source goes through a provider object so
+# the rest of the code (and tests) can swap Yahoo for something local.
+
+
+class YahooProvider:
+    """
+    Live data from Yahoo Finance via yfinance. Nothing is remembered
+    between calls; put a market_cache.CachingProvider in front for that.
+    """
+
+    def __init__(self, currency_workers: int = 8):
+        self.currency_workers = currency_workers
+
+    def price(self, symbol: str) -> float:
+        try:
+            t = yf.Ticker(symbol)
+
+            fast = t.fast_info or {}
+            if fast.get("last_price") is not None:
+                return float(fast["last_price"])
+
+            info = t.info or {}
+            if info.get("regularMarketPrice") is not None:
+                return float(info["regularMarketPrice"])
+
+            raise MarketDataError(f"No live price available for {symbol}")
+
+        except Exception as e:
+            raise MarketDataError(f"Failed to fetch price for {symbol}: {e}")
+
+    def currency(self, symbol: str) -> str:
+        try:
+            ticker = yf.Ticker(symbol)
+            currency = ticker.fast_info.get("currency")
+
+            if currency is None:
+                raise MarketDataError(f"No currency info for {symbol}")
+
+            return currency
+
+        except Exception as e:
+            raise MarketDataError(f"Failed to fetch currency for {symbol}: {e}")
+
+    def _currency_or_none(self, symbol: str) -> Optional[str]:
+        try:
+            return self.currency(symbol)
+        except MarketDataError:
+            return None
+
+    def currencies(self, symbols: list[str]) -> dict[str, Optional[str]]:
+        """
+        Currency per symbol (None where it can't be had), looked up
+        concurrently so a batch costs about one round trip.
+        """
+        if not symbols:
+            return {}
+        workers = max(1, min(self.currency_workers, len(symbols)))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            return dict(zip(symbols, ex.map(self._currency_or_none, symbols)))
+
+    def fx_rate(self, from_currency: str, to_currency: str) -> float:
+        pair = fx_symbol(from_currency, to_currency)
+
+        try:
+            ticker = yf.Ticker(pair)
+
+            # 1️⃣ Try fast_info
+            fast = ticker.fast_info
+            if fast and fast.get("last_price") is not None:
+                return float(fast["last_price"])
+
+            # 2️⃣ Fallback: info
+            info = ticker.info
+            rate = info.get("regularMarketPrice")
+            if rate is not None:
+                return float(rate)
+
+            # 3️⃣ Last resort: daily close
+            hist = ticker.history(period="1d")
+            if not hist.empty:
+                return float(hist["Close"].iloc[-1])
+
+            raise MarketDataError(f"No FX data available for {pair}")
+
+        except Exception as e:
+            raise MarketDataError(
+                f"Failed to fetch FX rate {from_currency}->{to_currency}: {e}"
+            )
+
+    def is_etf(self, symbol: str) -> bool:
         t = yf.Ticker(symbol)
+        info = t.get_info()
+        return info.get("quoteType") == "ETF"
 
-        fast = t.fast_info or {}
-        if fast.get("last_price") is not None:
-            return float(fast["last_price"])
+    def split_data(self, symbol: str):
+        return yf.Ticker(symbol).splits
 
-        info = t.info or {}
-        if info.get("regularMarketPrice") is not None:
-            return float(info["regularMarketPrice"])
+    def history(self, symbol: str, start: date, end: date) -> list[tuple[date, float]]:
+        """
+        Daily closes from start to end inclusive, as (date, close).
+        """
+        try:
+            hist = yf.Ticker(symbol).history(
+                start=start, end=end + timedelta(days=1), interval="1d", auto_adjust=False,
+            )
+        except Exception as e:
+            raise MarketDataError(f"Failed to fetch history for {symbol}: {e}")
+        if hist.empty:
+            return []
+        return [(ts.date(), float(close)) for ts, close in hist["Close"].dropna().items()]
 
-        raise MarketDataError(f"No live price available for {symbol}")
+    def fetch_quotes(self, symbols: list[str], currencies: Optional[dict] = None) -> dict[str, Quote]:
+        """
+        One yf.download for all the prices, then currencies() for the
+        symbols not in `currencies` (ones the caller already knows).
+        Symbols missing from the result are left out.
+        """
+        data = yf.download(
+            symbols, period="5d", interval="1d",
+            group_by="column", auto_adjust=False, progress=False, threads=True,
+        )
+        closes = data["Close"] if not data.empty else None
+        if closes is not None and closes.ndim == 1:
+            # older yfinance flattens the columns for a single symbol
+            closes = closes.to_frame(symbols[0])
 
-    except Exception as e:
-        raise MarketDataError(f"Failed to fetch price for {symbol}: {e}")
+        prices = {}
+        for sym in symbols:
+            if closes is None or sym not in closes:
+                continue
+            col = closes[sym].dropna()
+            if not col.empty:
+                prices[sym] = float(col.iloc[-1])
 
+        known = currencies or {}
+        found = {**self.currencies([sym for sym in prices if sym not in known]), **known}
+        return {sym: Quote(sym, price, found.get(sym)) for sym, price in prices.items()}
 
 
-def get_currency(symbol: str) -> str:
+class StaticProvider:
     """
-    Get the trading currency for a ticker (e.g. USD).
+    In-memory provider for offline runs and tests.
+
+    prices / currencies are keyed by symbol, fx_rates by (from, to). FX pairs
+    can also be priced as quotes through their Yahoo symbol ("USDEUR=X").
     """
-    try:
-        ticker = yf.Ticker(symbol)
-        currency = ticker.fast_info.get("currency")
 
-        if currency is None:
+    def __init__(self, prices=None, currencies=None, fx_rates=None, splits=None, etfs=(),
+                 histories=None, latency: float = 0.0):
+        self.prices = dict(prices or {})
+        self.currencies = dict(currencies or {})
+        self.fx_rates = {(a.upper(), b.upper()): r for (a, b), r in (fx_rates or {}).items()}
+        self.splits = dict(splits or {})
+        self.etfs = set(etfs)
+        self.histories = dict(histories or {})  # symbol -> {date: close}
+        self.latency = latency  # seconds each call sleeps, to mimic the network
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _hit(self):
+        with self._calls_lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def price(self, symbol: str) -> float:
+        self._hit()
+        return self._price(symbol)
+
+    def _price(self, symbol: str) -> float:
+        if symbol in self.prices:
+            return float(self.prices[symbol])
+        for (a, b), rate in self.fx_rates.items():
+            if fx_symbol(a, b) == symbol:
+                return float(rate)
+        raise MarketDataError(f"No live price available for {symbol}")
+
+    def currency(self, symbol: str) -> str:
+        self._hit()
+        if symbol not in self.currencies:
             raise MarketDataError(f"No currency info for {symbol}")
+        return self.currencies[symbol]
+
+    def fx_rate(self, from_currency: str, to_currency: str) -> float:
+        self._hit()
+        key = (from_currency.upper(), to_currency.upper())
+        if key not in self.fx_rates:
+            raise MarketDataError(f"No FX data available for {fx_symbol(*key)}")
+        return float(self.fx_rates[key])
+
+    def is_etf(self, symbol: str) -> bool:
+        self._hit()
+        return symbol in self.etfs
+
+    def split_data(self, symbol: str):
+        self._hit()
+        return self.splits.get(symbol, {})
+
+    def history(self, symbol: str, start: date, end: date) -> list[tuple[date, float]]:
+        self._hit()
+        closes = self.histories.get(symbol, {})
+        return sorted((d, float(c)) for d, c in closes.items() if start <= d <= end)
+
+    def fetch_quotes(self, symbols: list[str], currencies: Optional[dict] = None) -> dict[str, Quote]:
+        self._hit()
+        known = currencies or {}
+        out = {}
+        for sym in symbols:
+            try:
+                out[sym] = Quote(sym, self._price(sym), known.get(sym, self.currencies.get(sym)))
+            except MarketDataError:
+                pass
+        return out
+
+
+_provider = None
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        _provider = YahooProvider()
+    return _provider
+
+
+def set_provider(provider):
+    """
+    Swap the data source (e.g. a StaticProvider in tests). None = Yahoo.
+    """
+    global _provider
+    _provider = provider
+
+
+# ---- single symbol lookups ----
+
+
+def get_price(symbol: str) -> float:
+    return get_provider().price(symbol)
 
-        return currency
 
-    except Exception as e:
-        raise MarketDataError(f"Failed to fetch currency for {symbol}: {e}")
+
+def get_currency(symbol: str) -> str:
+    """
+    Get the trading currency for a ticker (e.g. USD).
+    """
+    return get_provider().currency(symbol)
 
 
 def get_fx_rate(from_currency: str, to_currency: str) -> float:
@@ -50,56 +294,235 @@ def get_fx_rate(from_currency: str, to_currency: str) -> float:
     #move both to upper case
     from_currency = from_currency.upper()
     to_currency = to_currency.upper()
-    
+
     if from_currency == to_currency:
         return 1.0
 
-    pair = f"{from_currency}{to_currency}=X"
+    return get_provider().fx_rate(from_currency, to_currency)
 
-    try:
-        ticker = yf.Ticker(pair)
 
-        # 1️⃣ Try fast_info
-        fast = ticker.fast_info
-        if fast and fast.get("last_price") is not None:
-            return float(fast["last_price"])
-
-        # 2️⃣ Fallback: info
-        info = ticker.info
-        rate = info.get("regularMarketPrice")
-        if rate is not None:
-            return float(rate)
-
-        # 3️⃣ Last resort: daily close
-        hist = ticker.history(period="1d")
-        if not hist.empty:
-            return float(hist["Close"].iloc[-1])
-
-        raise MarketDataError(f"No FX data available for {pair}")
-
-    except Exception as e:
-        raise MarketDataError(
-            f"Failed to fetch FX rate {from_currency}->{to_currency}: {e}"
-        )
 
+def is_etf(symbol: str) -> bool:
+    return get_provider().is_etf(symbol)
 
+def _as_date(d) -> date:
+    return d.date() if isinstance(d, datetime) else d
 
-def is_etf(symbol: str) -> bool:
-    t = yf.Ticker(symbol)
-    info = t.get_info()
-    return info.get("quoteType") == "ETF"
 
 def get_split_data(symbol: str, date: str = "") -> dict:
     """
     Get split data for a given ticker symbol.
-    
+
     """
-    t = yf.Ticker(symbol)
-    splits = t.splits  
+    splits = get_provider().split_data(symbol)
 
     if date != "":
         # Filter splits for splits after or on the given date
-        splits = splits[splits.index >= date]
+        if isinstance(splits, dict):
+            # providers key splits by date or (possibly tz-aware) datetime
+            since = datetime.fromisoformat(date).date()
+            splits = {d: f for d, f in splits.items() if _as_date(d) >= since}
+        else:
+            splits = splits[splits.index >= date]
 
     return splits
 
+
+# ---- bulk lookups ----
+
+
+def _unique(symbols: Iterable[str]) -> list[str]:
+    return list(dict.fromkeys(s.strip() for s in symbols if s and s.strip()))
+
+
+def get_quotes(symbols: Iterable[str], batch_size: int = 100, provider=None) -> QuoteResult:
+    """
+    Price + currency for many symbols, fetched batch_size at a time.
+
+    Never raises for a bad symbol: anything the provider didn't return, or
+    a whole batch that failed, ends up in result.errors instead.
+    """
+    if batch_size <= 0:
+        raise ValueError("batch_size must be > 0")
+
+    provider = provider or get_provider()
+    symbols = _unique(symbols)
+    result = QuoteResult()
+
+    for start in range(0, len(symbols), batch_size):
+        batch = symbols[start:start + batch_size]
+        try:
+            got = provider.fetch_quotes(batch)
+        except Exception as e:
+            for sym in batch:
+                result.errors[sym] = MarketDataError(f"Batch fetch failed for {sym}: {e}")
+            continue
+
+        for sym in batch:
+            quote = got.get(sym)
+            if quote is None:
+                result.errors[sym] = MarketDataError(f"No live price available for {sym}")
+            else:
+                result.quotes[sym] = quote
+
+    return result
+
+
+def get_prices(symbols: Iterable[str], batch_size: int = 100, provider=None):
+    """
+    Bulk get_price. Returns (prices, errors), both keyed by symbol.
+    """
+    result = get_quotes(symbols, batch_size=batch_size, provider=provider)
+    prices = {sym: q.price for sym, q in result.quotes.items()}
+    return prices, result.errors
+
+
+# ---- concurrent lookups ----
+
+
+@dataclass
+class FetchResult:
+    values: dict = field(default_factory=dict)
+    errors: dict[object, MarketDataError] = field(default_factory=dict)
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, bursting up to
+    `capacity`. Used from a single event loop, so no locking.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _take(self) -> float:
+        """
+        Take a token if there is one. Returns how long to wait otherwise.
+        """
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while (wait := self._take()) > 0:
+            await asyncio.sleep(wait)
+
+
+class ConcurrentFetcher:
+    """
+    Runs many provider lookups at once so a revaluation costs about as much
+    as its slowest quote rather than the sum of all of them.
+
+    max_concurrency: lookups in flight at any one time
+    rate_per_sec:    token-bucket limit on lookups started (None = no limit)
+    timeout:         seconds per attempt
+    retries:         extra attempts after a failure or timeout, with
+                     exponential backoff plus random jitter
+
+    Plain provider methods run in a thread pool; async ones are awaited
+    directly. A timed-out threaded call can't be killed, it is just
+    abandoned, so the pool has spare threads for those.
+    """
+
+    def __init__(self, provider=None, max_concurrency: int = 8, rate_per_sec: Optional[float] = None,
+                 burst: Optional[float] = None, timeout: float = 10.0, retries: int = 2,
+                 backoff: float = 0.5, jitter: float = 0.5):
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be > 0")
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.jitter = jitter
+
+    async def _call(self, executor, fn, args):
+        if asyncio.iscoroutinefunction(fn):
+            return await fn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args))
+
+    async def _fetch_one(self, key, fn, args, sem, bucket, executor):
+        last = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self.backoff * (2 ** (attempt - 1))
+                await asyncio.sleep(delay * (1 + random.uniform(0, self.jitter)))
+
+            async with sem:
+                if bucket is not None:
+                    await bucket.acquire()
+                try:
+                    return await asyncio.wait_for(self._call(executor, fn, args), self.timeout)
+                except asyncio.TimeoutError:
+                    last = MarketDataError(f"Timed out after {self.timeout}s fetching {key}")
+                except Exception as e:
+                    last = e
+
+        if isinstance(last, MarketDataError):
+            raise last
+        raise MarketDataError(f"Failed to fetch {key}: {last}")
+
+    async def gather(self, jobs: dict) -> FetchResult:
+        """
+        jobs maps a key to (callable, args). Returns values/errors by key.
+        """
+        sem = asyncio.Semaphore(self.max_concurrency)
+        bucket = TokenBucket(self.rate_per_sec, self.burst) if self.rate_per_sec else None
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency * 2)
+        try:
+            keys = list(jobs)
+            outcomes = await asyncio.gather(
+                *(self._fetch_one(k, *jobs[k], sem, bucket, executor) for k in keys),
+                return_exceptions=True,
+            )
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        result = FetchResult()
+        for key, out in zip(keys, outcomes):
+            if isinstance(out, BaseException):
+                result.errors[key] = out if isinstance(out, MarketDataError) else MarketDataError(str(out))
+            else:
+                result.values[key] = out
+        return result
+
+    def run(self, jobs: dict) -> FetchResult:
+        return asyncio.run(self.gather(jobs))
+
+    def prices(self, symbols: Iterable[str]) -> FetchResult:
+        provider = self.provider or get_provider()
+        return self.run({sym: (provider.price, (sym,)) for sym in _unique(symbols)})
+
+    def fx_rates(self, pairs: Iterable[tuple[str, str]]) -> FetchResult:
+        """
+        Keyed by (from, to), upper-cased. Same-currency pairs are 1.0.
+        """
+        provider = self.provider or get_provider()
+        jobs = {}
+        result_same = {}
+        for a, b in pairs:
+            pair = (a.upper(), b.upper())
+            if pair[0] == pair[1]:
+                result_same[pair] = 1.0
+            else:
+                jobs[pair] = (provider.fx_rate, pair)
+        result = self.run(jobs)
+        result.values.update(result_same)
+        return result
+
+    def split_data(self, symbols: Iterable[str]) -> FetchResult:
+        provider = self.provider or get_provider()
+        return self.run({sym: (provider.split_data, (sym,)) for sym in _unique(symbols)})
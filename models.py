@@ -4,79 +4,302 @@
 
 
 
-from dataclasses import dataclass
-from datetime import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from typing import Optional
 
 
-@dataclass
-class LotRow:
-    lot_id: str              
-    date: datetime
-    original_qty: float     
-    split_factor: float     
-    price_usd: Optional[float] 
-    fx: Optional[float]         
-    total_cost_eur: float    
-
-    # to update
-    adjusted_qty: float     
-    adjusted_price_eur: float  
-    qty_sold: float = 0.0    # 
-    qty_left: float = 0.0    # 
-    cost_left_eur: float = 0.0  
+class SplitIndex:
+    """
+    Date-sorted stock splits for one symbol, with prefix products of the
+    factors. The split adjustment for any lot is two bisects and a divide,
+    so lots never need rewriting when a split comes in, and the order splits
+    are added in doesn't matter.
+    """
 
-    def __post_init__(self):
+    __slots__ = ("dates", "factors", "_prefix")
 
-        if self.total_cost_eur is None:
-            if self.price_usd is None or self.fx is None:
-                raise ValueError(
-                    f"Lot {self.lot_id}: either provide total_cost_eur OR price_usd + fx"
-                )
-    
-            self.total_cost_eur = (self.price_usd * self.original_qty) / self.fx
+    def __init__(self):
+        self.dates: list[datetime] = []
+        self.factors: list[float] = []
+        self._prefix: list[float] = [1.0]  # _prefix[i] = product of factors[:i]
 
- 
-        self.adjusted_qty = self.original_qty * self.split_factor
-        self.qty_left = self.adjusted_qty
-        self.adjusted_price_eur = (
-            self.total_cost_eur / self.adjusted_qty if self.adjusted_qty else 0.0
-        )
-        self.cost_left_eur = self.total_cost_eur
+    def add(self, date: datetime, factor: float):
+        if factor <= 0:
+            raise ValueError("Split factor must be > 0")
+        i = bisect_right(self.dates, date)
+        self.dates.insert(i, date)
+        self.factors.insert(i, factor)
+
+        prefix = self._prefix[: i + 1]
+        for f in self.factors[i:]:
+            prefix.append(prefix[-1] * f)
+        self._prefix = prefix
+
+    def factor(self, lot_date: datetime, as_of: Optional[datetime] = None) -> float:
+        """
+        Combined factor of the splits dated on/after lot_date (and on/before
+        as_of if given), i.e. how many shares one lot_date share became.
+        """
+        dates = self.dates
+        lo = bisect_left(dates, lot_date)
+        hi = len(dates) if as_of is None else bisect_right(dates, as_of)
+        if hi <= lo:
+            return 1.0
+        return self._prefix[hi] / self._prefix[lo]
+
+    def __len__(self):
+        return len(self.dates)
+
+
+class AcquisitionIndex:
+    """
+    Lot positions ordered by acquisition date, so the buys inside a date
+    window are two bisects away. Buys normally come in date order, which
+    makes add() an append.
+    """
+
+    __slots__ = ("dates", "lots")
+
+    def __init__(self):
+        self.dates: list[datetime] = []
+        self.lots: list[int] = []
 
-    def apply_split(self, factor: float):
+    def add(self, date: datetime, lot: int):
+        if not self.dates or date >= self.dates[-1]:
+            self.dates.append(date)
+            self.lots.append(lot)
+            return
+        i = bisect_right(self.dates, date)
+        self.dates.insert(i, date)
+        self.lots.insert(i, lot)
+
+    def between(self, after: datetime, until: datetime) -> list[int]:
         """
-        Apply a stock split to THIS lot.
-        E.g. factor=4.0 means each share becomes 4 shares.
+        Lots acquired after `after` and on/before `until`, oldest first.
         """
-        self.split_factor *= factor
-        self.adjusted_qty *= factor
-        self.qty_left *= factor
+        lo = bisect_right(self.dates, after)
+        hi = bisect_right(self.dates, until)
+        return self.lots[lo:hi]
+
+    def __len__(self):
+        return len(self.dates)
+
+
+class _LotMath:
+    """
+    Split / sale arithmetic shared by LotRow and LotTable's row views.
+
+    Quantities are stored in the lot's own (pre-split) share units; the
+    split-adjusted figures are worked out from the symbol's SplitIndex
+    when read. Only touches attributes, so it works on either storage.
+    """
+
+    __slots__ = ()
+
+    def factor_at(self, as_of: Optional[datetime] = None) -> float:
+        splits = self.splits
+        return splits.factor(self.date, as_of) if splits is not None else 1.0
+
+    @property
+    def split_factor(self) -> float:
+        return self.factor_at()
+
+    @property
+    def adjusted_qty(self) -> float:
+        return self.original_qty * self.factor_at()
+
+    @property
+    def adjusted_price_eur(self) -> float:
+        adjusted_qty = self.adjusted_qty
+        return self.total_cost_eur / adjusted_qty if adjusted_qty else 0.0
 
-        self.adjusted_price_eur = (
-            self.total_cost_eur / self.adjusted_qty if self.adjusted_qty else 0.0
-        )
+    @property
+    def qty_left(self) -> float:
+        return self.base_qty_left * self.factor_at()
 
-    def consume_for_sale(self, qty_to_use: float, sale_price_eur: float):
+    @property
+    def qty_sold(self) -> float:
+        return self.base_qty_sold * self.factor_at()
+
+    def consume_for_sale(self, qty_to_use: float, sale_price_eur: float,
+                         as_of: Optional[datetime] = None, factor: Optional[float] = None):
         """
-        Use up qty_to_use shares from this lot for a sale.
+        Use up qty_to_use shares from this lot for a sale. qty_to_use is in
+        shares as they were on as_of (the sale date), None = after all splits.
+        factor overrides the lot share -> sale share conversion, for a lot
+        bought after the sale.
 
         Returns:
             cost_used_eur, proceeds_eur, gain_eur
         """
-        qty_from_lot = min(qty_to_use, self.qty_left)
+        if factor is None:
+            factor = self.factor_at(as_of)
+        base_left = self.base_qty_left
+        qty_left = base_left * factor
+        qty_from_lot = min(qty_to_use, qty_left)
         if qty_from_lot <= 0:
             return 0.0, 0.0, 0.0
 
-
-        cost_per_share = self.cost_left_eur / self.qty_left
+        cost_left = self.cost_left_eur
+        cost_per_share = cost_left / qty_left
         cost_used = cost_per_share * qty_from_lot
         proceeds = sale_price_eur * qty_from_lot
         gain = proceeds - cost_used
 
-        # update this row
-        self.qty_left -= qty_from_lot
-        self.qty_sold += qty_from_lot
-        self.cost_left_eur -= cost_used
+        # update this row, in lot units. Taking the whole lot zeroes it
+        # exactly rather than leaving float dust behind.
+        base_used = base_left if qty_from_lot == qty_left else qty_from_lot / factor
+        self.base_qty_left = base_left - base_used
+        self.base_qty_sold += base_used
+        self.cost_left_eur = cost_left - cost_used
 
         return cost_used, proceeds, gain
+
+
+@dataclass(slots=True)
+class LotRow(_LotMath):
+    lot_id: str
+    date: datetime
+    original_qty: float
+    price_usd: Optional[float]
+    fx: Optional[float]
+    total_cost_eur: Optional[float]
+
+    # split history of the symbol; None = never split
+    splits: Optional[SplitIndex] = field(default=None, repr=False, compare=False)
+
+    # to update, in original_qty units
+    base_qty_sold: float = 0.0
+    base_qty_left: float = 0.0
+    cost_left_eur: float = 0.0
+
+    def __post_init__(self):
+
+        if self.total_cost_eur is None:
+            if self.price_usd is None or self.fx is None:
+                raise ValueError(
+                    f"Lot {self.lot_id}: either provide total_cost_eur OR price_usd + fx"
+                )
+    
+            self.total_cost_eur = (self.price_usd * self.original_qty) / self.fx
+
+        self.base_qty_left = self.original_qty
+        self.cost_left_eur = self.total_cost_eur
+
+
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+_NAN = float("nan")
+
+
+def to_us(dt: datetime) -> int:
+    """
+    Naive datetime -> int64 microseconds since 1970, for array storage.
+    """
+    return (dt - _EPOCH) // _US
+
+
+def from_us(us: int) -> datetime:
+    return _EPOCH + us * _US
+
+
+def _field(name: str, optional: bool = False):
+    """
+    Property reading/writing slot i of the table's `name` array.
+    """
+    def get(self):
+        v = getattr(self.table, name)[self.i]
+        if optional and v != v:
+            return None
+        return v
+
+    def set(self, v):
+        if optional and v is None:
+            v = _NAN
+        getattr(self.table, name)[self.i] = v
+
+    return property(get, set)
+
+
+class LotView(_LotMath):
+    """
+    Row i of a LotTable with the same attributes and methods as LotRow.
+    Reads and writes go straight to the table's arrays.
+    """
+
+    __slots__ = ("table", "i")
+
+    def __init__(self, table: "LotTable", i: int):
+        self.table = table
+        self.i = i
+
+    @property
+    def splits(self) -> Optional[SplitIndex]:
+        return self.table.splits
+
+    @property
+    def lot_id(self) -> str:
+        return self.table.lot_id[self.i]
+
+    @property
+    def date(self) -> datetime:
+        return from_us(self.table.date_us[self.i])
+
+    original_qty = _field("original_qty")
+    price_usd = _field("price_usd", optional=True)
+    fx = _field("fx", optional=True)
+    total_cost_eur = _field("total_cost_eur")
+    base_qty_sold = _field("base_qty_sold")
+    base_qty_left = _field("base_qty_left")
+    cost_left_eur = _field("cost_left_eur")
+
+    def __repr__(self):
+        return f"LotView({self.lot_id!r}, qty_left={self.qty_left}, cost_left_eur={self.cost_left_eur})"
+
+
+class LotTable:
+    """
+    Struct-of-arrays lot store: one array('d') per numeric LotRow field,
+    dates as int64 microseconds, None prices/FX as NaN.
+
+    Behaves like a list of lots for Position: append() takes a LotRow,
+    indexing and iteration hand back LotView objects. All rows share the
+    table's SplitIndex.
+    """
+
+    FLOAT_FIELDS = (
+        "original_qty", "price_usd", "fx", "total_cost_eur",
+        "base_qty_sold", "base_qty_left", "cost_left_eur",
+    )
+
+    def __init__(self, splits: Optional[SplitIndex] = None):
+        self.splits = splits
+        self.lot_id: list[str] = []
+        self.date_us = array("q")
+        for name in self.FLOAT_FIELDS:
+            setattr(self, name, array("d"))
+
+    def append(self, lot: LotRow):
+        self.lot_id.append(lot.lot_id)
+        self.date_us.append(to_us(lot.date))
+        for name in self.FLOAT_FIELDS:
+            v = getattr(lot, name)
+            getattr(self, name).append(_NAN if v is None else v)
+
+    def __len__(self):
+        return len(self.lot_id)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [LotView(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("lot index out of range")
+        return LotView(self, i)
+
+    def __iter__(self):
+        return (LotView(self, i) for i in range(len(self)))
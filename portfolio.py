@@ -0,0 +1,179 @@
+# whole-book revaluation over aligned arrays
+
+from array import array
+from dataclasses import dataclass, field
+from math import isnan
+from operator import mul, sub
+from typing import Iterable, Mapping, Optional, Sequence
+
+from positions import Position
+
+
+_NAN = float("nan")
+
+# quote currencies priced in minor units -> (major currency, multiplier)
+MINOR_UNITS = {
+    "GBp": ("GBP", 0.01),
+    "GBX": ("GBP", 0.01),
+    "ZAc": ("ZAR", 0.01),
+    "ILA": ("ILS", 0.01),
+}
+
+
+@dataclass
+class Valuation:
+    """
+    Result of Portfolio.revalue, arrays aligned with Portfolio.symbols.
+    Positions with no price (or no FX) come out as NaN and are left out of
+    the totals.
+    """
+    symbols: list[str]
+    value_eur: array
+    cost_eur: array
+    profit_eur: array
+    roi_pct: array
+    total_value_eur: float = 0.0
+    total_cost_eur: float = 0.0
+    total_profit_eur: float = 0.0
+    missing: list[str] = field(default_factory=list)
+
+    def rows(self):
+        for i, sym in enumerate(self.symbols):
+            yield sym, self.value_eur[i], self.cost_eur[i], self.profit_eur[i], self.roi_pct[i]
+
+
+class Portfolio:
+    """
+    Every position's open quantity and remaining cost basis in parallel
+    arrays, with each position's quote currency dictionary-encoded.
+    revalue() values the whole book from a price vector and a per-currency
+    FX map in a few C-level passes instead of a Python call per position.
+
+    The arrays are a copy of the positions' running totals; call refresh()
+    (or refresh(symbol)) after trading.
+    """
+
+    def __init__(self, base_currency: str = "EUR"):
+        self.base_currency = base_currency.upper()
+        self.symbols: list[str] = []
+        self.positions: list[Position] = []
+        self.qty = array("d")
+        self.cost_eur = array("d")
+
+        # quote currency per position, as codes into self.currencies
+        self.currencies: list[str] = []
+        self.currency_code = array("i")
+        self._currency_index: dict[str, int] = {}
+        self._index: dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add(self, position: Position, currency: str):
+        """
+        Add a position quoted in `currency` (as reported by get_currency).
+        """
+        if position.symbol in self._index:
+            raise ValueError(f"{position.symbol} is already in the portfolio")
+
+        code = self._currency_index.get(currency)
+        if code is None:
+            code = self._currency_index[currency] = len(self.currencies)
+            self.currencies.append(currency)
+
+        self._index[position.symbol] = len(self.symbols)
+        self.symbols.append(position.symbol)
+        self.positions.append(position)
+        self.qty.append(position.total_qty_left())
+        self.cost_eur.append(position.total_cost_left())
+        self.currency_code.append(code)
+
+    def refresh(self, symbol: Optional[str] = None):
+        """
+        Re-read open qty / cost from one position, or all of them.
+        """
+        if symbol is not None:
+            i = self._index[symbol]
+            pos = self.positions[i]
+            self.qty[i] = pos.total_qty_left()
+            self.cost_eur[i] = pos.total_cost_left()
+            return
+        self.qty = array("d", (p.total_qty_left() for p in self.positions))
+        self.cost_eur = array("d", (p.total_cost_left() for p in self.positions))
+
+    def fx_currencies(self) -> set[str]:
+        """
+        Major currencies revalue() needs a rate for.
+        """
+        out = set()
+        for c in self.currencies:
+            major = MINOR_UNITS.get(c, (c, 1.0))[0].upper()
+            if major != self.base_currency:
+                out.add(major)
+        return out
+
+    def price_vector(self, prices: Mapping[str, float]) -> array:
+        """
+        Align a {symbol: price} mapping with self.symbols, NaN where missing.
+        """
+        get = prices.get
+        return array("d", (_NAN if (p := get(s)) is None else p for s in self.symbols))
+
+    def _fx_by_code(self, fx: Mapping[str, float]) -> list[float]:
+        """
+        Base currency per 1 unit of each quote currency, indexed by code.
+        fx is keyed by major currency: units of base per 1 unit of it.
+        """
+        out = []
+        for c in self.currencies:
+            major, scale = MINOR_UNITS.get(c, (c, 1.0))
+            major = major.upper()
+            if major == self.base_currency:
+                rate = 1.0
+            else:
+                rate = fx.get(major, fx.get(c, _NAN))
+            out.append(rate * scale)
+        return out
+
+    def revalue(self, prices: Sequence[float] | Mapping[str, float], fx: Mapping[str, float]) -> Valuation:
+        """
+        prices: per-position price in its quote currency, either aligned with
+                self.symbols or a {symbol: price} mapping.
+        fx:     {currency: units of base currency per 1 unit}, e.g.
+                {"USD": get_fx_rate("USD", "EUR")}.
+        """
+        if isinstance(prices, Mapping):
+            prices = self.price_vector(prices)
+        if len(prices) != len(self.symbols):
+            raise ValueError(f"Expected {len(self.symbols)} prices, got {len(prices)}")
+
+        rate = self._fx_by_code(fx)
+        price_eur = map(mul, prices, map(rate.__getitem__, self.currency_code))
+        value = array("d", map(mul, self.qty, price_eur))
+        profit = array("d", map(sub, value, self.cost_eur))
+        roi = array("d", [p / c * 100 if c else 0.0 for p, c in zip(profit, self.cost_eur)])
+
+        # own copies: refresh() writes cost in place and add() grows symbols,
+        # and neither should reach back into a Valuation handed out earlier
+        cost = array("d", self.cost_eur)
+        result = Valuation(list(self.symbols), value, cost, profit, roi)
+        total_value = sum(value)
+        if not isnan(total_value):
+            result.total_value_eur = total_value
+            result.total_cost_eur = sum(cost)
+        else:
+            # only pay for the per-position scan when something is unpriced
+            ok = [i for i, v in enumerate(value) if not isnan(v)]
+            result.missing = [self.symbols[i] for i, v in enumerate(value) if isnan(v)]
+            result.total_value_eur = sum(value[i] for i in ok)
+            result.total_cost_eur = sum(cost[i] for i in ok)
+        result.total_profit_eur = result.total_value_eur - result.total_cost_eur
+        return result
+
+    @classmethod
+    def from_positions(cls, positions: Iterable[Position], currencies: Mapping[str, str],
+                       base_currency: str = "EUR") -> "Portfolio":
+        book = cls(base_currency)
+        for pos in positions:
+            book.add(pos, currencies[pos.symbol])
+        return book
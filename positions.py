@@ -1,9 +1,81 @@
 # position.py
-from typing import List, Dict
+from array import array
+from collections.abc import Sequence
+from typing import List, Dict, Optional
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import date as Date, datetime, timedelta
 
-from models import LotRow
+from models import AcquisitionIndex, LotRow, LotTable, SplitIndex, from_us, to_us
+
+
+# when True every mutation re-sums the lots and checks the running totals
+DEBUG_CHECKS = False
+
+_NAN = float("nan")
+
+
+def _extend(out: array, values) -> array:
+    """
+    out.extend(values), as one memcpy when values is a same-typed buffer
+    (e.g. a memoryview on a snapshot file).
+    """
+    if isinstance(values, memoryview) and values.format == out.typecode:
+        out.frombytes(values.cast("B"))
+    else:
+        out.extend(values)
+    return out
+
+# SaleSummary.per_lot keys after "Lot"/"Date", in order; float columns in to_state()
+PER_LOT_FLOATS = (
+    "Original qty", "Split", "Adjusted qty (new)", "Price USD", "FX",
+    "Total Cost €", "Adjusted € / share", "Qty SOLD", "Qty LEFT",
+    "Cost USED €", "Cost LEFT €", "Proceeds €", "Gain €",
+)
+
+
+class PerLotRows(Sequence):
+    """
+    Read-only SaleSummary.per_lot backed by the row columns of a
+    Position.to_state() dict (rows start..stop). Each dict is built when
+    it's read and equals the one sell() originally produced.
+    """
+
+    __slots__ = ("state", "start", "stop")
+
+    _OPTIONAL = frozenset({"Price USD", "FX"})
+
+    def __init__(self, state: dict, start: int, stop: int):
+        self.state = state
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def _row(self, j: int) -> Dict:
+        state = self.state
+        row = {"Lot": state["row_lot"][j], "Date": Date.fromordinal(state["row_date"][j])}
+        for key in PER_LOT_FLOATS:
+            v = state["row " + key][j]
+            row[key] = None if v != v and key in self._OPTIONAL else v
+        return row
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._row(self.start + j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("per-lot row index out of range")
+        return self._row(self.start + i)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, PerLotRows)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return f"PerLotRows({list(self)!r})"
 
 
 @dataclass
@@ -17,11 +89,157 @@ class SaleSummary:
 
 
 class Position:
-    def __init__(self, symbol: str):
+    # positions pickled before the index existed don't have the attribute
+    _acquisitions: Optional[AcquisitionIndex] = None
+
+    def __init__(self, symbol: str, compact: bool = False):
+        """
+        compact=True keeps lots in a LotTable (parallel arrays) instead of a
+        list of LotRow objects, for symbols with very many small buys.
+        """
         self.symbol = symbol
-        self.lots: List[LotRow] = []
+        self.splits = SplitIndex()
+        self.lots: List[LotRow] | LotTable = LotTable(self.splits) if compact else []
         self.sales: List[SaleSummary] = []
 
+        # index of the first lot that still has shares; everything before
+        # it is fully sold, so FIFO sells start here
+        self._head = 0
+
+        # running totals over all lots, kept in step by add_buy/sell. A split
+        # only marks the qty stale; it is re-summed on the next read.
+        self._qty_left = 0.0
+        self._qty_stale = False
+        self._cost_left = 0.0
+
+        # lots by acquisition date, built on the first bed-and-breakfast sale
+        self._acquisitions: Optional[AcquisitionIndex] = None
+
+    # ---- compact state ----
+
+    def to_state(self) -> dict:
+        """
+        Everything needed to rebuild this position as flat arrays and lists:
+        lots, splits, sales with their per-lot rows, FIFO head and running
+        totals. Cheap to pickle and rebuilt exactly by from_state().
+        """
+        lots = self.lots
+        state = {
+            "symbol": self.symbol,
+            "head": self._head,
+            "qty_left": self._qty_left,
+            "qty_stale": self._qty_stale,
+            "cost_left": self._cost_left,
+            "split_date_us": array("q", map(to_us, self.splits.dates)),
+            "split_factor": array("d", self.splits.factors),
+        }
+
+        if isinstance(lots, LotTable):
+            state["lot_id"] = list(lots.lot_id)
+            state["lot_date_us"] = array("q", lots.date_us)
+            for name in LotTable.FLOAT_FIELDS:
+                state["lot_" + name] = array("d", getattr(lots, name))
+        else:
+            state["lot_id"] = [lot.lot_id for lot in lots]
+            state["lot_date_us"] = array("q", (to_us(lot.date) for lot in lots))
+            for name in LotTable.FLOAT_FIELDS:
+                state["lot_" + name] = array(
+                    "d", (_NAN if (v := getattr(lot, name)) is None else v for lot in lots)
+                )
+
+        sales = self.sales
+        state["sale_date_us"] = array("q", (to_us(s.date) for s in sales))
+        state["sale_qty"] = array("d", (s.quantity for s in sales))
+        state["sale_proceeds"] = array("d", (s.proceeds_eur for s in sales))
+        state["sale_cost"] = array("d", (s.total_cost_eur for s in sales))
+        state["sale_gain"] = array("d", (s.gain_eur for s in sales))
+        state["sale_rows"] = array("q", (len(s.per_lot) for s in sales))
+
+        row_lot: list[str] = []
+        row_date = array("q")
+        row_cols = [array("d") for _ in PER_LOT_FLOATS]
+        for sale in sales:
+            per_lot = sale.per_lot
+            if isinstance(per_lot, PerLotRows):
+                # still in column form from an earlier from_state(), copy slices
+                src, lo, hi = per_lot.state, per_lot.start, per_lot.stop
+                row_lot.extend(src["row_lot"][lo:hi])
+                _extend(row_date, src["row_date"][lo:hi])
+                for key, col in zip(PER_LOT_FLOATS, row_cols):
+                    _extend(col, src["row " + key][lo:hi])
+                continue
+            for r in per_lot:
+                row_lot.append(r["Lot"])
+                row_date.append(r["Date"].toordinal())
+                for key, col in zip(PER_LOT_FLOATS, row_cols):
+                    v = r[key]
+                    col.append(_NAN if v is None else v)
+
+        state["row_lot"] = row_lot
+        state["row_date"] = row_date
+        for key, col in zip(PER_LOT_FLOATS, row_cols):
+            state["row " + key] = col
+        return state
+
+    @classmethod
+    def from_state(cls, state: dict, compact: bool = False) -> "Position":
+        """
+        Rebuild a position from to_state(). Sales get a PerLotRows view over
+        the state's row columns, so per-lot dicts are only built when read.
+        """
+        pos = cls(state["symbol"], compact=compact)
+
+        for d, f in zip(state["split_date_us"], state["split_factor"]):
+            pos.splits.add(from_us(d), f)
+
+        if compact:
+            table = pos.lots
+            table.lot_id = list(state["lot_id"])
+            table.date_us = _extend(array("q"), state["lot_date_us"])
+            for name in LotTable.FLOAT_FIELDS:
+                setattr(table, name, _extend(array("d"), state["lot_" + name]))
+        else:
+            splits = pos.splits
+            cols = zip(
+                state["lot_id"], state["lot_date_us"],
+                *(state["lot_" + name] for name in LotTable.FLOAT_FIELDS),
+            )
+            append = pos.lots.append
+            for lot_id, date_us, qty, price, fx, cost, sold, left, cost_left in cols:
+                lot = LotRow(
+                    lot_id, from_us(date_us), qty,
+                    None if price != price else price,
+                    None if fx != fx else fx,
+                    cost, splits,
+                )
+                lot.base_qty_sold = sold
+                lot.base_qty_left = left
+                lot.cost_left_eur = cost_left
+                append(lot)
+
+        r = 0
+        sales = pos.sales
+        cols = zip(
+            state["sale_date_us"], state["sale_qty"], state["sale_proceeds"],
+            state["sale_cost"], state["sale_gain"], state["sale_rows"],
+        )
+        for date_us, qty, proceeds, cost, gain, count in cols:
+            sales.append(SaleSummary(
+                date=from_us(date_us),
+                quantity=qty,
+                proceeds_eur=proceeds,
+                total_cost_eur=cost,
+                gain_eur=gain,
+                per_lot=PerLotRows(state, r, r + count),
+            ))
+            r += count
+
+        pos._head = state["head"]
+        pos._qty_left = state["qty_left"]
+        pos._qty_stale = state["qty_stale"]
+        pos._cost_left = state["cost_left"]
+        return pos
+
     # ---- adding buys as new lots ----
 
     def add_buy(
@@ -37,16 +255,19 @@ class Position:
             lot_id=lot_id,
             date=date,
             original_qty=qty,
-            split_factor=1.0,
             price_usd=price_usd,
             fx=fx,
             total_cost_eur=total_cost_eur,
-            adjusted_qty=0.0,         
-            adjusted_price_eur=0.0,   
-            qty_left=0.0,
-            cost_left_eur=0.0,
+            splits=self.splits,
         )
         self.lots.append(row)
+        if self._acquisitions is not None:
+            self._acquisitions.add(date, len(self.lots) - 1)
+
+        self._qty_left += row.qty_left
+        self._cost_left += row.cost_left_eur
+        if DEBUG_CHECKS:
+            self.check_totals()
 
     # ---- stock split 
 
@@ -54,62 +275,143 @@ class Position:
         """
         Apply a stock split only to lots that existed on or before split_date.
         e.g. 4-for-1: factor=4.0
+
+        The split goes into the symbol's SplitIndex; lots pick it up when
+        read, so buys and splits can be added in any order.
         """
         if factor <= 0:
             raise ValueError("Split factor must be > 0")
 
-        for lot in self.lots:
-            
-            if lot.date <= split_date:
-                lot.apply_split(factor)
+        self.splits.add(split_date, factor)
+        self._qty_stale = True
+        if DEBUG_CHECKS:
+            self.check_totals()
 
     # 
 
-    def sell(self, date: datetime, qty: float, proceeds_eur: float) -> SaleSummary:
+    def acquisitions(self) -> AcquisitionIndex:
+        if self._acquisitions is None:
+            index = AcquisitionIndex()
+            for i, lot in enumerate(self.lots):
+                index.add(lot.date, i)
+            self._acquisitions = index
+        return self._acquisitions
+
+    def _sell_from_lot(self, lot, qty_to_sell: float, price_per_share: float,
+                       factor: float, rows: List[Dict]) -> tuple[float, float, float]:
+        """
+        Take up to qty_to_sell sale-date shares from one lot and add its
+        per-lot row. factor converts lot shares to sale-date shares.
+
+        Returns (shares used on the sale date, cost used, shares used in
+        today's units).
+        """
+        before_left = lot.base_qty_left
+        used_qty = min(qty_to_sell, before_left * factor)
+
+        cost_used, proceeds_used, gain = lot.consume_for_sale(qty_to_sell, price_per_share, factor=factor)
+        base_used = before_left - lot.base_qty_left
+        if base_used <= 0:
+            return 0.0, 0.0, 0.0
+
+        adjusted_qty = lot.original_qty * factor
+        rows.append({
+            "Lot": lot.lot_id,
+            "Date": lot.date.date(),
+            "Original qty": lot.original_qty,
+            "Split": factor,
+            "Adjusted qty (new)": adjusted_qty,
+            "Price USD": lot.price_usd,
+            "FX": lot.fx,
+            "Total Cost €": lot.total_cost_eur,
+            "Adjusted € / share": lot.total_cost_eur / adjusted_qty if adjusted_qty else 0.0,
+            "Qty SOLD": used_qty,
+            "Qty LEFT": lot.base_qty_left * factor,
+            "Cost USED €": cost_used,
+            "Cost LEFT €": lot.cost_left_eur,
+            "Proceeds €": proceeds_used,
+            "Gain €": gain,
+        })
+        return used_qty, cost_used, base_used * lot.factor_at()
+
+    def sell(self, date: datetime, qty: float, proceeds_eur: float,
+             bnb_window: Optional[timedelta] = None) -> SaleSummary:
+        """
+        Match a sale against the lots, FIFO.
+
+        With bnb_window (Irish bed-and-breakfast rule, 4 weeks) the sale is
+        first matched against shares bought in the window after it, oldest
+        first, and only the rest goes FIFO over lots bought on/before the
+        sale. Those later buys have to be in self.lots already, so sales
+        are settled after the fact (see Ledger's bed_and_breakfast mode).
+        """
         qty_to_sell = qty
         price_per_share = proceeds_eur / qty
 
         total_cost = 0.0
+        sold_now = 0.0  # shares sold, in today's (post all splits) units
         per_lot_rows: List[Dict] = []
+        lots = self.lots
+        undo = []  # (lot, sold, left, cost left) before this sale touched it
+
+        if bnb_window is not None:
+            splits = self.splits
+            for i in self.acquisitions().between(date, date + bnb_window):
+                if qty_to_sell <= 0:
+                    break
+                lot = lots[i]
+                if lot.base_qty_left <= 1e-12:
+                    continue
+                # a split between the sale and the buy changes the share units
+                factor = 1.0 / splits.factor(date, lot.date)
+                undo.append((lot, lot.base_qty_sold, lot.base_qty_left, lot.cost_left_eur))
+                used_qty, cost_used, used_now = self._sell_from_lot(
+                    lot, qty_to_sell, price_per_share, factor, per_lot_rows
+                )
+                qty_to_sell -= used_qty
+                total_cost += cost_used
+                sold_now += used_now
 
-        # FIFO
-        for lot in self.lots:
+        # FIFO, starting from the first lot that isn't used up
+        for i in range(self._head, len(lots)):
             if qty_to_sell <= 0:
                 break
-            if lot.qty_left <= 1e-12:
+            lot = lots[i]
+            if lot.base_qty_left <= 1e-12:
                 continue
+            if bnb_window is not None and lot.date > date:
+                break
 
-            before_left = lot.qty_left
-            cost_used, proceeds_used, gain = lot.consume_for_sale(qty_to_sell, price_per_share)
-            used_qty = before_left - lot.qty_left
-
-            if used_qty > 0:
-                qty_to_sell -= used_qty
-                total_cost += cost_used
-
-                per_lot_rows.append({
-                    "Lot": lot.lot_id,
-                    "Date": lot.date.date(),
-                    "Original qty": lot.original_qty,
-                    "Split": lot.split_factor,
-                    "Adjusted qty (new)": lot.adjusted_qty,
-                    "Price USD": lot.price_usd,
-                    "FX": lot.fx,
-                    "Total Cost €": lot.total_cost_eur,
-                    "Adjusted € / share": lot.adjusted_price_eur,
-                    "Qty SOLD": used_qty,
-                    "Qty LEFT": lot.qty_left,
-                    "Cost USED €": cost_used,
-                    "Cost LEFT €": lot.cost_left_eur,
-                    "Proceeds €": proceeds_used,
-                    "Gain €": gain,
-                })
+            # split-adjusted figures as they stood on the sale date
+            undo.append((lot, lot.base_qty_sold, lot.base_qty_left, lot.cost_left_eur))
+            used_qty, cost_used, used_now = self._sell_from_lot(
+                lot, qty_to_sell, price_per_share, lot.factor_at(date), per_lot_rows
+            )
+            qty_to_sell -= used_qty
+            total_cost += cost_used
+            sold_now += used_now
 
         if abs(qty_to_sell) > 1e-9:
+            # put the lots back as they were, a failed sale changes nothing
+            for lot, sold, left, cost_left in undo:
+                lot.base_qty_sold = sold
+                lot.base_qty_left = left
+                lot.cost_left_eur = cost_left
             raise ValueError(
                 f"Not enough {self.symbol} shares to cover sale, short {qty_to_sell:.6f}"
             )
 
+        # move the head past the lots this sale used up
+        head = self._head
+        while head < len(lots) and lots[head].base_qty_left <= 1e-12:
+            head += 1
+        self._head = head
+
+        self._qty_left -= sold_now
+        self._cost_left -= total_cost
+        if DEBUG_CHECKS:
+            self.check_totals()
+
         summary = SaleSummary(
             date=date,
             quantity=qty,
@@ -124,10 +426,26 @@ class Position:
     #  helpers 
 
     def total_qty_left(self) -> float:
-        return sum(lot.qty_left for lot in self.lots)
+        if self._qty_stale:
+            lots = self.lots
+            self._qty_left = sum(lots[i].qty_left for i in range(self._head, len(lots)))
+            self._qty_stale = False
+        return self._qty_left
 
     def total_cost_left(self) -> float:
-        return sum(lot.cost_left_eur for lot in self.lots)
+        return self._cost_left
+
+    def check_totals(self, tol: float = 1e-9):
+        """
+        Re-sum every lot and compare with the running totals.
+        """
+        qty = sum(lot.qty_left for lot in self.lots)
+        cost = sum(lot.cost_left_eur for lot in self.lots)
+        running_qty = self.total_qty_left()
+        if abs(qty - running_qty) > tol * max(1.0, abs(qty)):
+            raise ValueError(f"{self.symbol}: running qty {running_qty} != lots {qty}")
+        if abs(cost - self._cost_left) > tol * max(1.0, abs(cost)):
+            raise ValueError(f"{self.symbol}: running cost {self._cost_left} != lots {cost}")
     
 
     def unrealised_value(self, price_usd: float, fx: float) -> float:
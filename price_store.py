@@ -0,0 +1,230 @@
+# local on-disk store of daily closes, FX and splits for offline / historical valuation
+
+import mmap
+import os
+import re
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Optional
+
+from column_file import read_columns, write_columns
+from market_data import MarketDataError, fx_symbol, get_provider
+
+
+# file layout, little endian: a column_file with the header
+#   magic(4) version(u16) pad(u16) covered_from(i32) covered_to(i32) columns(u32) pad(u32)
+# and two columns, days (date.toordinal(), ascending) and values.
+_MAGIC = b"STKS"
+_VERSION = 2
+_HEADER = struct.Struct("<4sHHiiI4x")
+_COLUMNS = (("days", "i"), ("values", "d"))
+
+KINDS = ("prices", "fx", "splits")
+
+
+def _day(d) -> int:
+    if isinstance(d, datetime):
+        d = d.date()
+    return d.toordinal()
+
+
+class _Series:
+    """
+    One memory-mapped series. days / values are zero-copy views on the file.
+    """
+
+    __slots__ = ("mm", "days", "values", "covered_from", "covered_to")
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.covered_from, self.covered_to, count = _HEADER.unpack_from(self.mm)
+        if magic != _MAGIC or version != _VERSION or count != len(_COLUMNS):
+            self.mm.close()
+            raise ValueError(f"{path}: not a version {_VERSION} price store file")
+        try:
+            cols = read_columns(self.mm, _HEADER.size, _COLUMNS)
+        except ValueError as e:
+            self.mm.close()
+            raise ValueError(f"{path}: {e}") from None
+        self.days, self.values = cols["days"], cols["values"]
+
+    def close(self):
+        self.days.release()
+        self.values.release()
+        self.mm.close()
+
+
+class PriceStore:
+    """
+    Daily closes, FX pairs and split series kept under `root`, one compact
+    binary file per series (see layout above), memory-mapped on first use.
+
+    price_on / fx_on answer from disk with a bisect, falling back to the
+    last value on or before the date (weekends, holidays). update_* fetch
+    only the part of a range not already covered, through the market_data
+    provider, and merge it in.
+    """
+
+    def __init__(self, root: str, provider=None):
+        self.root = root
+        self.provider = provider
+        self._open: dict = {}
+        for kind in KINDS:
+            os.makedirs(os.path.join(root, kind), exist_ok=True)
+
+    # ---- files ----
+
+    def _path(self, kind: str, name: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9._-]", "_", name)
+        return os.path.join(self.root, kind, safe + ".bin")
+
+    def _series(self, kind: str, name: str) -> Optional[_Series]:
+        key = (kind, name)
+        s = self._open.get(key)
+        if s is None:
+            path = self._path(kind, name)
+            if not os.path.exists(path):
+                return None
+            s = self._open[key] = _Series(path)
+        return s
+
+    def _drop(self, kind: str, name: str):
+        s = self._open.pop((kind, name), None)
+        if s is not None:
+            s.close()
+
+    def close(self):
+        for s in self._open.values():
+            s.close()
+        self._open.clear()
+
+    def write_series(self, kind: str, name: str, points, covered_from=None, covered_to=None):
+        """
+        Merge (date, value) points into a series and rewrite its file.
+        New points win over stored ones on the same day.
+        """
+        merged = {}
+        s = self._series(kind, name)
+        if s is not None:
+            merged.update(zip(s.days, s.values))
+            lo, hi = s.covered_from, s.covered_to
+        else:
+            lo = hi = None
+        for d, v in points:
+            merged[_day(d)] = float(v)
+
+        for bound in (covered_from, covered_to):
+            if bound is not None:
+                b = _day(bound)
+                lo = b if lo is None else min(lo, b)
+                hi = b if hi is None else max(hi, b)
+        if merged:
+            lo = min(merged) if lo is None else min(lo, min(merged))
+            hi = max(merged) if hi is None else max(hi, max(merged))
+
+        days = sorted(merged)
+        columns = [("days", array("i", days)), ("values", array("d", (merged[d] for d in days)))]
+        header = _HEADER.pack(_MAGIC, _VERSION, 0, lo or 0, hi or 0, len(_COLUMNS))
+
+        self._drop(kind, name)
+        write_columns(self._path(kind, name), header, columns)
+
+    # ---- lookups ----
+
+    def _on(self, kind: str, name: str, d) -> float:
+        s = self._series(kind, name)
+        if s is None or not len(s.days):
+            raise MarketDataError(f"No stored {kind} for {name}")
+        i = bisect_right(s.days, _day(d))
+        if i == 0:
+            raise MarketDataError(f"No stored {kind} for {name} on or before {d}")
+        return s.values[i - 1]
+
+    def price_on(self, symbol: str, d) -> float:
+        """
+        Close on d, or the last close before it.
+        """
+        return self._on("prices", symbol, d)
+
+    def fx_on(self, from_currency: str, to_currency: str, d) -> float:
+        """
+        Units of to_currency per 1 from_currency on d (last rate on/before).
+        """
+        from_currency, to_currency = from_currency.upper(), to_currency.upper()
+        if from_currency == to_currency:
+            return 1.0
+        return self._on("fx", from_currency + to_currency, d)
+
+    def splits(self, symbol: str, since=None) -> list[tuple[date, float]]:
+        s = self._series("splits", symbol)
+        if s is None:
+            return []
+        start = bisect_left(s.days, _day(since)) if since is not None else 0
+        return [(date.fromordinal(s.days[i]), s.values[i]) for i in range(start, len(s.days))]
+
+    def covered(self, kind: str, name: str) -> Optional[tuple[date, date]]:
+        s = self._series(kind, name)
+        if s is None or not s.covered_from:
+            return None
+        return date.fromordinal(s.covered_from), date.fromordinal(s.covered_to)
+
+    # ---- filling from the provider ----
+
+    def _gaps(self, kind: str, name: str, start, end) -> list[tuple[date, date]]:
+        lo, hi = _day(start), _day(end)
+        have = self.covered(kind, name)
+        if have is None:
+            return [(date.fromordinal(lo), date.fromordinal(hi))]
+        have_lo, have_hi = _day(have[0]), _day(have[1])
+        gaps = []
+        if lo < have_lo:
+            gaps.append((date.fromordinal(lo), date.fromordinal(have_lo - 1)))
+        if hi > have_hi:
+            gaps.append((date.fromordinal(have_hi + 1), date.fromordinal(hi)))
+        return gaps
+
+    def _fill(self, kind: str, name: str, yahoo_symbol: str, start, end) -> int:
+        provider = self.provider or get_provider()
+        fetched = 0
+        today = date.today()
+        for lo, hi in self._gaps(kind, name, start, end):
+            points = provider.history(yahoo_symbol, lo, hi)
+            if hi >= today:
+                # today's close (or yesterday's, until it's posted) can still
+                # arrive, so a range that reaches today is only covered up to
+                # the last close actually returned and is asked for again
+                days = [_day(d) for d, _ in points]
+                if not days:
+                    continue
+                hi = date.fromordinal(max(days))
+            self.write_series(kind, name, points, covered_from=lo, covered_to=hi)
+            fetched += len(points)
+        return fetched
+
+    def update_prices(self, symbol: str, start, end) -> int:
+        """
+        Make sure closes for start..end are stored. Returns points fetched.
+        """
+        return self._fill("prices", symbol, symbol, start, end)
+
+    def update_fx(self, from_currency: str, to_currency: str, start, end) -> int:
+        from_currency, to_currency = from_currency.upper(), to_currency.upper()
+        pair = fx_symbol(from_currency, to_currency)
+        return self._fill("fx", from_currency + to_currency, pair, start, end)
+
+    def update_splits(self, symbol: str) -> int:
+        """
+        Splits are a short list, so this just replaces what's stored.
+        """
+        provider = self.provider or get_provider()
+        splits = provider.split_data(symbol)
+        points = [(d, f) for d, f in splits.items()]
+        self._drop("splits", symbol)
+        path = self._path("splits", symbol)
+        if os.path.exists(path):
+            os.remove(path)
+        self.write_series("splits", symbol, points)
+        return len(points)
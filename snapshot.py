@@ -0,0 +1,230 @@
+# snapshot / restore of replayed positions in one memory-mappable file
+
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Iterable
+
+from column_file import StringTable, read_columns, string_at, write_columns
+from models import LotTable
+from positions import PER_LOT_FLOATS, Position
+
+
+# file layout, little endian: a column_file with the header
+#   magic(4) version(u16) pad(u16) columns(u32) pad(u32)
+#
+# Columns are the Position.to_state() columns of every position laid end
+# to end; the pos_*_end columns say where each position's slice stops.
+# Strings (symbols, lot ids) are codes into a deduplicated string table.
+_MAGIC = b"STKP"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHII")
+
+_COLUMNS = (
+    ("strings", "B"),      # utf-8 bytes of every string
+    ("string_ends", "q"),  # end offset of string i in "strings"
+    ("pos_symbol", "q"),
+    ("pos_head", "q"),
+    ("pos_qty_left", "d"),
+    ("pos_qty_stale", "q"),
+    ("pos_cost_left", "d"),
+    ("pos_split_end", "q"),
+    ("pos_lot_end", "q"),
+    ("pos_sale_end", "q"),
+    ("pos_row_end", "q"),
+    ("split_date_us", "q"),
+    ("split_factor", "d"),
+    ("lot_id", "q"),
+    ("lot_date_us", "q"),
+    *(("lot_" + name, "d") for name in LotTable.FLOAT_FIELDS),
+    ("sale_date_us", "q"),
+    ("sale_qty", "d"),
+    ("sale_proceeds", "d"),
+    ("sale_cost", "d"),
+    ("sale_gain", "d"),
+    ("sale_rows", "q"),
+    ("row_lot", "q"),
+    ("row_date", "q"),
+    *(("row " + key, "d") for key in PER_LOT_FLOATS),
+)
+
+# state columns sliced per position with the matching pos_*_end column
+_SLICES = {
+    "pos_split_end": ("split_date_us", "split_factor"),
+    "pos_lot_end": ("lot_id", "lot_date_us", *("lot_" + name for name in LotTable.FLOAT_FIELDS)),
+    "pos_sale_end": ("sale_date_us", "sale_qty", "sale_proceeds", "sale_cost", "sale_gain", "sale_rows"),
+    "pos_row_end": ("row_lot", "row_date", *("row " + key for key in PER_LOT_FLOATS)),
+}
+_STRING_COLUMNS = ("lot_id", "row_lot")
+
+
+def save_snapshot(path: str, positions: Iterable[Position]) -> int:
+    """
+    Write every position's lots, splits, sales and per-lot rows to path.
+    Returns the file size. Exact-mode positions aren't supported.
+    """
+    cols = {name: array(code) for name, code in _COLUMNS}
+    strings = StringTable()
+    code = strings.code
+
+    for pos in positions:
+        if not isinstance(pos, Position):
+            raise TypeError(f"{pos.symbol}: only Positions can be snapshotted, not {type(pos).__name__}")
+        state = pos.to_state()
+        cols["pos_symbol"].append(code(state["symbol"]))
+        cols["pos_head"].append(state["head"])
+        cols["pos_qty_left"].append(state["qty_left"])
+        cols["pos_qty_stale"].append(int(state["qty_stale"]))
+        cols["pos_cost_left"].append(state["cost_left"])
+
+        for end, names in _SLICES.items():
+            for name in names:
+                if name in _STRING_COLUMNS:
+                    cols[name].extend(map(code, state[name]))
+                else:
+                    cols[name].extend(state[name])
+            cols[end].append(len(cols[names[0]]))
+
+    cols["strings"], cols["string_ends"] = strings.columns()
+    header = _HEADER.pack(_MAGIC, _VERSION, 0, len(_COLUMNS), 0)
+    write_columns(path, header, [(name, cols[name]) for name, _ in _COLUMNS])
+    return os.path.getsize(path)
+
+
+class _Strings(Sequence):
+    """
+    Column of string codes, decoded from the string table when read.
+    """
+
+    __slots__ = ("snap", "codes")
+
+    def __init__(self, snap: "Snapshot", codes):
+        self.snap = snap
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.snap.string(c) for c in self.codes[i]]
+        return self.snap.string(self.codes[i])
+
+
+class Snapshot(Mapping):
+    """
+    A file written by save_snapshot(), memory-mapped. Opening it only
+    reads the header and the symbols; every column is a zero-copy view on
+    the file, and snap[symbol] rebuilds that one Position from its slices
+    (per-lot rows stay on the file until read, see PerLotRows).
+
+    Positions read from it keep views on the mapping, so close() only
+    unmaps once they're gone.
+    """
+
+    def __init__(self, path: str, compact: bool = False):
+        self.path = path
+        self.compact = compact
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, count, _ = _HEADER.unpack_from(self._mm)
+        if magic != _MAGIC or version != _VERSION or count != len(_COLUMNS):
+            self._mm.close()
+            raise ValueError(f"{path}: not a version {_VERSION} snapshot")
+
+        try:
+            self.columns = read_columns(self._mm, _HEADER.size, _COLUMNS)
+        except ValueError as e:
+            self._mm.close()
+            raise ValueError(f"{path}: {e}") from None
+
+        self._index = {
+            self.string(c): i for i, c in enumerate(self.columns["pos_symbol"])
+        }
+        self._built: dict[str, Position] = {}
+
+    def string(self, code: int) -> str:
+        return string_at(self.columns["strings"], self.columns["string_ends"], code)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __contains__(self, symbol):
+        return symbol in self._index
+
+    def state(self, symbol: str) -> dict:
+        """
+        Position.to_state() for one symbol, as views on the file.
+        """
+        i = self._index[symbol]
+        cols = self.columns
+        state = {
+            "symbol": symbol,
+            "head": cols["pos_head"][i],
+            "qty_left": cols["pos_qty_left"][i],
+            "qty_stale": bool(cols["pos_qty_stale"][i]),
+            "cost_left": cols["pos_cost_left"][i],
+        }
+        for end, names in _SLICES.items():
+            hi = cols[end][i]
+            lo = cols[end][i - 1] if i else 0
+            for name in names:
+                state[name] = cols[name][lo:hi]
+        for name in _STRING_COLUMNS:
+            state[name] = _Strings(self, state[name])
+        return state
+
+    def __getitem__(self, symbol: str) -> Position:
+        pos = self._built.get(symbol)
+        if pos is None:
+            pos = self._built[symbol] = Position.from_state(self.state(symbol), self.compact)
+        return pos
+
+    def close(self):
+        self._built.clear()
+        self._index.clear()
+        for col in self.columns.values():
+            col.release()
+        self.columns.clear()
+        try:
+            self._mm.close()
+        except BufferError:
+            # per-lot rows of a position still handed out point into the map;
+            # it's unmapped when they're collected
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _owned(state: dict) -> dict:
+    """
+    A Snapshot.state() with every column copied off the mapping.
+    """
+    out = {}
+    for name, value in state.items():
+        if isinstance(value, memoryview):
+            value = array(value.format, value)
+        elif isinstance(value, _Strings):
+            value = list(value)
+        out[name] = value
+    return out
+
+
+def load_snapshot(path: str, compact: bool = False) -> dict[str, Position]:
+    """
+    Every position in the snapshot, built up front. The columns are copied
+    out and the file is closed before returning; open a Snapshot instead to
+    keep them on the mapping and read positions lazily.
+    """
+    with Snapshot(path, compact) as snap:
+        return {symbol: Position.from_state(_owned(snap.state(symbol)), compact) for symbol in snap}
@@ -4,13 +4,24 @@ Simple Trading212 CSV Viewer (Tkinter) for testing purposes.
 
 """
 
+import os
+import queue
+import threading
 import tkinter as tk
+from collections.abc import Sequence
 from tkinter import ttk, filedialog, messagebox
-from datetime import datetime
+from datetime import datetime, timedelta
 
 
 
-from file_import import ingest_trading212_csv as ingest_trading212_csv
+from file_import import iter_trading212_csv
+from import_cache import ImportCache
+from trade_table import TradeTable
+
+
+LOAD_CHUNK = 20_000      # rows per progress update while loading
+POLL_MS = 50             # how often the UI picks up background results
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "t212_viewer")
 
 
 
@@ -47,6 +58,155 @@ def fmt_num(x, dp=6):
 def safe_str(x):
     return "" if x is None else str(x)
 
+def format_row(r: dict) -> list:
+    vals = []
+    for key, _ in COLUMNS:
+        v = r.get(key)
+
+        if key == "time":
+            vals.append(fmt_dt(v))
+        elif key in {"shares"}:
+            vals.append(fmt_num(v, dp=8))
+        elif key in {"price_per_share"}:
+            vals.append(fmt_num(v, dp=4))
+        elif key in {"exchange_rate"}:
+            vals.append(fmt_num(v, dp=8))
+        elif key in {"total"}:
+            vals.append(fmt_num(v, dp=2))
+        else:
+            vals.append(safe_str(v))
+    return vals
+
+
+class RowSubset(Sequence):
+    """
+    The rows at `positions`, without copying them out.
+    """
+
+    def __init__(self, rows, positions):
+        self.rows = rows
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.rows[j] for j in self.positions[i]]
+        return self.rows[self.positions[i]]
+
+
+def select(table: TradeTable, start: datetime | None = None, end: datetime | None = None, **equals):
+    """
+    Row positions matching every filter, in time order, and their stats.
+    equals: column=value for the table's category columns, None/"" = any.
+    Returns (None, stats of every row) when nothing is filtered.
+    """
+    eq = [(col, value) for col, value in equals.items() if value]
+    if not eq and start is None and end is None:
+        return None, table.stats()
+    if len(eq) == 1 and start is None and end is None:
+        return table.where(*eq[0]), table.bucket_stats(*eq[0])
+
+    # smallest bucket first, so each step walks as few rows as possible
+    eq.sort(key=lambda cv: len(getattr(table, cv[0]).posting(cv[1])))
+    idx = None
+    for col, value in eq:
+        idx = table.where(col, value, idx)
+    if start is not None or end is not None:
+        idx = table.between(start, end, idx)
+    return idx, table.stats(idx)
+
+
+class VirtualTable(ttk.Frame):
+    """
+    Treeview that only ever holds the rows on screen. `rows` can be any
+    sequence (a million dicts is fine); scrolling moves a window over it
+    and re-formats just the visible slots, so nothing is inserted, deleted
+    or formatted for rows that aren't shown.
+    """
+
+    def __init__(self, master, columns, **kw):
+        super().__init__(master, **kw)
+        self.rows = []
+        self.offset = 0
+        self.visible = 20
+        self._slots: list[str] = []
+
+        self.tree = ttk.Treeview(self, columns=[k for k, _ in columns], show="headings", height=self.visible)
+        self.vsb = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        hsb = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscrollcommand=hsb.set)
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.vsb.grid(row=0, column=1, sticky="ns")
+        hsb.grid(row=1, column=0, sticky="ew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll_by(-1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-1, "units"))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(1, "units"))
+        self.tree.bind("<Prior>", lambda e: self.scroll_by(-1, "pages"))
+        self.tree.bind("<Next>", lambda e: self.scroll_by(1, "pages"))
+        self.tree.bind("<Home>", lambda e: self.scroll_to(0))
+        self.tree.bind("<End>", lambda e: self.scroll_to(len(self.rows)))
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.offset = 0
+        self._render()
+
+    def _max_offset(self) -> int:
+        return max(0, len(self.rows) - self.visible)
+
+    def scroll_to(self, offset: int):
+        offset = min(max(0, int(offset)), self._max_offset())
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+        return "break"
+
+    def scroll_by(self, n: int, what: str = "units"):
+        step = 3 if what.startswith("unit") else max(1, self.visible - 1)
+        return self.scroll_to(self.offset + n * step)
+
+    def _on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.scroll_to(float(args[0]) * len(self.rows))
+        elif action == "scroll":
+            self.scroll_by(int(args[0]), args[1])
+
+    def _on_resize(self, event):
+        style = ttk.Style(self)
+        row_h = int(style.lookup("Treeview", "rowheight") or 20)
+        # heading row is about one row high
+        visible = max(1, event.height // row_h - 1)
+        if visible != self.visible:
+            self.visible = visible
+            self.offset = min(self.offset, self._max_offset())
+            self._render()
+
+    def _render(self):
+        rows = self.rows
+        want = max(0, min(self.visible, len(rows) - self.offset))
+
+        # keep exactly `want` items in the tree and rewrite their values
+        while len(self._slots) < want:
+            self._slots.append(self.tree.insert("", "end"))
+        while len(self._slots) > want:
+            self.tree.delete(self._slots.pop())
+
+        for k, iid in enumerate(self._slots):
+            self.tree.item(iid, values=format_row(rows[self.offset + k]))
+
+        n = len(rows)
+        if n:
+            self.vsb.set(self.offset / n, (self.offset + want) / n)
+        else:
+            self.vsb.set(0.0, 1.0)
+
 
 class App(tk.Tk):
     def __init__(self):
@@ -57,6 +217,15 @@ class App(tk.Tk):
         self.csv_path = tk.StringVar(value="")
         self.status = tk.StringVar(value="Pick a CSV to begin.")
         self.loaded_rows: list[dict] = []
+        self.index: TradeTable | None = None  # the rows as columns, for filtering
+        self.cache = ImportCache(CACHE_DIR)  # parsed exports, reused while unchanged
+
+        # background jobs post (job id, kind, payload) here; only the Tk
+        # thread touches widgets. A newer job makes older ones stop.
+        self._events: queue.Queue = queue.Queue()
+        self._job = 0
+        self._polling = False
+        self._loading = False  # filters wait until the load is done
 
         self._build_ui()
 
@@ -74,36 +243,31 @@ class App(tk.Tk):
         mid = ttk.Frame(self, padding=(10, 0, 10, 10))
         mid.pack(fill="x")
 
-        self.ticker_filter = tk.StringVar(value="")  # empty = all
-        ttk.Label(mid, text="Ticker filter (optional):").pack(side="left")
-        ttk.Entry(mid, textvariable=self.ticker_filter, width=12).pack(side="left", padx=8)
+        # every filter is optional, empty = all
+        self.ticker_filter = tk.StringVar(value="")
+        self.type_filter = tk.StringVar(value="")
+        self.isin_filter = tk.StringVar(value="")
+        self.date_from = tk.StringVar(value="")
+        self.date_to = tk.StringVar(value="")
+
+        ttk.Label(mid, text="Ticker:").pack(side="left")
+        ttk.Entry(mid, textvariable=self.ticker_filter, width=10).pack(side="left", padx=(4, 8))
+        ttk.Label(mid, text="Type:").pack(side="left")
+        ttk.Combobox(mid, textvariable=self.type_filter, values=["", "BUY", "SELL"], width=6, state="readonly").pack(side="left", padx=(4, 8))
+        ttk.Label(mid, text="ISIN:").pack(side="left")
+        ttk.Entry(mid, textvariable=self.isin_filter, width=14).pack(side="left", padx=(4, 8))
+        ttk.Label(mid, text="From / To (YYYY-MM-DD):").pack(side="left")
+        ttk.Entry(mid, textvariable=self.date_from, width=11).pack(side="left", padx=(4, 2))
+        ttk.Entry(mid, textvariable=self.date_to, width=11).pack(side="left", padx=(2, 8))
         ttk.Button(mid, text="Apply Filter", command=self.apply_filter).pack(side="left")
 
         self.stats_label = ttk.Label(mid, text="")
         self.stats_label.pack(side="left", padx=16)
 
-        # Table (Treeview)
-        table_frame = ttk.Frame(self, padding=10)
-        table_frame.pack(fill="both", expand=True)
-
-        self.tree = ttk.Treeview(
-            table_frame,
-            columns=[k for k, _ in COLUMNS],
-            show="headings",
-            height=20
-        )
-
-        # Scrollbars
-        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
-        hsb = ttk.Scrollbar(table_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-
-        self.tree.grid(row=0, column=0, sticky="nsew")
-        vsb.grid(row=0, column=1, sticky="ns")
-        hsb.grid(row=1, column=0, sticky="ew")
-
-        table_frame.grid_rowconfigure(0, weight=1)
-        table_frame.grid_columnconfigure(0, weight=1)
+        # Table (only the visible rows are ever in the Treeview)
+        self.table = VirtualTable(self, COLUMNS, padding=10)
+        self.table.pack(fill="both", expand=True)
+        self.tree = self.table.tree
 
         # Setup headings and default column widths
         for key, title in COLUMNS:
@@ -122,6 +286,8 @@ class App(tk.Tk):
         bottom = ttk.Frame(self, padding=10)
         bottom.pack(fill="x")
         ttk.Label(bottom, textvariable=self.status).pack(side="left")
+        self.progress = ttk.Progressbar(bottom, length=200, mode="determinate")
+        self.progress.pack(side="right")
 
     def browse_file(self):
         path = filedialog.askopenfilename(
@@ -131,74 +297,154 @@ class App(tk.Tk):
         if path:
             self.csv_path.set(path)
 
+    # ---- background jobs ----
+
+    def _start_job(self, target, *args) -> int:
+        self._job += 1
+        job = self._job
+        threading.Thread(target=target, args=(job, *args), daemon=True).start()
+        if not self._polling:
+            self._polling = True
+            self.after(POLL_MS, self._poll)
+        return job
+
+    def _post(self, job, kind, payload=None):
+        self._events.put((job, kind, payload))
+
+    def _poll(self):
+        running = True
+        try:
+            while True:
+                job, kind, payload = self._events.get_nowait()
+                if job != self._job:
+                    continue  # superseded
+                if kind != "progress":
+                    self._loading = False
+                if kind == "progress":
+                    text, fraction = payload
+                    self.status.set(text)
+                    if fraction is None:
+                        self.progress.configure(mode="indeterminate")
+                        self.progress.step(5)
+                    else:
+                        self.progress.configure(mode="determinate", value=fraction * 100)
+                elif kind == "error":
+                    running = False
+                    self.progress.configure(mode="determinate", value=0)
+                    messagebox.showerror("Failed", payload)
+                else:
+                    running = False
+                    self.progress.configure(mode="determinate", value=100)
+                    getattr(self, "_on_" + kind)(payload)
+        except queue.Empty:
+            pass
+
+        if running:
+            self.after(POLL_MS, self._poll)
+        else:
+            self._polling = False
+
+    # ---- loading ----
+
     def load_file(self):
         path = self.csv_path.get().strip()
         if not path:
             messagebox.showwarning("No file", "Please select a CSV file first.")
             return
 
+        self.status.set(f"Loading {path}…")
+        self._loading = True
+        self._start_job(self._load_worker, path)
+
+    def _load_worker(self, job, path):
+        rows: list[dict] = []
+        hits = self.cache.stats.hits
         try:
-            rows = ingest_trading212_csv(path)
+            for chunk in iter_trading212_csv(path, chunk_size=LOAD_CHUNK, sort=True, cache=self.cache):
+                if job != self._job:
+                    return
+                rows.extend(chunk)
+                self._post(job, "progress", (f"Loading… {len(rows):,} rows", None))
+            self._post(job, "progress", (f"Indexing {len(rows):,} rows…", None))
+            index = TradeTable.from_rows(rows, upper=True)
         except Exception as e:
-            messagebox.showerror("Load failed", str(e))
+            # anything not posted leaves the UI waiting on this job forever
+            self._post(job, "error", f"Load failed: {e}")
             return
+        self._post(job, "loaded", (rows, index, self.cache.stats.hits > hits))
 
+    def _on_loaded(self, payload):
+        rows, index, cached = payload
         self.loaded_rows = rows
-        self.status.set(f"Loaded {len(rows)} trade rows (Market/Limit buys & sells).")
-        self._update_stats(rows)
-        self._populate_table(rows[:5000])  # preview first 500 to keep UI snappy
+        self.index = index
+        self.status.set(
+            f"Loaded {len(rows):,} trade rows (Market/Limit buys & sells)"
+            + (" from cache." if cached else ".")
+        )
+        self._show_stats(index.stats())
+        self.table.set_rows(rows)
+
+    # ---- filtering ----
 
     def apply_filter(self):
-        if not self.loaded_rows:
+        if self.index is None:
+            return
+        if self._loading:
+            # a new job would cancel the load
+            self.bell()
             return
 
-        t = self.ticker_filter.get().strip().upper()
-        if not t:
-            filtered = self.loaded_rows
-        else:
-            filtered = [r for r in self.loaded_rows if (r.get("ticker") or "").upper() == t]
+        date_from, date_to = self.date_from.get().strip(), self.date_to.get().strip()
+        try:
+            start = _parse_day(date_from)
+            end = _parse_day(date_to)
+        except ValueError:
+            messagebox.showwarning("Bad date", "Dates must look like 2024-01-31.")
+            return
+        if end is not None:
+            end += timedelta(days=1)  # "to" includes that whole day
+
+        filters = {
+            "ticker": self.ticker_filter.get().strip(),
+            "action_type": self.type_filter.get().strip(),
+            "isin": self.isin_filter.get().strip(),
+        }
+        # built here: the worker mustn't read the Tk variables
+        label = ", ".join(v.upper() for v in filters.values() if v)
+        if start or end:
+            label += (", " if label else "") + f"{date_from or '…'} to {date_to or '…'}"
+        self._start_job(self._filter_worker, self.index, self.loaded_rows, filters, start, end, label)
+
+    def _filter_worker(self, job, index, rows, filters, start, end, label):
+        try:
+            positions, stats = select(index, start, end, **filters)
+        except Exception as e:
+            self._post(job, "error", f"Filter failed: {e}")
+            return
+        view = rows if positions is None else RowSubset(rows, positions)
+        self._post(job, "filtered", (view, stats, label))
 
-        self._update_stats(filtered)
-        self._populate_table(filtered[:500])
+    def _on_filtered(self, payload):
+        view, stats, label = payload
+        self._show_stats(stats)
+        self.table.set_rows(view)
         self.status.set(
-            f"Showing {min(500, len(filtered))} of {len(filtered)} rows"
-            + (f" (filtered: {t})" if t else "")
+            f"Showing {len(view):,} rows"
+            + (f" (filtered: {label})" if label else "")
         )
 
-    def _populate_table(self, rows: list[dict]):
-        # clear
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        for r in rows:
-            vals = []
-            for key, _ in COLUMNS:
-                v = r.get(key)
-
-                if key == "time":
-                    vals.append(fmt_dt(v))
-                elif key in {"shares"}:
-                    vals.append(fmt_num(v, dp=8))
-                elif key in {"price_per_share"}:
-                    vals.append(fmt_num(v, dp=4))
-                elif key in {"exchange_rate"}:
-                    vals.append(fmt_num(v, dp=8))
-                elif key in {"total"}:
-                    vals.append(fmt_num(v, dp=2))
-                else:
-                    vals.append(safe_str(v))
-
-            self.tree.insert("", "end", values=vals)
-
-    def _update_stats(self, rows: list[dict]):
-        buys = sum(1 for r in rows if r.get("action_type") == "BUY")
-        sells = sum(1 for r in rows if r.get("action_type") == "SELL")
-        tickers = sorted({(r.get("ticker") or "").upper() for r in rows if r.get("ticker")})
+    def _show_stats(self, stats):
+        rows, buys, sells, tickers = stats
         self.stats_label.config(
-            text=f"Rows: {len(rows)} | Buys: {buys} | Sells: {sells} | Tickers: {len(tickers)}"
+            text=f"Rows: {rows} | Buys: {buys} | Sells: {sells} | Tickers: {tickers}"
         )
 
 
+def _parse_day(text: str) -> datetime | None:
+    text = text.strip()
+    return datetime.strptime(text, "%Y-%m-%d") if text else None
+
+
 if __name__ == "__main__":
     app = App()
     app.mainloop()
@@ -0,0 +1,248 @@
+# columnar storage for ingested Trading212 rows
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from math import isnan
+from typing import Iterable, Optional
+
+
+_EPOCH = datetime(1970, 1, 1)
+_NAN = float("nan")
+
+
+def to_epoch(dt: datetime) -> int:
+    """
+    Naive (UTC, as exported by Trading212) datetime -> whole epoch seconds.
+    """
+    return (dt - _EPOCH) // timedelta(seconds=1)
+
+
+def from_epoch(ts: int) -> datetime:
+    return _EPOCH + timedelta(seconds=ts)
+
+
+class Categorical:
+    """
+    Dictionary-encoded string column: one int code per row plus the list of
+    distinct values. None is stored like any other value. postings[code]
+    holds the ascending row indices with that value, so an equality lookup
+    reads its bucket instead of scanning every row.
+
+    upper=True stores strings upper-cased and looks values up the same
+    way, for case-insensitive matching.
+    """
+
+    __slots__ = ("codes", "values", "postings", "upper", "_lookup")
+
+    def __init__(self, upper: bool = False):
+        self.codes = array("i")
+        self.values: list = []
+        self.postings: list = []
+        self.upper = upper
+        self._lookup: dict = {}
+
+    def append(self, value):
+        if self.upper and value:
+            value = value.upper()
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.postings.append(array("q"))
+            self._lookup[value] = code
+        self.postings[code].append(len(self.codes))
+        self.codes.append(code)
+
+    def code_of(self, value) -> Optional[int]:
+        if self.upper and value:
+            value = value.upper()
+        return self._lookup.get(value)
+
+    def posting(self, value) -> array:
+        """
+        Ascending row indices holding value (empty if there are none).
+        """
+        code = self.code_of(value)
+        return self.postings[code] if code is not None else array("q")
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[c] for c in self.codes)
+
+
+class TradeTable:
+    """
+    Struct-of-arrays version of ingest_trading212_csv output.
+
+    Numbers live in array('d') with NaN for missing, time in array('q') as
+    epoch seconds, ticker / isin / action_type are Categorical. The arrays
+    expose the buffer protocol so numpy.frombuffer(table.shares) is a
+    zero-copy view when numpy is around.
+
+    Row indices come back as array('q'). While rows are appended in time
+    order (ingest_trading212_columns sorts them) between() bisects the
+    time column; otherwise it scans. upper=True makes the categories
+    case-insensitive (see Categorical).
+    """
+
+    FLOAT_COLUMNS = ("shares", "price_per_share", "exchange_rate", "total")
+    CATEGORY_COLUMNS = ("ticker", "isin", "action_type")
+
+    def __init__(self, upper: bool = False):
+        self.time = array("q")
+        self.shares = array("d")
+        self.price_per_share = array("d")
+        self.exchange_rate = array("d")
+        self.total = array("d")
+
+        self.ticker = Categorical(upper)
+        self.isin = Categorical(upper)
+        self.action_type = Categorical(upper)
+        self.time_sorted = True
+        self._bucket_stats: dict = {}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict], upper: bool = False) -> "TradeTable":
+        table = cls(upper)
+        for r in rows:
+            table.append_row(r)
+        return table
+
+    def _append_time(self, ts: int):
+        if self.time and ts < self.time[-1]:
+            self.time_sorted = False
+        self.time.append(ts)
+
+    def append_row(self, row: dict):
+        self._bucket_stats.clear()
+        self._append_time(to_epoch(row["time"]))
+        for key in self.FLOAT_COLUMNS:
+            v = row.get(key)
+            getattr(self, key).append(_NAN if v is None else v)
+        for key in self.CATEGORY_COLUMNS:
+            getattr(self, key).append(row.get(key))
+
+    def __len__(self):
+        return len(self.time)
+
+    def row(self, i: int) -> dict:
+        """
+        Row i back as a dict with the same keys/types as the row ingestion.
+        """
+        out = {"time": from_epoch(self.time[i])}
+        for key in self.FLOAT_COLUMNS:
+            v = getattr(self, key)[i]
+            out[key] = None if isnan(v) else v
+        for key in self.CATEGORY_COLUMNS:
+            out[key] = getattr(self, key)[i]
+        return out
+
+    # ---- filtering / aggregation ----
+
+    def where(self, column: str, value, idx: Optional[Iterable[int]] = None) -> array:
+        """
+        Row indices where a categorical column equals value, read from the
+        value's posting list. Pass idx to narrow an earlier result; the
+        smaller of the two is the one walked.
+        """
+        col: Categorical = getattr(self, column)
+        posting = col.posting(value)
+        if idx is None or not posting:
+            return array("q", posting)
+        if not isinstance(idx, (array, list, range)):
+            idx = array("q", idx)
+        if len(idx) <= len(posting):
+            codes, code = col.codes, col.code_of(value)
+            return array("q", (i for i in idx if codes[i] == code))
+        keep = set(idx)
+        return array("q", (i for i in posting if i in keep))
+
+    def between(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                idx: Optional[Iterable[int]] = None) -> array:
+        """
+        Row indices with start <= time < end (either side optional).
+        """
+        lo = to_epoch(start) if start is not None else None
+        hi = to_epoch(end) if end is not None else None
+        times = self.time
+        if self.time_sorted:
+            first = bisect_left(times, lo) if lo is not None else 0
+            last = bisect_left(times, hi) if hi is not None else len(times)
+            if idx is None:
+                return array("q", range(first, last))
+            return array("q", (i for i in idx if first <= i < last))
+
+        rows = range(len(times)) if idx is None else idx
+        return array("q", (
+            i for i in rows
+            if (lo is None or times[i] >= lo) and (hi is None or times[i] < hi)
+        ))
+
+    def stats(self, idx: Optional[Iterable[int]] = None) -> tuple[int, int, int, int]:
+        """
+        (rows, buys, sells, distinct tickers) over idx, all rows if None.
+        Blank tickers aren't counted.
+        """
+        actions, tickers = self.action_type, self.ticker
+        blank = {tickers.code_of(None), tickers.code_of("")}
+        if idx is None:
+            distinct = len(tickers.values) - len(blank - {None})
+            return len(self), len(actions.posting("BUY")), len(actions.posting("SELL")), distinct
+
+        acts = [actions.codes[i] for i in idx]
+        distinct = {tickers.codes[i] for i in idx} - blank
+        buy, sell = actions.code_of("BUY"), actions.code_of("SELL")
+        return len(acts), acts.count(buy), acts.count(sell), len(distinct)
+
+    def bucket_stats(self, column: str, value) -> tuple[int, int, int, int]:
+        """
+        stats() of the rows where a categorical column equals value, kept
+        until the next append.
+        """
+        key = (column, getattr(self, column).code_of(value))
+        out = self._bucket_stats.get(key)
+        if out is None:
+            out = self._bucket_stats[key] = self.stats(self.where(column, value))
+        return out
+
+    def sum(self, column: str, idx: Optional[Iterable[int]] = None) -> float:
+        """
+        Sum of a float column over idx (all rows if None), skipping NaN.
+        """
+        col = getattr(self, column)
+        values = col if idx is None else (col[i] for i in idx)
+        return sum(v for v in values if v == v)
+
+    def take(self, idx: Iterable[int]) -> "TradeTable":
+        """
+        New table holding only the given rows. Categories are re-encoded.
+        """
+        out = TradeTable(self.ticker.upper)
+        for i in idx:
+            out._append_time(self.time[i])
+            for key in self.FLOAT_COLUMNS:
+                getattr(out, key).append(getattr(self, key)[i])
+            for key in self.CATEGORY_COLUMNS:
+                getattr(out, key).append(getattr(self, key)[i])
+        return out
+
+    def nbytes(self) -> int:
+        """
+        Approximate payload size of the arrays (excludes the category strings).
+        """
+        n = self.time.itemsize * len(self.time)
+        for key in self.FLOAT_COLUMNS:
+            col = getattr(self, key)
+            n += col.itemsize * len(col)
+        for key in self.CATEGORY_COLUMNS:
+            col = getattr(self, key)
+            n += col.codes.itemsize * len(col.codes)
+            n += sum(p.itemsize * len(p) for p in col.postings)
+        return n